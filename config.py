@@ -23,6 +23,11 @@ CONFIG = {
     'accum steps': 1, 
     # whether or not to use the GPU
     'cuda': True,
+    # confusion matrices are rendered in a background process, on every Nth epoch (0 for never) and, with
+    # 'figures on improvement', on every epoch the validation loss improves. The budget caps figures per epoch
+    'figure every': 1,
+    'figures on improvement': True,
+    'figure budget': None,
     # instance of loss function to be used in training
     #'loss function': nn.SmoothL1Loss(),
     # 'loss function': nn.KLDivLoss(reduction='batchmean'),  # Using KLDivLoss
@@ -54,6 +59,9 @@ CONFIG = {
     'dataset name': 'FROSI downscaled',
     # path to the folder containing the images
     'dataset path': '/home/feet/Documents/LAWN/datasets/FROSI',
+    # folder where the training set mean/std are cached, keyed by the training file list and preprocessing settings.
+    # None to recompute them every run
+    'stats cache dir': 'stats_cache',
     # whether or not to apply random augmentation to images to effectively increase size of the training set
     'augment': False,
     # make each batch have an even number of each class. Ignore this
@@ -1 +1 @@
-from . import FCS, Jacobs, SSF, Webcams, FROSI
\ No newline at end of file
+from . import FCS, Jacobs, SSF, Webcams, FROSI, stats
\ No newline at end of file
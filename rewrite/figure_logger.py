@@ -0,0 +1,14 @@
+import os
+import sys
+import importlib.util
+
+# The FigureLogger is shared with rewrite2, this loads rewrite2/figure_logger.py in its place so
+# both trees run the same renderer instead of keeping a copy each.
+
+_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rewrite2', 'figure_logger.py')
+_spec = importlib.util.spec_from_file_location(__name__, os.path.normpath(_path))
+_module = importlib.util.module_from_spec(_spec)
+sys.modules[__name__] = _module
+_spec.loader.exec_module(_module)
+
+FigureLogger = _module.FigureLogger
@@ -19,6 +19,8 @@ import matplotlib.pyplot as plt
 from copy import deepcopy
 import image_processing as ip
 from torchvision.utils import save_image
+from torch.utils.tensorboard.writer import SummaryWriter
+from figure_logger import FigureLogger
 
 spec = importlib.util.spec_from_file_location("config", os.path.join(os.getcwd(), 'config.py'))
 config = importlib.util.module_from_spec(spec)
@@ -26,6 +28,11 @@ sys.modules["config"] = config
 spec.loader.exec_module(config)
 CONFIG = config.CONFIG
 
+writer = SummaryWriter()
+#started before the datasets and CUDA so the renderer forks from a small process
+figures = FigureLogger(writer.get_logdir(), CONFIG.get('figure every', 1), CONFIG.get('figures on improvement', True),
+                       CONFIG.get('figure budget'))
+
 print('Preparing dataset...')
 transformer = lambda x, agmnt: ip.resize_crop(x, CONFIG['dimensions'], agmnt)   #Function that processes images for use in a model
 if hasattr(CONFIG['model module'], 'get_tf_function'):  #Use model's custom transformer if it has one 
@@ -62,30 +69,14 @@ train_set = CONFIG['dataset'](train_files, transformer, augment=CONFIG['augment'
 val_set = CONFIG['dataset'](val_files, transformer)
 test_set = CONFIG['dataset'](test_files, transformer)
 
-print('Calculating mean...')
-sample = train_set.__getitem__(0)[0]
-mean = torch.zeros(sample.size(), dtype=torch.float32)
-
-train_loader = DataLoader(train_set, 32, False, num_workers=4)
-
-bar = Bar()
-bar.max = len(train_loader)
-
-for i, (data, labels) in enumerate(train_loader):
-    mean += torch.div(torch.mean(data, 0) * 64, train_set.__len__())
-    bar.next()
-
-print('\nCalculating std...')
-bar = Bar()
-bar.max = len(train_loader)
-
-square_dif = torch.zeros(sample.size(), dtype=torch.float32)
-    
-for i, (data, labels) in enumerate(train_loader):
-    square_dif += torch.div(torch.sum(torch.square(data - mean), dim=0), (train_set.__len__()-1))
-    bar.next()
-
-std = torch.sqrt(square_dif).apply_(lambda x: 1.0 if x == 0.0 else x)
+print('Calculating mean and std...')
+stats_settings = {
+    'dataset': CONFIG['dataset'].__name__,
+    'model module': CONFIG['model module'].__name__,
+    'dimensions': CONFIG['dimensions'],
+    'augment': CONFIG['augment']
+}
+mean, std = dsets.stats.load_or_compute(train_set, CONFIG.get('stats cache dir', 'stats_cache'), stats_settings, 32, 4)
 
 # std = torch.ones(sample.size(), dtype=torch.float32)
 
@@ -112,7 +103,9 @@ params = {
     'model_name': CONFIG['model module'].__name__,
     'split': CONFIG['split'],
     'dset_name': CONFIG['dataset name'],
-    'image_dim': CONFIG['dimensions']
+    'image_dim': CONFIG['dimensions'],
+    'writer': writer,
+    'figures': figures
 }
 
 if CONFIG['classes'] > 1:
@@ -0,0 +1,92 @@
+import math
+import torch
+
+# Running metrics for the train/val loops. Each update is a handful of tensor ops on the
+# batch (one bincount for the confusion matrix) and everything stays on the batch's device
+# until the epoch's numbers are read, instead of growing prediction lists with torch.cat.
+
+class ClsMetrics:
+    def __init__(self, num_classes):
+        self.num_classes = num_classes
+        self.counts = None
+
+    def update(self, output, labels):
+        #output is [B, K] scores, labels [B, K] one hot or probabilities. Returns the
+        #predicted and true class indices of the batch
+        preds = output.detach().argmax(1)
+        targs = labels.detach().argmax(1)
+
+        counts = torch.bincount(targs * self.num_classes + preds, minlength=self.num_classes**2)
+        self.counts = counts if self.counts is None else self.counts + counts
+
+        return preds, targs
+
+    def confmat(self, normalize=None):
+        #rows are true classes, columns predicted, like multiclass_confusion_matrix.
+        #normalize='true' divides every row by its class count
+        if self.counts is None:
+            confmat = torch.zeros((self.num_classes, self.num_classes), dtype=torch.int64)
+        else:
+            confmat = self.counts.view(self.num_classes, self.num_classes).cpu()
+
+        if normalize == 'true':
+            confmat = confmat / confmat.sum(1, keepdim=True)
+            confmat = torch.nan_to_num(confmat, 0.0)
+        return confmat
+
+    def class_counts(self):
+        return self.confmat().sum(1)
+
+    def pred_counts(self):
+        return self.confmat().sum(0)
+
+    def total(self):
+        return self.confmat().sum().item()
+
+    def correct(self):
+        return self.confmat().trace().item()
+
+    def accuracy(self):
+        total = self.total()
+        return self.correct() / total if total > 0 else 0.0
+
+class RegMetrics:
+    def __init__(self):
+        #float64 sums so the R² from sum of squares doesn't lose precision over an epoch
+        self.sums = None
+
+    def update(self, output, labels):
+        output = output.detach().double().reshape(labels.shape)
+        labels = labels.detach().double()
+        error = output - labels
+
+        sums = torch.stack((torch.tensor(float(labels.numel()), dtype=torch.float64, device=labels.device),
+                            error.abs().sum(), error.square().sum(), labels.sum(), labels.square().sum()))
+        self.sums = sums if self.sums is None else self.sums + sums
+
+    def _values(self):
+        if self.sums is None:
+            return [0.0] * 5
+        return self.sums.tolist()
+
+    def total(self):
+        return int(self._values()[0])
+
+    def mae(self):
+        n, abs_err = self._values()[:2]
+        return abs_err / n if n > 0 else 0.0
+
+    def mse(self):
+        n, _, sq_err = self._values()[:3]
+        return sq_err / n if n > 0 else 0.0
+
+    def rmse(self):
+        return math.sqrt(self.mse())
+
+    def r2(self):
+        #1 - SSE / SST, with SST from the running sums of the targets
+        n, _, sq_err, label_sum, label_sq_sum = self._values()
+        if n == 0:
+            return 0.0
+        total_sq = label_sq_sum - label_sum**2 / n
+        return 1.0 - sq_err / total_sq if total_sq > 0 else 0.0
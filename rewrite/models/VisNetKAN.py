@@ -2,6 +2,7 @@ import matplotlib.pyplot
 import torch
 import torch.nn as nn
 import image_processing as ip
+from models.filter_bank import highpass
 import matplotlib
 import math
 import torchvision.transforms as tf
@@ -244,43 +245,6 @@ def create_and_save(img_dim, num_classes, num_channels):
     m = torch.jit.script(net)
     m.save('VisNet-' + str(num_channels) + 'x' + str(img_dim[1]) + 'x' + str(img_dim[0]) + '-' + str(num_classes) + '.pt')
 
-@functools.cache
-def highpass_mask(mask_radius, dim):
-    mask = torch.ones(dim, dtype=torch.float32)
-    mask_radius = np.multiply(dim, mask_radius)
-    center = ((dim[0]-1)/2, (dim[1]-1)/2)
-    center_tl = np.subtract(np.floor(center), mask_radius).astype(int)
-    center_br = np.add(np.ceil(center), mask_radius).astype(int)
-    
-    for h in range(center_tl[0], center_br[0]):
-        for w in range(center_tl[1], center_br[1]):
-            h_dist = abs(h-center[0]) / mask_radius[0]
-            w_dist = abs(w-center[1]) / mask_radius[1]
-            distance = math.sqrt(h_dist**2 + w_dist**2)
-            distance = min(1.0, distance)
-            mask[h][w] = distance**8
-    
-    return mask
-    
-
-def highpass_filter(img, mask_radius=0.1):
-    orig_dim = (img.size(0), img.size(1))
-    fft = torch.fft.fft2(img)
-    fft = torch.fft.fftshift(fft)
-
-    mask = highpass_mask(mask_radius, fft.shape)
-
-    fft = fft*mask
-    
-    fft = torch.fft.ifftshift(fft)    
-    fft = torch.fft.ifft2(fft, orig_dim)
-    fft = fft.type(torch.float32)
-    
-    
-    fft = torch.clamp(fft, 0.0, 1.0)
-    
-    return fft
-
 def satmap(orig):
     img = orig.permute(1,2,0).contiguous()
     
@@ -318,7 +282,7 @@ def get_tf_function(dim):
         # plt.show()
         # img[1] = torch.zeros(img[0].shape, dtype=torch.float32)
         
-        img[2][2] = highpass_filter(img[2][2], 0.05)
+        img[2][2] = highpass(img[2][2], 0.05, power=8)
         img[2] = torch.from_numpy(PC_CMAP(img[2][2])).permute((2,0,1))[:3,:,:]
         # img[2] = highpass_filter(img[2][2], 0.05)
         
@@ -0,0 +1,91 @@
+import functools
+import math
+import torch
+
+# Radial FFT masks and filtering shared by the VisNet style models. Masks are built with
+# meshgrid math instead of a per pixel loop and cached per (shape, radius, dtype, device).
+# Filtering uses rfft2/irfft2 on whole [..., H, W] batches.
+
+@functools.lru_cache(maxsize=64)
+def highpass_mask(mask_radius, dim, power=6, dtype=torch.float32, device=torch.device('cpu')):
+    #centered (fftshifted) mask, same values the old double loop produced
+    dim = (int(dim[0]), int(dim[1]))
+    radius = (dim[0] * mask_radius, dim[1] * mask_radius)
+    center = ((dim[0]-1)/2, (dim[1]-1)/2)
+    center_tl = (int(math.floor(center[0]) - radius[0]), int(math.floor(center[1]) - radius[1]))
+    center_br = (int(math.ceil(center[0]) + radius[0]), int(math.ceil(center[1]) + radius[1]))
+
+    h, w = torch.meshgrid(torch.arange(dim[0], dtype=torch.float64),
+                          torch.arange(dim[1], dtype=torch.float64), indexing='ij')
+
+    in_box = (h >= center_tl[0]) & (h < center_br[0]) & (w >= center_tl[1]) & (w < center_br[1])
+    if not in_box.any():
+        return torch.ones(dim, dtype=dtype, device=device)
+
+    distance = torch.sqrt(((h - center[0]) / radius[0])**2 + ((w - center[1]) / radius[1])**2)
+    distance = torch.clamp(distance, max=1.0)**power
+    mask = torch.where(in_box, distance, torch.ones_like(distance))
+
+    return mask.to(dtype=dtype, device=device)
+
+@functools.lru_cache(maxsize=64)
+def lowpass_mask(mask_radius, dim, power=6, dtype=torch.float32, device=torch.device('cpu')):
+    return (highpass_mask(mask_radius, dim, power, dtype, device) - 1.0) * -1.0
+
+@functools.lru_cache(maxsize=64)
+def bandpass_mask(mask_radii, dim, power=6, dtype=torch.float32, device=torch.device('cpu')):
+    mask = highpass_mask(mask_radii[0], dim, power, dtype, device) + lowpass_mask(mask_radii[1], dim, power, dtype, device)
+    return (mask - 1.0) * -1.0
+
+@functools.lru_cache(maxsize=64)
+def half_spectrum_mask(kind, radii, dim, power=6, dtype=torch.float32, device=torch.device('cpu')):
+    #mask in unshifted layout, cut to the rfft2 half spectrum. The centered masks aren't exactly
+    #symmetric around the zero frequency for even sizes, and the old code kept fft.real, which is
+    #the same as filtering with the mask averaged with its mirror, so that is what is stored here
+    if kind == 'high':
+        mask = highpass_mask(radii, dim, power, torch.float64)
+    elif kind == 'low':
+        mask = lowpass_mask(radii, dim, power, torch.float64)
+    elif kind == 'band':
+        mask = bandpass_mask(radii, dim, power, torch.float64)
+    else:
+        raise ValueError(f'Unknown mask kind {kind}')
+
+    mask = torch.fft.ifftshift(mask)
+    mirrored = torch.roll(torch.flip(mask, (0, 1)), (1, 1), (0, 1))
+    mask = (mask + mirrored) / 2
+
+    return mask[:, :dim[1]//2 + 1].to(dtype=dtype, device=device).contiguous()
+
+def pass_filter(img, mask):
+    #filters [..., H, W] with a centered full size mask, kept for masks built by hand
+    fft = torch.fft.fftshift(torch.fft.fft2(img), dim=(-2, -1))
+    fft = torch.fft.ifftshift(fft*mask, dim=(-2, -1))
+    fft = torch.fft.ifft2(fft, img.shape[-2:]).real.type(torch.float32)
+
+    return torch.clamp(fft, 0.0, 1.0)
+
+def _filter(img, kinds, radii, power):
+    dim = tuple(img.shape[-2:])
+    img = img.float()
+    masks = torch.stack([half_spectrum_mask(kind, r, dim, power, img.dtype, img.device) for kind, r in zip(kinds, radii)])
+
+    fft = torch.fft.rfft2(img).unsqueeze(-3)
+    out = torch.fft.irfft2(fft*masks, dim)
+
+    return torch.clamp(out, 0.0, 1.0)
+
+def highpass(img, mask_radius, power=6):
+    #[..., H, W] -> [..., H, W]
+    return _filter(img, ('high',), (mask_radius,), power).squeeze(-3)
+
+def lowpass(img, mask_radius, power=6):
+    return _filter(img, ('low',), (mask_radius,), power).squeeze(-3)
+
+def filter_bank(img, pass_points, power=6):
+    #one rfft2 for the low, band and high outputs. pass_points is (highpass radius, lowpass radius),
+    #same as the pass_points tuples in the model transforms. [..., H, W] -> 3 x [..., H, W]
+    pass_points = tuple(pass_points)
+    out = _filter(img, ('low', 'band', 'high'), (pass_points[1], pass_points, pass_points[0]), power)
+
+    return out.unbind(-3)
@@ -4,12 +4,9 @@ from torch.utils.data import Dataset, DataLoader
 from progress.bar import Bar
 from torch.utils.tensorboard.writer import SummaryWriter
 import torch.nn.functional as f
-from torcheval.metrics.functional import r2_score, multiclass_confusion_matrix
-import math
+from metrics import ClsMetrics, RegMetrics
+from figure_logger import FigureLogger
 from os import path
-import matplotlib.pyplot as plt
-# from matplotlib.figure import Figure
-import seaborn as sn
 import pandas as pd
 from itertools import cycle
 from torchvision.utils import save_image
@@ -17,8 +14,7 @@ import os
 import csv
 
 def train_cls(train_set: Dataset, val_set: Dataset, test_set: Dataset, model: nn.Module, params):
-    writer = SummaryWriter()
-    sn.set_theme(font_scale=0.4)
+    writer, figures = _logs(params)
 
     subbatch_size = params['subbatch_size']
     accum_steps = params['accum_steps']
@@ -67,20 +63,14 @@ def train_cls(train_set: Dataset, val_set: Dataset, test_set: Dataset, model: nn
         bar = Bar()
         bar.max = len(train_loader)
 
-        correct = 0
-        total = 0
+        metrics = ClsMetrics(num_classes)
         running_loss = 0.0
 
-        pred_indices = None
-        targ_indices = None
-        
         for step, (data, labels) in enumerate(train_loader):
             if use_cuda:
                 data = data.cuda()
                 labels = labels.cuda()
 
-            total += labels.size(0)
-
             # Forward Pass
             output = model(data)
             
@@ -94,37 +84,21 @@ def train_cls(train_set: Dataset, val_set: Dataset, test_set: Dataset, model: nn
             loss = loss_fn(output, labels)
             
             loss.backward()
-            running_loss += labels.size(0) * loss.item()
-
-            for i, guess in enumerate(output):
-                #predicted_class = guess.argmax()
-                #true_class = labels[i]
-                if step == 0:
-                    pred_indices = torch.Tensor([guess.argmax()])
-                    targ_indices = torch.Tensor([labels[i].argmax()])
-                else:
-                    pred_indices = torch.cat((pred_indices, torch.Tensor([guess.argmax()])))
-                    targ_indices = torch.cat((targ_indices, torch.Tensor([labels[i].argmax()])))
-                if guess.argmax() == labels[i].argmax():
-                    correct += 1
+            running_loss += labels.size(0) * loss.detach()
+
+            metrics.update(output, labels)
 
             if (step+1) % accum_steps == 0 or (step+1) == len(train_loader):
                 optimizer.step()
                 optimizer.zero_grad()
             bar.next()
 
-        train_loss = running_loss/total
-        train_accuracy = correct/total
+        train_loss = running_loss.item()/metrics.total()
+        train_accuracy = metrics.accuracy()
         print('\nTraining loss: ' + str(train_loss))
         print('Training accuracy: ' + str(train_accuracy))
         
-        train_conf_mat = multiclass_confusion_matrix(pred_indices.to(torch.int64), targ_indices.to(torch.int64), num_classes, normalize='true')
-        tcm = pd.DataFrame(train_conf_mat, index=class_names, columns=class_names)
-        plt.figure(dpi = 600)
-        plot = sn.heatmap(tcm, annot=True, vmin=0.0, vmax=1.0)
-        plot.set_xlabel('Predicted Value')
-        plot.set_ylabel('True Value')
-        writer.add_figure('ConfMat/train', plt.gcf(), epoch+1)
+        train_conf_mat = metrics.confmat(normalize='true')
 
         print('Validating...')
         val_loss, val_accuracy, val_conf_mat, rlywrng = val_cls(val_set, subbatch_size, accum_steps, model, use_cuda, loss_fn, num_classes)
@@ -132,16 +106,13 @@ def train_cls(train_set: Dataset, val_set: Dataset, test_set: Dataset, model: nn
         print('\nValidation loss: ' + str(val_loss))
         print('Validation accuracy: ' + str(val_accuracy))
 
-        vcm = pd.DataFrame(val_conf_mat[0], index=class_names, columns=class_names)
-        plt.figure(dpi = 600)
-        plot = sn.heatmap(vcm, annot=True, vmin=0.0, vmax=1.0)
-        plot.set_xlabel('Predicted Value')
-        plot.set_ylabel('True Value')
-        writer.add_figure('ConfMat/val', plt.gcf(), epoch+1)
+        improved = val_loss < best_loss
+        _log_confmat(figures, train_conf_mat, class_names, 'ConfMat/train', epoch+1, improved)
+        _log_confmat(figures, val_conf_mat[0], class_names, 'ConfMat/val', epoch+1, improved)
 
         torch.save(model.state_dict(), path.normpath(writer.get_logdir()+'/last.pt'))
 
-        if val_loss < best_loss:
+        if improved:
             best_loss = val_loss
             torch.save(model.state_dict(), path.normpath(writer.get_logdir()+'/best-loss.pt'))
             
@@ -176,12 +147,7 @@ def train_cls(train_set: Dataset, val_set: Dataset, test_set: Dataset, model: nn
             test_loss, test_accuracy, test_conf_mat, rlywrng = val_cls(test_set, subbatch_size, accum_steps, model, use_cuda, loss_fn, num_classes)
             del rlywrng
             
-            tcm = pd.DataFrame(test_conf_mat[0], index=class_names, columns=class_names)
-            plt.figure(dpi = 600)
-            plot = sn.heatmap(tcm, annot=True, vmin=0.0, vmax=1.0)
-            plot.set_xlabel('Predicted Value')
-            plot.set_ylabel('True Value')
-            writer.add_figure('ConfMat/test', plt.gcf(), epoch+1)
+            _log_confmat(figures, test_conf_mat[0], class_names, 'ConfMat/test', epoch+1, improved)
             
             writer.add_scalar('Loss/test', test_loss, epoch+1)
             writer.add_scalar('Acc/test', test_accuracy, epoch+1)
@@ -190,6 +156,7 @@ def train_cls(train_set: Dataset, val_set: Dataset, test_set: Dataset, model: nn
         if scheduler:
             scheduler.step()
 
+    figures.close()
     writer.close()
 
 def val_cls(dataset, batch_size, accum_steps, model, use_cuda, loss_fn, num_classes):
@@ -204,13 +171,9 @@ def val_cls(dataset, batch_size, accum_steps, model, use_cuda, loss_fn, num_clas
         bar = Bar()
         bar.max = len(val_loader)
 
-        correct = 0
-        total = 0
+        metrics = ClsMetrics(num_classes)
         running_loss = 0.0
         
-        pred_indices = None
-        targ_indices = None
-        
         rlywrng = list()
 
         for step, (data, labels) in enumerate(val_loader):
@@ -218,8 +181,6 @@ def val_cls(dataset, batch_size, accum_steps, model, use_cuda, loss_fn, num_clas
                 data = data.cuda()
                 labels = labels.cuda()
 
-            total += labels.size(0)
-            
             # Forward pass
             output = model(data)
             
@@ -228,31 +189,26 @@ def val_cls(dataset, batch_size, accum_steps, model, use_cuda, loss_fn, num_clas
             
             # Compute the KLDivLoss
             loss = loss_fn(output, labels)
-            running_loss += labels.size(0) * loss.item()
-
-            for i, guess in enumerate(output):
-                if step == 0:
-                    pred_indices = torch.Tensor([guess.argmax()])
-                    targ_indices = torch.Tensor([labels[i].argmax()])
-                else:
-                    pred_indices = torch.cat((pred_indices, torch.Tensor([guess.argmax()])))
-                    targ_indices = torch.cat((targ_indices, torch.Tensor([labels[i].argmax()])))
-                if guess.argmax() == labels[i].argmax():
-                    correct += 1
-                elif abs(guess.argmax().item() - labels[i].argmax().item()) == 2:
-                    rlywrng += [(data[i].detach().clone(), labels[i].argmax().item())]
+            running_loss += labels.size(0) * loss.detach()
+
+            preds, targs = metrics.update(output, labels)
+            for i in torch.nonzero((preds - targs).abs() == 2).flatten().tolist():
+                rlywrng += [(data[i].detach().clone(), targs[i].item())]
 
             bar.next()
 
-        val_loss = running_loss/total
-        val_accuracy = correct/total
+        val_loss = running_loss.item()/metrics.total()
+        val_accuracy = metrics.accuracy()
         
-        val_conf_mat = (multiclass_confusion_matrix(pred_indices.to(torch.int64), targ_indices.to(torch.int64), num_classes, normalize='true'), multiclass_confusion_matrix(pred_indices.to(torch.int64), targ_indices.to(torch.int64), num_classes))
+        val_conf_mat = (metrics.confmat(normalize='true'), metrics.confmat())
 
         return val_loss, val_accuracy, val_conf_mat, rlywrng
 
 def train_reg(train_set: Dataset, val_set: Dataset, test_set: Dataset, model: nn.Module, params):
-    writer = SummaryWriter()
+    #regression logs no figures, so no FigureLogger is started here. One passed in params is
+    #closed at the end like the writer
+    writer = params.get('writer') or SummaryWriter()
+    figures = params.get('figures')
 
     subbatch_size = params['subbatch_size']
     accum_steps = params['accum_steps']
@@ -300,16 +256,8 @@ def train_reg(train_set: Dataset, val_set: Dataset, test_set: Dataset, model: nn
         bar = Bar()
         bar.max = len(train_loader)
 
-        total = 0
+        metrics = RegMetrics()
         running_loss = 0.0
-        running_mae = 0.0
-        running_mse = 0.0
-
-        all_outputs = torch.empty((0, 1))
-        all_labels = torch.empty((0, 1))
-        if use_cuda:
-            all_outputs = all_outputs.cuda()
-            all_labels = all_labels.cuda()
 
 
         for step, (data, labels) in enumerate(train_loader):
@@ -317,18 +265,12 @@ def train_reg(train_set: Dataset, val_set: Dataset, test_set: Dataset, model: nn
                 data = data.cuda()
                 labels = labels.cuda()
 
-            total += labels.size(0)
-
             output = model(data)
             loss = loss_fn(output, labels)
             loss.backward()
 
-            all_outputs = torch.cat((all_outputs, output.detach()))
-            all_labels = torch.cat((all_labels, labels))
-
-            running_loss += labels.size(0) * loss.item()
-            running_mae += f.l1_loss(output, labels, reduction='sum').item()
-            running_mse += f.mse_loss(output, labels, reduction='sum').item()
+            metrics.update(output, labels)
+            running_loss += labels.size(0) * loss.detach()
 
             if (step+1) % accum_steps == 0 or (step+1) == len(train_loader):
                 optimizer.step()
@@ -336,10 +278,10 @@ def train_reg(train_set: Dataset, val_set: Dataset, test_set: Dataset, model: nn
 
             bar.next()
 
-        train_loss = running_loss/total
-        train_mae = running_mae/total
-        train_rmse = math.sqrt(running_mse/total)
-        train_r2 = r2_score(all_outputs, all_labels).item()
+        train_loss = running_loss.item()/metrics.total()
+        train_mae = metrics.mae()
+        train_rmse = metrics.rmse()
+        train_r2 = metrics.r2()
         print('\nTraining loss: ' + str(train_loss))
         print('Training MAE : ' + str(train_mae))
         print('Training RMSE: ' + str(train_rmse))
@@ -379,6 +321,8 @@ def train_reg(train_set: Dataset, val_set: Dataset, test_set: Dataset, model: nn
         if scheduler:
             scheduler.step()
 
+    if figures is not None:
+        figures.close()
     writer.close()
 
 def val_reg(dataset, batch_size, accum_steps, model, use_cuda, loss_fn):
@@ -395,46 +339,31 @@ def val_reg(dataset, batch_size, accum_steps, model, use_cuda, loss_fn):
         bar = Bar()
         bar.max = len(val_loader)
 
-        total = 0
+        metrics = RegMetrics()
         running_loss = 0.0
-        running_mae = 0.0
-        running_mse = 0.0
-
-        all_outputs = torch.empty((0, 1))
-        all_labels = torch.empty((0, 1))
-        if use_cuda:
-            all_outputs = all_outputs.cuda()
-            all_labels = all_labels.cuda()
 
         for step, (data, labels) in enumerate(val_loader):
             if use_cuda:
                 data = data.cuda()
                 labels = labels.cuda()
 
-            total += labels.size(0)
-
             output = model(data)
             loss = loss_fn(output, labels)
 
-            all_outputs = torch.cat((all_outputs, output.detach()))
-            all_labels = torch.cat((all_labels, labels))
-
-            running_loss += labels.size(0) * loss.item()
-            running_mae += f.l1_loss(output, labels, reduction='sum').item()
-            running_mse += f.mse_loss(output, labels, reduction='sum').item()
+            metrics.update(output, labels)
+            running_loss += labels.size(0) * loss.detach()
 
             bar.next()
 
-        val_loss = running_loss/total
-        val_mae = running_mae/total
-        val_rmse = math.sqrt(running_mse/total)
-        val_r2 = r2_score(all_outputs, all_labels).item()
+        val_loss = running_loss.item()/metrics.total()
+        val_mae = metrics.mae()
+        val_rmse = metrics.rmse()
+        val_r2 = metrics.r2()
 
         return val_loss, val_mae, val_rmse, val_r2
     
 def train_cls_bb(train_set: Dataset, val_set: Dataset, test_set: Dataset, model: nn.Module, params):
-    writer = SummaryWriter()
-    sn.set_theme(font_scale=0.4)
+    writer, figures = _logs(params)
 
     subbatch_size = params['subbatch_size']
     accum_steps = params['accum_steps']
@@ -479,7 +408,7 @@ def train_cls_bb(train_set: Dataset, val_set: Dataset, test_set: Dataset, model:
     if use_cuda:
         model.cuda()
 
-    best_loss = float('-inf')
+    best_loss = float('inf')
 
     for epoch in range(epochs):
         print('\nEpoch ' + str(epoch+1))
@@ -493,13 +422,9 @@ def train_cls_bb(train_set: Dataset, val_set: Dataset, test_set: Dataset, model:
         bar = Bar()
         bar.max = len(train_loader)
 
-        correct = 0
-        total = 0
+        metrics = ClsMetrics(num_classes)
         running_loss = 0.0
 
-        pred_indices = None
-        targ_indices = None
-        
         for step, (data, labels) in enumerate(train_loader):
             for i in range(num_classes):
                 if i == largest_set:
@@ -513,57 +438,38 @@ def train_cls_bb(train_set: Dataset, val_set: Dataset, test_set: Dataset, model:
                 data = data.cuda()
                 labels = labels.cuda()
 
-            total += labels.size(0)
-
             output = model(data)
             loss = loss_fn(output, labels)
             loss.backward()
-            running_loss += labels.size(0) * loss.item()
-
-            for i, guess in enumerate(output):
-                if step == 0:
-                    pred_indices = torch.Tensor([guess.argmax().detach()])
-                    targ_indices = torch.Tensor([labels[i].argmax()])
-                else:
-                    pred_indices = torch.cat((pred_indices, torch.Tensor([guess.argmax().detach()])))
-                    targ_indices = torch.cat((targ_indices, torch.Tensor([labels[i].argmax()])))
-                if guess.argmax() == labels[i].argmax():
-                    correct += 1
+            running_loss += labels.size(0) * loss.detach()
+
+            metrics.update(output, labels)
 
             if (step+1) % accum_steps == 0 or (step+1) == len(train_loader):
                 optimizer.step()
                 optimizer.zero_grad()
             bar.next()
 
-        train_loss = running_loss/total
-        train_accuracy = correct/total
+        train_loss = running_loss.item()/metrics.total()
+        train_accuracy = metrics.accuracy()
         print('\nTraining loss: ' + str(train_loss))
         print('Training accuracy: ' + str(train_accuracy))
         
-        train_conf_mat = multiclass_confusion_matrix(pred_indices.to(torch.int64), targ_indices.to(torch.int64), num_classes, normalize='true')
-        tcm = pd.DataFrame(train_conf_mat, index=class_names, columns=class_names)
-        plt.figure(dpi = 600)
-        plot = sn.heatmap(tcm, annot=True, vmin=0.0, vmax=1.0)
-        plot.set_xlabel('Predicted Value')
-        plot.set_ylabel('True Value')
-        writer.add_figure('ConfMat/train', plt.gcf(), epoch+1)
+        train_conf_mat = metrics.confmat(normalize='true')
 
         print('Validating...')
-        val_loss, val_accuracy, val_conf_mat = val_cls(val_set, subbatch_size*num_classes, accum_steps, model, use_cuda, loss_fn, num_classes)
+        val_loss, val_accuracy, val_conf_mat, _ = val_cls(val_set, subbatch_size*num_classes, accum_steps, model, use_cuda, loss_fn, num_classes)
 
         print('\nValidation loss: ' + str(val_loss))
         print('Validation accuracy: ' + str(val_accuracy))
 
-        vcm = pd.DataFrame(val_conf_mat, index=class_names, columns=class_names)
-        plt.figure(dpi = 600)
-        plot = sn.heatmap(vcm, annot=True, vmin=0.0, vmax=1.0)
-        plot.set_xlabel('Predicted Value')
-        plot.set_ylabel('True Value')
-        writer.add_figure('ConfMat/val', plt.gcf(), epoch+1)
+        improved = val_loss < best_loss
+        _log_confmat(figures, train_conf_mat, class_names, 'ConfMat/train', epoch+1, improved)
+        _log_confmat(figures, val_conf_mat[0], class_names, 'ConfMat/val', epoch+1, improved)
 
         torch.save(model.state_dict(), path.normpath(writer.get_logdir()+'/last.pt'))
 
-        if val_loss > best_loss:
+        if improved:
             best_loss = val_loss
             torch.save(model.state_dict(), path.normpath(writer.get_logdir()+'/best-loss.pt'))
 
@@ -573,14 +479,9 @@ def train_cls_bb(train_set: Dataset, val_set: Dataset, test_set: Dataset, model:
         writer.add_scalar('Acc/val', val_accuracy, epoch+1)
         if test_set.__len__() > 0:
             print('Testing...')
-            test_loss, test_accuracy, test_conf_mat = val_cls(test_set, subbatch_size*num_classes, accum_steps, model, use_cuda, loss_fn, num_classes)
+            test_loss, test_accuracy, test_conf_mat, _ = val_cls(test_set, subbatch_size*num_classes, accum_steps, model, use_cuda, loss_fn, num_classes)
             
-            tcm = pd.DataFrame(test_conf_mat, index=class_names, columns=class_names)
-            plt.figure(dpi = 600)
-            plot = sn.heatmap(tcm, annot=True, vmin=0.0, vmax=1.0)
-            plot.set_xlabel('Predicted Value')
-            plot.set_ylabel('True Value')
-            writer.add_figure('ConfMat/test', plt.gcf(), epoch+1)
+            _log_confmat(figures, test_conf_mat[0], class_names, 'ConfMat/test', epoch+1, improved)
             
             writer.add_scalar('Loss/test', test_loss, epoch+1)
             writer.add_scalar('Acc/test', test_accuracy, epoch+1)
@@ -589,11 +490,11 @@ def train_cls_bb(train_set: Dataset, val_set: Dataset, test_set: Dataset, model:
         if scheduler:
             scheduler.step()
 
+    figures.close()
     writer.close()
     
 def train_cls_bb2(train_set: Dataset, val_set: Dataset, test_set: Dataset, model: nn.Module, params):
-    writer = SummaryWriter()
-    sn.set_theme(font_scale=0.4)
+    writer, figures = _logs(params)
 
     subbatch_size = params['subbatch_size']
     accum_steps = params['accum_steps']
@@ -638,7 +539,7 @@ def train_cls_bb2(train_set: Dataset, val_set: Dataset, test_set: Dataset, model
     if use_cuda:
         model.cuda()
 
-    best_loss = float('-inf')
+    best_loss = float('inf')
     
     for i in range(num_classes):
         train_iters[i] = iter(DataLoader(train_set[i], 1, True))
@@ -653,13 +554,9 @@ def train_cls_bb2(train_set: Dataset, val_set: Dataset, test_set: Dataset, model
         bar = Bar()
         bar.max = len(train_loader)
 
-        correct = 0
-        total = 0
+        metrics = ClsMetrics(num_classes)
         running_loss = 0.0
 
-        pred_indices = None
-        targ_indices = None
-        
         for step, (data, labels) in enumerate(train_loader):
             for i in range(num_classes):
                 if i == smallest_set:
@@ -678,57 +575,38 @@ def train_cls_bb2(train_set: Dataset, val_set: Dataset, test_set: Dataset, model
                 data = data.cuda()
                 labels = labels.cuda()
 
-            total += labels.size(0)
-
             output = model(data)
             loss = loss_fn(output, labels)
             loss.backward()
-            running_loss += labels.size(0) * loss.item()
-
-            for i, guess in enumerate(output):
-                if step == 0:
-                    pred_indices = torch.Tensor([guess.argmax().detach()])
-                    targ_indices = torch.Tensor([labels[i].argmax()])
-                else:
-                    pred_indices = torch.cat((pred_indices, torch.Tensor([guess.argmax().detach()])))
-                    targ_indices = torch.cat((targ_indices, torch.Tensor([labels[i].argmax()])))
-                if guess.argmax() == labels[i].argmax():
-                    correct += 1
+            running_loss += labels.size(0) * loss.detach()
+
+            metrics.update(output, labels)
 
             if (step+1) % accum_steps == 0 or (step+1) == len(train_loader):
                 optimizer.step()
                 optimizer.zero_grad()
             bar.next()
 
-        train_loss = running_loss/total
-        train_accuracy = correct/total
+        train_loss = running_loss.item()/metrics.total()
+        train_accuracy = metrics.accuracy()
         print('\nTraining loss: ' + str(train_loss))
         print('Training accuracy: ' + str(train_accuracy))
         
-        train_conf_mat = multiclass_confusion_matrix(pred_indices.to(torch.int64), targ_indices.to(torch.int64), num_classes, normalize='true')
-        tcm = pd.DataFrame(train_conf_mat, index=class_names, columns=class_names)
-        plt.figure(dpi = 600)
-        plot = sn.heatmap(tcm, annot=True, vmin=0.0, vmax=1.0)
-        plot.set_xlabel('Predicted Value')
-        plot.set_ylabel('True Value')
-        writer.add_figure('ConfMat/train', plt.gcf(), epoch+1)
+        train_conf_mat = metrics.confmat(normalize='true')
 
         print('Validating...')
-        val_loss, val_accuracy, val_conf_mat = val_cls(val_set, subbatch_size*num_classes, accum_steps, model, use_cuda, loss_fn, num_classes)
+        val_loss, val_accuracy, val_conf_mat, _ = val_cls(val_set, subbatch_size*num_classes, accum_steps, model, use_cuda, loss_fn, num_classes)
 
         print('\nValidation loss: ' + str(val_loss))
         print('Validation accuracy: ' + str(val_accuracy))
 
-        vcm = pd.DataFrame(val_conf_mat, index=class_names, columns=class_names)
-        plt.figure(dpi = 600)
-        plot = sn.heatmap(vcm, annot=True, vmin=0.0, vmax=1.0)
-        plot.set_xlabel('Predicted Value')
-        plot.set_ylabel('True Value')
-        writer.add_figure('ConfMat/val', plt.gcf(), epoch+1)
+        improved = val_loss < best_loss
+        _log_confmat(figures, train_conf_mat, class_names, 'ConfMat/train', epoch+1, improved)
+        _log_confmat(figures, val_conf_mat[0], class_names, 'ConfMat/val', epoch+1, improved)
 
         torch.save(model.state_dict(), path.normpath(writer.get_logdir()+'/last.pt'))
 
-        if val_loss > best_loss:
+        if improved:
             best_loss = val_loss
             torch.save(model.state_dict(), path.normpath(writer.get_logdir()+'/best-loss.pt'))
 
@@ -738,14 +616,9 @@ def train_cls_bb2(train_set: Dataset, val_set: Dataset, test_set: Dataset, model
         writer.add_scalar('Acc/val', val_accuracy, epoch+1)
         if test_set.__len__() > 0:
             print('Testing...')
-            test_loss, test_accuracy, test_conf_mat = val_cls(test_set, subbatch_size*num_classes, accum_steps, model, use_cuda, loss_fn, num_classes)
+            test_loss, test_accuracy, test_conf_mat, _ = val_cls(test_set, subbatch_size*num_classes, accum_steps, model, use_cuda, loss_fn, num_classes)
             
-            tcm = pd.DataFrame(test_conf_mat, index=class_names, columns=class_names)
-            plt.figure(dpi = 600)
-            plot = sn.heatmap(tcm, annot=True, vmin=0.0, vmax=1.0)
-            plot.set_xlabel('Predicted Value')
-            plot.set_ylabel('True Value')
-            writer.add_figure('ConfMat/test', plt.gcf(), epoch+1)
+            _log_confmat(figures, test_conf_mat[0], class_names, 'ConfMat/test', epoch+1, improved)
             
             writer.add_scalar('Loss/test', test_loss, epoch+1)
             writer.add_scalar('Acc/test', test_accuracy, epoch+1)
@@ -754,11 +627,11 @@ def train_cls_bb2(train_set: Dataset, val_set: Dataset, test_set: Dataset, model
         if scheduler:
             scheduler.step()
 
+    figures.close()
     writer.close()
     
 def train_cls_all(train_set: Dataset, val_set: Dataset, test_set: Dataset, model: nn.Module, params):
-    writer = SummaryWriter()
-    sn.set_theme(font_scale=0.4)
+    writer, figures = _logs(params)
 
     subbatch_size = params['subbatch_size']
     accum_steps = params['accum_steps']
@@ -796,7 +669,7 @@ def train_cls_all(train_set: Dataset, val_set: Dataset, test_set: Dataset, model
     if use_cuda:
         model.cuda()
 
-    best_loss = float('-inf')
+    best_loss = float('inf')
 
     for epoch in range(epochs):
         print('\nEpoch ' + str(epoch+1))
@@ -807,69 +680,46 @@ def train_cls_all(train_set: Dataset, val_set: Dataset, test_set: Dataset, model
         bar = Bar()
         bar.max = len(train_loader)
 
-        correct = 0
-        total = 0
+        metrics = ClsMetrics(num_classes)
         running_loss = 0.0
 
-        pred_indices = None
-        targ_indices = None
-        
         for step, (data, labels) in enumerate(train_loader):
             if use_cuda:
                 data = data.cuda()
                 labels = labels.cuda()
 
-            total += labels.size(0)
-
             output = model(data)
             loss = loss_fn(output, labels)
             loss.backward()
-            running_loss += labels.size(0) * loss.item()
-
-            for i, guess in enumerate(output):
-                if step == 0:
-                    pred_indices = torch.Tensor([guess.argmax().detach()])
-                    targ_indices = torch.Tensor([labels[i].argmax()])
-                else:
-                    pred_indices = torch.cat((pred_indices, torch.Tensor([guess.argmax().detach()])))
-                    targ_indices = torch.cat((targ_indices, torch.Tensor([labels[i].argmax()])))
-                if guess.argmax() == labels[i].argmax():
-                    correct += 1
+            running_loss += labels.size(0) * loss.detach()
+
+            metrics.update(output, labels)
 
             if (step+1) % accum_steps == 0 or (step+1) == len(train_loader):
                 optimizer.step()
                 optimizer.zero_grad()
             bar.next()
 
-        train_loss = running_loss/total
-        train_accuracy = correct/total
+        train_loss = running_loss.item()/metrics.total()
+        train_accuracy = metrics.accuracy()
         print('\nTraining loss: ' + str(train_loss))
         print('Training accuracy: ' + str(train_accuracy))
         
-        train_conf_mat = multiclass_confusion_matrix(pred_indices.to(torch.int64), targ_indices.to(torch.int64), num_classes, normalize='true')
-        tcm = pd.DataFrame(train_conf_mat, index=class_names, columns=class_names)
-        plt.figure(dpi = 600)
-        plot = sn.heatmap(tcm, annot=True, vmin=0.0, vmax=1.0)
-        plot.set_xlabel('Predicted Value')
-        plot.set_ylabel('True Value')
-        writer.add_figure('ConfMat/train', plt.gcf(), epoch+1)
+        train_conf_mat = metrics.confmat(normalize='true')
 
         print('Validating...')
-        val_loss, val_accuracy, val_conf_mat = val_cls(val_set, subbatch_size, accum_steps, model, use_cuda, loss_fn, num_classes)
+        val_loss, val_accuracy, val_conf_mat, _ = val_cls(val_set, subbatch_size, accum_steps, model, use_cuda, loss_fn, num_classes)
 
         print('\nValidation loss: ' + str(val_loss))
         print('Validation accuracy: ' + str(val_accuracy))
 
-        vcm = pd.DataFrame(val_conf_mat, index=class_names, columns=class_names)
-        plt.figure(dpi = 600)
-        plot = sn.heatmap(vcm, annot=True, vmin=0.0, vmax=1.0)
-        plot.set_xlabel('Predicted Value')
-        plot.set_ylabel('True Value')
-        writer.add_figure('ConfMat/val', plt.gcf(), epoch+1)
+        improved = val_loss < best_loss
+        _log_confmat(figures, train_conf_mat, class_names, 'ConfMat/train', epoch+1, improved)
+        _log_confmat(figures, val_conf_mat[0], class_names, 'ConfMat/val', epoch+1, improved)
 
         torch.save(model.state_dict(), path.normpath(writer.get_logdir()+'/last.pt'))
 
-        if val_loss > best_loss:
+        if improved:
             best_loss = val_loss
             torch.save(model.state_dict(), path.normpath(writer.get_logdir()+'/best-loss.pt'))
 
@@ -879,14 +729,9 @@ def train_cls_all(train_set: Dataset, val_set: Dataset, test_set: Dataset, model
         writer.add_scalar('Acc/val', val_accuracy, epoch+1)
         if test_set.__len__() > 0:
             print('Testing...')
-            test_loss, test_accuracy, test_conf_mat = val_cls(test_set, subbatch_size, accum_steps, model, use_cuda, loss_fn, num_classes)
+            test_loss, test_accuracy, test_conf_mat, _ = val_cls(test_set, subbatch_size, accum_steps, model, use_cuda, loss_fn, num_classes)
             
-            tcm = pd.DataFrame(test_conf_mat, index=class_names, columns=class_names)
-            plt.figure(dpi = 600)
-            plot = sn.heatmap(tcm, annot=True, vmin=0.0, vmax=1.0)
-            plot.set_xlabel('Predicted Value')
-            plot.set_ylabel('True Value')
-            writer.add_figure('ConfMat/test', plt.gcf(), epoch+1)
+            _log_confmat(figures, test_conf_mat[0], class_names, 'ConfMat/test', epoch+1, improved)
             
             writer.add_scalar('Loss/test', test_loss, epoch+1)
             writer.add_scalar('Acc/test', test_accuracy, epoch+1)
@@ -895,4 +740,19 @@ def train_cls_all(train_set: Dataset, val_set: Dataset, test_set: Dataset, model
         if scheduler:
             scheduler.step()
 
-    writer.close()
\ No newline at end of file
+    figures.close()
+    writer.close()
+
+def _logs(params):
+    #the writer and FigureLogger main.py opens before the model and CUDA setup, so the renderer
+    #forks from a small process, or new ones. The train functions close both when they're done
+    writer = params.get('writer') or SummaryWriter()
+    figures = params.get('figures')
+    if figures is None:
+        figures = FigureLogger(writer.get_logdir(), params.get('figure_every', 1), params.get('figures_on_improvement', True),
+                               params.get('figure_budget'))
+    return writer, figures
+
+def _log_confmat(figures, conf_mat, class_names, tag, epoch, improved=False):
+    figures.heatmap(tag, conf_mat, epoch, class_names, class_names, improved, annot=True, vmin=0.0, vmax=1.0, dpi=600,
+                    xlabel='Predicted Value', ylabel='True Value')
@@ -0,0 +1,92 @@
+import math
+import torch
+import torch.nn.functional as F
+
+# Augmentation for whole [B, C, H, W] batches after collation, on whatever device the batch is
+# on. Every sample still gets its own random flip, rotation, sharpness and colour jitter, but
+# each of those is one tensor op over the batch instead of a torchvision Compose per image.
+# Random parameters come from a seeded CPU generator so runs can be repeated.
+
+GRAY_WEIGHTS = (0.299, 0.587, 0.114)
+
+class BatchAugment:
+    def __init__(self, flip_p=0.5, degrees=5, sharpness=None, brightness=0.0, saturation=0.0,
+                 interpolation='nearest', seed=None):
+        #sharpness is a (min, max) factor range, applied to half the samples like RandomAdjustSharpness
+        self.flip_p = flip_p
+        self.degrees = degrees
+        self.sharpness = sharpness
+        self.brightness = brightness
+        self.saturation = saturation
+        self.interpolation = interpolation
+
+        self.generator = torch.Generator()
+        if seed is None:
+            self.generator.seed()
+        else:
+            self.generator.manual_seed(seed)
+
+    def _uniform(self, n, low, high):
+        return torch.rand(n, generator=self.generator) * (high - low) + low
+
+    def _chance(self, n, p):
+        return torch.rand(n, generator=self.generator) < p
+
+    def flip(self, x):
+        flip = self._chance(x.size(0), self.flip_p).to(x.device).view(-1, 1, 1, 1)
+        return torch.where(flip, x.flip(-1), x)
+
+    def rotate(self, x):
+        #about the image center, areas rotated in from outside are 0 like RandomRotation's fill
+        b, _, h, w = x.shape
+        angles = self._uniform(b, -self.degrees, self.degrees) * math.pi / 180
+        cos, sin = torch.cos(angles), torch.sin(angles)
+
+        #affine_grid works in [-1, 1] coordinates on both axes, so correct for the aspect ratio
+        theta = torch.zeros(b, 2, 3)
+        theta[:, 0, 0] = cos
+        theta[:, 0, 1] = -sin * h / w
+        theta[:, 1, 0] = sin * w / h
+        theta[:, 1, 1] = cos
+        theta = theta.to(device=x.device, dtype=x.dtype)
+
+        grid = F.affine_grid(theta, x.shape, align_corners=False)
+        return F.grid_sample(x, grid, mode=self.interpolation, padding_mode='zeros', align_corners=False)
+
+    def sharpen(self, x):
+        #same as adjust_sharpness: blend with a 3x3 smoothed copy, borders left as they are
+        b, c = x.shape[:2]
+        factors = self._uniform(b, *self.sharpness)
+        factors = torch.where(self._chance(b, 0.5), factors, torch.ones(b))
+
+        kernel = torch.tensor([[1.0, 1.0, 1.0], [1.0, 5.0, 1.0], [1.0, 1.0, 1.0]], dtype=x.dtype, device=x.device) / 13
+        blurred = F.conv2d(x.reshape(b * c, 1, *x.shape[2:]), kernel.view(1, 1, 3, 3)).view(b, c, x.size(2) - 2, x.size(3) - 2)
+        degenerate = x.clone()
+        degenerate[..., 1:-1, 1:-1] = blurred
+
+        return _blend(x, degenerate, factors.to(x.device))
+
+    def jitter(self, x):
+        b = x.size(0)
+        if self.brightness > 0:
+            factors = self._uniform(b, max(0.0, 1 - self.brightness), 1 + self.brightness)
+            x = torch.clamp(x * factors.to(x.device).view(-1, 1, 1, 1), 0.0, 1.0)
+        if self.saturation > 0:
+            factors = self._uniform(b, max(0.0, 1 - self.saturation), 1 + self.saturation)
+            weights = torch.tensor(GRAY_WEIGHTS, dtype=x.dtype, device=x.device).view(1, 3, 1, 1)
+            gray = torch.sum(x * weights, 1, keepdim=True)
+            x = _blend(x, gray, factors.to(x.device))
+        return x
+
+    def __call__(self, x):
+        if self.flip_p > 0:
+            x = self.flip(x)
+        if self.degrees > 0:
+            x = self.rotate(x)
+        if self.sharpness is not None:
+            x = self.sharpen(x)
+        return self.jitter(x)
+
+def _blend(x, other, factors):
+    factors = factors.to(x.dtype).view(-1, 1, 1, 1)
+    return torch.clamp(factors * x + (1 - factors) * other, 0.0, 1.0)
@@ -0,0 +1,88 @@
+import sys
+import time
+import torch
+import models
+from models.preprocess import set_memory_format
+
+# Images/sec of every model in NCHW and channels_last, for inference and for a training step
+# (forward + backward). Run from rewrite2/: python benchmark_layout.py [model names...]
+
+DIMS = (310, 470)
+BATCH_SIZE = 8
+WARMUP = 2
+ITERATIONS = 5
+NUM_CLASSES = 10
+USE_CUDA = torch.cuda.is_available()
+
+MODELS = {
+    'VisNet': models.VisNet,
+    'VisNetReduced': models.VisNetReduced,
+    'Integrated': models.Integrated,
+    'RMEP': models.RMEP,
+    'RMEP_FFT': models.RMEP_FFT,
+    'ResNet50': models.ResNet50,
+    'MinLinear': models.MinLinear,
+    'MinReLU': models.MinReLU
+}
+
+def build(module):
+    data = module.get_batch_tf_function()(torch.rand(BATCH_SIZE, 3, *DIMS))
+    #VisNet normalizes per channel, the rest per element
+    stats_shape = (3,) if module is models.VisNet else data.shape[1:]
+    model = module.Model(NUM_CLASSES, 3, torch.zeros(stats_shape), torch.ones(stats_shape))
+    model(data[:1])
+
+    if USE_CUDA:
+        model, data = model.cuda(), data.cuda()
+    return model, data
+
+def sync():
+    if USE_CUDA:
+        torch.cuda.synchronize()
+
+def images_per_sec(step, batch_size):
+    for _ in range(WARMUP):
+        step()
+    sync()
+
+    start = time.time()
+    for _ in range(ITERATIONS):
+        step()
+    sync()
+
+    return ITERATIONS * batch_size / (time.time() - start)
+
+def benchmark(module):
+    results = {}
+    for name, memory_format in (('NCHW', torch.contiguous_format), ('channels_last', torch.channels_last)):
+        torch.manual_seed(0)
+        model, data = build(module)
+        set_memory_format(model, memory_format)
+
+        model.eval()
+        def infer():
+            with torch.inference_mode():
+                model(data)
+
+        def train():
+            model.zero_grad(set_to_none=True)
+            model(data).sum().backward()
+
+        eval_speed = images_per_sec(infer, data.size(0))
+        model.train()
+        train_speed = images_per_sec(train, data.size(0))
+
+        results[name] = (eval_speed, train_speed)
+    return results
+
+if __name__ == '__main__':
+    names = sys.argv[1:] if len(sys.argv) > 1 else list(MODELS)
+
+    print(f'{DIMS[0]}x{DIMS[1]}, batch size {BATCH_SIZE}, {"cuda" if USE_CUDA else "cpu"}')
+    print(f'{"model":<14}{"layout":<15}{"eval img/s":>12}{"train img/s":>13}')
+    for name in names:
+        results = benchmark(MODELS[name])
+        for layout, (eval_speed, train_speed) in results.items():
+            print(f'{name:<14}{layout:<15}{eval_speed:>12.1f}{train_speed:>13.1f}')
+        speedup = results['channels_last'][1] / results['NCHW'][1]
+        print(f'{"":<14}{"train speedup":<15}{"":>12}{speedup:>12.2f}x')
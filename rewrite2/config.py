@@ -29,11 +29,32 @@ CONFIG = {
     'num channels': 3,
     # percent split between training, validation, and test sets
     'splits': (0.70, 0.15, 0.15),
+    # split each stratum separately: 'class', 'site', 'site and class' or None. 'default' is class for
+    # classification and None for regression. Splits are stored in 'split dir' and reused by later runs
+    'stratify': 'default',
+    'split dir': 'splits',
     # batch size = subbatch size * accum steps. Batches are split up into smaller batches when there is not enough memory for an entire batch
     'subbatch size': 8,
     'subbatch count': 4, 
     # whether or not to use the GPU
     'cuda': True,
+    # run the forward passes under autocast in this dtype, e.g. torch.bfloat16 on CPUs with AVX512-BF16/AMX.
+    # Weights stay fp32. None for plain fp32
+    'autocast dtype': None,
+    # before training, the autocast run is checked against fp32 on a few val batches. It fails when the accuracy or R²
+    # differ by more than this, or the MAE by more than this fraction of the fp32 MAE
+    'autocast tolerance': 0.01,
+    # torch.compile the model before training, True for the default mode or a mode name like 'max-autotune'.
+    # Compile time is reported separately and the compile cache is kept in compile_cache/ per config
+    'compile': False,
+    # run the convolutions in channels_last (NHWC) memory format, usually faster with oneDNN on CPU and with
+    # tensor cores on GPU. benchmark_layout.py compares both layouts for every model
+    'channels last': False,
+    # figures (confusion matrices, per-site recall) are rendered in a background process, on every Nth epoch (0 for
+    # never) and, with 'figures on improvement', on every epoch the monitored metric improves. The budget caps figures per epoch
+    'figure every': 1,
+    'figures on improvement': True,
+    'figure budget': None,
     # instance of loss function to be used in training
     #'loss function': nn.SmoothL1Loss(),
     # 'loss function': nn.KLDivLoss(reduction='batchmean'),  # Using KLDivLoss
@@ -45,13 +66,26 @@ CONFIG = {
       'lr': 0.0000005,
       'weight_decay': 0.00
     },
-    # scheduler is currently unused
+    # learning rate scheduler class (e.g. sched.StepLR), NOT an instance, stepped once per epoch. sched.ReduceLROnPlateau
+    # steps on the monitored metric below, give it mode='max' for accuracy and R². None for a constant learning rate
     'scheduler': None,
     'scheduler params': {
 
     },
     # number of epochs to train for
     'epochs': 80,
+    # validate (and save last.pt) every N epochs and test every N epochs, both always after the last epoch.
+    # 'test every': 0 only tests after the last (or early stopped) epoch
+    'eval every': 1,
+    'test every': 1,
+    # metric that picks best-<metric>.pt and the scheduler/early stopping value: 'val loss', 'val acc', 'test loss',
+    # 'val r2', 'val mse'... None for val loss. A test metric runs the test set on every evaluated epoch, whatever
+    # 'test every' is
+    'monitor': None,
+    # stop after this many evaluations without an improvement of more than 'min delta' in the monitored metric.
+    # None to always train for all epochs
+    'patience': None,
+    'min delta': 0.0,
     # dataset class. NOT an instance
     'dataset class': Webcams.Webcams_reg,
     # parameters for constructing the dataset. Dependent on what dataset is being used.
@@ -75,8 +109,52 @@ CONFIG = {
     'dataset path': "D:\\research\\VEIA",
     # whether or not to apply random augmentation to images to effectively increase size of the training set
     'augment': True,
+    # augment whole batches on the device after collation instead of per image in the dataset (flip and
+    # rotation, same as the per image version). Needs on-model preprocessing. None for an unseeded generator
+    'batch augment': False,
+    'augment seed': None,
     'normalize': True,
+    # folder where the training set mean/std are cached, keyed by the training file list and preprocessing settings.
+    # None to recompute them every run
+    'stats cache dir': 'stats_cache',
+    # build the extra streams (PC, FFT) inside the model from the plain image batch instead of in the dataset.
+    # Only for model modules with a make_streams function
+    'on-model preprocessing': False,
+    # the dataset stops after the resize and the train/eval loops run the model module's get_batch_tf_function on
+    # each [B, C, H, W] batch instead of get_tf_function on each image. Ignored with on-model preprocessing. The
+    # materialized and eval cached samples are then only resized, and the model transform runs again on every pass
+    'batch transform': False,
+    # keep images uint8 from decoding until the batch is on the device, converted to float once per batch.
+    # Needs a dataset transform that works on uint8, so on-model preprocessing, the batch transform or a model
+    # without a transform. Turned off with a message otherwise
+    'uint8 transport': False,
+    # folder where preprocessed (cropped, resized and, without 'batch transform' or on-model preprocessing, model
+    # transformed) val and test images are stored, the training images too when augment is False. None to preprocess
+    # every image every epoch
+    'materialize dir': None,
+    # 'uint8' or 'float16'. uint8 only works for models whose transform outputs values in [0, 1]
+    'materialize dtype': 'uint8',
+    # keep the val and test images as the loaders produce them (model transformed unless 'batch transform' or on-model
+    # preprocessing is on) after the first epoch so later evaluations skip the loaders.
+    # 'eval cache dtype' is 'float32', 'float16' (float32 when the data is outside its range) or 'uint8' (only for data in
+    # [0, 1]). Every evaluation, the first one included, sees the samples rounded to that dtype. 'eval cache budget' is the
+    # MB of memory each of val and test may use, rows beyond it go to a temporary file in 'eval cache dir' (None for the
+    # system temp dir)
+    'eval cache': False,
+    'eval cache dtype': 'float16',
+    'eval cache budget': 2048,
+    'eval cache dir': None,
     'num workers': 0,
+    # (experimental) collate batches straight into a small ring of reused shared memory buffers (pinned with CUDA)
+    # instead of allocating, stacking and pinning every batch. The data tensor a loader yields is a view of a ring
+    # slot that the workers overwrite a few batches later, so it is only valid until the next batch is fetched:
+    # anything kept past the step has to be .clone()d first (labels and ids are already copies)
+    'batch ring': False,
+    # threads each loader process uses to decode the images of a batch
+    'decode threads': 8,
+    # decode JPEGs at reduced resolution (1/2, 1/4, 1/8) when the target size allows it, close to but not
+    # exactly the same as decoding at full size and resizing
+    'scaled jpeg decode': False,
     'output function': None,
     'label function': None
 }
\ No newline at end of file
@@ -3,16 +3,17 @@ from torch.utils.data import Dataset
 from glob import glob
 from os import path
 import torchvision.io as io
+from dsets import decode, splits, records
 import sqlite3
 from random import Random
 
 class Jacobs(Dataset):
-    def __init__(self, dataset_dir, transformer, max_images=99999999):
+    def __init__(self, dataset_dir, transformer, max_images=99999999, uint8=False):
         self.transformer = transformer
+        self.uint8 = uint8
 
-        if type(dataset_dir) is tuple:
-            self.files = dataset_dir[0]
-            self.labels = dataset_dir[1]
+        if isinstance(dataset_dir, (tuple, splits.IndexView)):
+            records.store(self, *splits.unpack(dataset_dir))
             return
         
         tmp_files = glob(path.normpath(dataset_dir + '/**/*.png'), recursive=True)
@@ -34,6 +35,8 @@ class Jacobs(Dataset):
 
             self.files.append(file)
             self.labels.append(torch.Tensor([value]).float())
+
+        records.store(self, self.files, self.labels)
                 
     def __len__(self):
         return len(self.files)
@@ -43,11 +46,17 @@ class Jacobs(Dataset):
             idx = idx.tolist()
             
         img_path =  self.files[idx]
-        data = io.read_image(img_path, io.ImageReadMode.RGB)/255
+        data = decode.read_image(img_path, self.uint8)
         
         data = self.transformer(data)
-        data = data.float()
+        data = decode.finish(data, self.uint8)
 
-        label = torch.Tensor(self.labels[idx])
+        label = torch.from_numpy(self.labels[idx])
         
-        return (data, label)
\ No newline at end of file
+        return (data, label)
+
+    def __getitems__(self, indices):
+        img_paths = [self.files[idx] for idx in indices]
+        data = decode.fetch_batch(img_paths, self.transformer, self.uint8)
+
+        return [(d, torch.from_numpy(self.labels[idx])) for d, idx in zip(data, indices)]
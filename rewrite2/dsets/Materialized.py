@@ -0,0 +1,179 @@
+import os
+import json
+import hashlib
+import shutil
+from os import path
+import numpy as np
+import torch
+from torch.utils.data import Dataset, DataLoader
+from progress.bar import ChargingBar
+from dsets import decode, records
+
+# Runs a dataset's full pipeline (border crop, resize_fn, model transform) once and stores the
+# results in memory-mapped .npy shards, so epochs without augmentation skip decoding and the
+# FFT/colormap work entirely.
+
+INDEX_NAME = 'index.npz'
+
+def _shard_path(out_dir, shard):
+    return path.join(out_dir, f'shard_{shard:05d}.npy')
+
+def settings_hash(settings, dtype, raw):
+    #settings: anything besides the file list that changes the stored tensors (sizes, model transform...)
+    return hashlib.sha1(json.dumps([settings, dtype, raw], sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+def _in_unit_range(data):
+    #uint8 storage clamps to [0, 1], allow for rounding in the transforms
+    return data.min().item() >= -1e-3 and data.max().item() <= 1.0 + 1e-3
+
+def materialize(dset, out_dir, dtype='uint8', shard_size=1024, batch_size=8, num_workers=0, raw=False, settings=None):
+    #uint8 is only lossless enough for data in [0, 1] (images and colormaps). If the first
+    #sample is outside that fp16 is used instead, a later sample outside it raises. The shards
+    #are written to a sibling folder that replaces out_dir only once everything is written, so
+    #a failed or interrupted run leaves the previous shards (or nothing) behind
+    work_dir = path.normpath(out_dir) + '.partial'
+    if path.isdir(work_dir):
+        shutil.rmtree(work_dir)
+    os.makedirs(work_dir)
+    try:
+        _write(dset, work_dir, out_dir, dtype, shard_size, batch_size, num_workers, raw, settings)
+    except BaseException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+
+    if path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.replace(work_dir, out_dir)
+    return Materialized(out_dir, raw)
+
+def _write(dset, work_dir, out_dir, dtype, shard_size, batch_size, num_workers, raw, settings):
+    index_path = path.join(work_dir, INDEX_NAME)
+
+    np_dtype = np.uint8 if dtype == 'uint8' else np.float16
+    count = len(dset)
+    first = dset[0]
+    shape = tuple(first[0].shape)
+    if np_dtype == np.uint8 and first[0].dtype != torch.uint8 and not _in_unit_range(decode.to_float(first[0])):
+        print(f'Materialized data is outside [0, 1], storing {out_dir} as float16 instead of uint8')
+        np_dtype = np.float16
+    labels = np.zeros((count, *first[1].shape), dtype=np.float32)
+    files = []
+    sites = []
+    orientations = []
+
+    loader = DataLoader(dset, batch_size, shuffle=False, num_workers=num_workers)
+
+    bar = ChargingBar('Materializing', max=len(loader), width=0)
+    shard = None
+    shard_idx = -1
+    row = 0
+    for batch in loader:
+        data, label = decode.to_float(batch[0]), batch[1]
+        if len(batch) > 2:
+            #items carry their row in dset, the paths are looked up here
+            files += records.paths(dset, batch[2])
+            sites.append(records.sites(dset, batch[2]))
+            orientations.append(records.orientations(dset, batch[2]))
+
+        if np_dtype == np.uint8:
+            if batch[0].dtype != torch.uint8 and not _in_unit_range(data):
+                raise ValueError(f'Materialized data is outside [0, 1] and can\'t be stored as uint8, use float16 for {out_dir}')
+            data = torch.round(torch.clamp(data, 0.0, 1.0) * 255).to(torch.uint8)
+        else:
+            data = data.to(torch.float16)
+        data = data.numpy()
+
+        labels[row:row + data.shape[0]] = label.numpy().reshape(data.shape[0], *labels.shape[1:])
+
+        start = 0
+        while start < data.shape[0]:
+            if (row + start) // shard_size != shard_idx:
+                if shard is not None:
+                    shard.flush()
+                shard_idx = (row + start) // shard_size
+                rows = min(shard_size, count - shard_idx * shard_size)
+                shard = np.lib.format.open_memmap(_shard_path(work_dir, shard_idx), 'w+', np_dtype, (rows, *shape))
+
+            offset = (row + start) % shard_size
+            n = min(data.shape[0] - start, shard.shape[0] - offset)
+            shard[offset:offset + n] = data[start:start + n]
+            start += n
+
+        row += data.shape[0]
+        bar.next()
+    bar.finish()
+
+    if shard is not None:
+        shard.flush()
+    del shard
+
+    #the source's site codes are kept so the splits share one code space
+    columns = {}
+    if sites:
+        columns = {'site_codes': np.concatenate(sites), 'site_names': records.source(dset).site_names,
+                   'orientations': np.concatenate(orientations)}
+
+    np.savez(index_path, count=count, shape=np.array(shape), shard_size=shard_size,
+             dtype=np.dtype(np_dtype).str, labels=labels, files=np.array(files, dtype=str),
+             settings=settings_hash(settings, dtype, raw), **columns)
+
+def load_or_materialize(dset, out_dir, dtype='uint8', shard_size=1024, batch_size=8, num_workers=0, raw=False, settings=None):
+    #the stored shards are reused when the file list and the settings hash match
+    index_path = path.join(out_dir, INDEX_NAME)
+    if path.isfile(index_path):
+        with np.load(index_path) as index:
+            files = index['files']
+            up_to_date = 'settings' in index and str(index['settings']) == settings_hash(settings, dtype, raw)
+            up_to_date = up_to_date and int(index['count']) == len(dset)
+            if up_to_date and len(files) > 0 and hasattr(dset, 'files'):
+                up_to_date = files.tolist() == list(dset.files)
+        if up_to_date:
+            return Materialized(out_dir, raw)
+
+    return materialize(dset, out_dir, dtype, shard_size, batch_size, num_workers, raw, settings)
+
+class Materialized(Dataset):
+    def __init__(self, out_dir, raw=False):
+        #raw=True hands out the stored uint8/fp16 views untouched, otherwise float32 in [0, 1]
+        self.out_dir = out_dir
+        self.raw = raw
+
+        with np.load(path.join(out_dir, INDEX_NAME)) as index:
+            self.count = int(index['count'])
+            self.shard_size = int(index['shard_size'])
+            self.dtype = np.dtype(str(index['dtype']))
+            self.labels = index['labels'].astype(np.float32, copy=False)
+            self.files = records.PathArray(index['files'].tolist())
+            if 'site_codes' in index:
+                records.describe(self, self.files, index['site_codes'], index['orientations'], index['site_names'])
+
+        if not hasattr(self, 'site_codes'):
+            #sites and orientations of the source dataset's paths, '' for datasets without paths
+            records.describe(self, self.files if len(self.files) else [''] * self.count)
+
+        self.shards = None
+
+    def _open(self):
+        #copy-on-write mappings so torch.from_numpy gets a writable view without copying the file
+        num_shards = (self.count + self.shard_size - 1) // self.shard_size
+        self.shards = [np.load(_shard_path(self.out_dir, i), mmap_mode='c') for i in range(num_shards)]
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, idx):
+        if torch.is_tensor(idx):
+            idx = idx.tolist()
+        if self.shards is None:
+            self._open()
+
+        shard, row = divmod(idx, self.shard_size)
+        data = torch.from_numpy(self.shards[shard][row])
+
+        if not self.raw:
+            if self.dtype == np.uint8:
+                data = data.float() / 255
+            else:
+                data = data.float()
+
+        return (data, torch.from_numpy(self.labels[idx]), idx)
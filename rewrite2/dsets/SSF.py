@@ -6,14 +6,15 @@ import csv
 from random import Random
 from sys import maxsize
 import torchvision.io as io
+from dsets import decode, splits, records
 
 class SSF_reg(Dataset):
-    def __init__(self, dataset_dir, transformer, max_ten_plus=99999999):
+    def __init__(self, dataset_dir, transformer, max_ten_plus=99999999, uint8=False):
         self.transformer = transformer
+        self.uint8 = uint8
 
-        if type(dataset_dir) is tuple:
-            self.files = dataset_dir[0]
-            self.labels = dataset_dir[1]
+        if isinstance(dataset_dir, (tuple, splits.IndexView)):
+            records.store(self, *splits.unpack(dataset_dir))
             return
         
         tmp_files = glob(path.normpath(dataset_dir + '/**/*.jpg'), recursive=True)
@@ -45,6 +46,8 @@ class SSF_reg(Dataset):
                 self.files.append(img_path)
                 self.labels.append(torch.Tensor([vis]).float())
 
+        records.store(self, self.files, self.labels)
+
     def __len__(self):
         return len(self.files)
     
@@ -53,22 +56,28 @@ class SSF_reg(Dataset):
             idx = idx.tolist()
             
         img_path =  self.files[idx]
-        data = io.read_image(img_path, io.ImageReadMode.RGB)/255
+        data = decode.read_image(img_path, self.uint8)
         
         data = self.transformer(data)
-        data = data.float()
+        data = decode.finish(data, self.uint8)
 
-        label = self.labels[idx]
+        label = torch.from_numpy(self.labels[idx])
         
         return (data, label)
-        
+
+    def __getitems__(self, indices):
+        img_paths = [self.files[idx] for idx in indices]
+        data = decode.fetch_batch(img_paths, self.transformer, self.uint8)
+
+        return [(d, torch.from_numpy(self.labels[idx])) for d, idx in zip(data, indices)]
+
 class SSF_cls_10(Dataset):
-    def __init__(self, dataset_dir, transformer, limits=dict()):
+    def __init__(self, dataset_dir, transformer, limits=dict(), uint8=False):
         self.transformer = transformer
+        self.uint8 = uint8
 
-        if type(dataset_dir) is tuple:
-            self.files = dataset_dir[0]
-            self.labels = dataset_dir[1]
+        if isinstance(dataset_dir, (tuple, splits.IndexView)):
+            records.store(self, *splits.unpack(dataset_dir))
             return
         
         tmp_files = glob(path.normpath(dataset_dir + '/**/*.jpg'), recursive=True)
@@ -135,6 +144,8 @@ class SSF_cls_10(Dataset):
             else:
                 self.files.append(img_path)
                 self.labels.append(label)
+
+        records.store(self, self.files, self.labels)
                 
     def __len__(self):
         return len(self.files)
@@ -144,11 +155,17 @@ class SSF_cls_10(Dataset):
             idx = idx.tolist()
             
         img_path =  self.files[idx]
-        data = io.read_image(img_path, io.ImageReadMode.RGB)/255
+        data = decode.read_image(img_path, self.uint8)
         
         data = self.transformer(data)
-        data = data.float()
+        data = decode.finish(data, self.uint8)
 
-        label = torch.tensor(self.labels[idx]).float()
+        label = torch.from_numpy(self.labels[idx])
         
-        return (data, label, img_path)
\ No newline at end of file
+        return (data, label, idx)
+
+    def __getitems__(self, indices):
+        img_paths = [self.files[idx] for idx in indices]
+        data = decode.fetch_batch(img_paths, self.transformer, self.uint8)
+
+        return [(d, torch.from_numpy(self.labels[idx]), idx) for d, idx in zip(data, indices)]
@@ -1,4 +1,4 @@
-from dsets import SSF, Webcams
+from dsets import SSF, Webcams, splits, records
 import sys
 import io
 from random import Random
@@ -11,9 +11,12 @@ from torch.utils.data import Dataset
 #I think it would work
 
 class WebcamsSSF_cls_10(Dataset):
-    def __init__(self, dataset_dir, transformer, limits=(dict(), dict())):
+    def __init__(self, dataset_dir, transformer, limits=(dict(), dict()), uint8=False):
         self.transformer = transformer
 
+        if isinstance(dataset_dir, splits.IndexView):
+            dataset_dir = splits.unpack(dataset_dir)[:2]
+
         if type(dataset_dir) is tuple:
             if type(dataset_dir[0]) is list:
                 tmp_files = dataset_dir[0]
@@ -37,8 +40,8 @@ class WebcamsSSF_cls_10(Dataset):
                     else:
                         sys.exit("how")
 
-                self.webcams = Webcams.Webcams_cls_10((webcams_files, webcams_labels), transformer=transformer)
-                self.ssf = SSF.SSF_cls_10((ssf_files, ssf_labels), transformer=transformer)
+                self.webcams = Webcams.Webcams_cls_10((webcams_files, webcams_labels), transformer=transformer, uint8=uint8)
+                self.ssf = SSF.SSF_cls_10((ssf_files, ssf_labels), transformer=transformer, uint8=uint8)
 
                 for i in range(len(self.webcams.files)):
                     self.files.append((i, self.webcams.files[i], 'webcams'))
@@ -51,8 +54,8 @@ class WebcamsSSF_cls_10(Dataset):
             elif type(dataset_dir[0]) is str:
                 self.files = []
                 self.labels = []
-                self.webcams = Webcams.Webcams_cls_10(dataset_dir[0], transformer=transformer, limits=limits[0])
-                self.ssf = SSF.SSF_cls_10(dataset_dir[1], transformer=transformer, limits=limits[1])
+                self.webcams = Webcams.Webcams_cls_10(dataset_dir[0], transformer=transformer, limits=limits[0], uint8=uint8)
+                self.ssf = SSF.SSF_cls_10(dataset_dir[1], transformer=transformer, limits=limits[1], uint8=uint8)
 
                 for i in range(len(self.webcams.files)):
                     self.files.append((i, self.webcams.files[i], 'webcams'))
@@ -67,6 +70,9 @@ class WebcamsSSF_cls_10(Dataset):
 
         Random(36).shuffle(self.files)
         Random(36).shuffle(self.labels)
+        #files stay (index, path, source) tuples, the paths themselves live in the two datasets
+        self.labels = records.label_array(self.labels)
+        records.describe(self, [f[1] for f in self.files])
                 
     def __len__(self):
         return len(self.files)
@@ -80,5 +86,6 @@ class WebcamsSSF_cls_10(Dataset):
             item = self.webcams.__getitem__(img_path[0])
         else:
             item = self.ssf.__getitem__(img_path[0])
-        
-        return item
\ No newline at end of file
+
+        #the child's id is its own row, hand out ours
+        return (*item[:2], idx)
\ No newline at end of file
@@ -1,60 +1,89 @@
 import torch
 from torch.utils.data import Dataset
-from glob import glob
 from os import path
 import torchvision.io as io
 import torchvision.transforms.functional as f
 from random import Random
 from math import ceil
+import numpy as np
+from dsets import manifest, decode, splits, records
+
+CLS_15 = {1.0:0, 1.25:1, 1.5:2, 1.75:3, 2.0:4, 2.25:5, 2.5:6, 3.0:7, 4.0:8, 5.0:9, 6.0:10, 7.0:11, 8.0:12, 9.0:13, 10.0:14}
+CLS_10 = {1.0:0, 1.25:0, 1.75:1, 2.0:1, 2.25:1, 3.0:2, 4.0:3, 5.0:4, 6.0:5, 7.0:6, 8.0:7, 9.0:8, 10.0:9}
+CLS_10_FULL = {1.0:0, 1.25:0, 1.5:0, 1.75:1, 2.0:1, 2.25:1, 2.5:1, 3.0:2, 4.0:3, 5.0:4, 6.0:5, 7.0:6, 8.0:7, 9.0:8, 10.0:9}
+
+def _load_records(dataset_dir, exts, manifest_path=None, refresh_manifest=False):
+    #files, visibilities, site ids and orientations in the same order the old sort + Random(36).shuffle gave
+    if isinstance(dataset_dir, list):
+        files = np.array(sorted(dataset_dir), dtype=str)
+        parsed = [manifest.parse_name(path.basename(p)) for p in files.tolist()]
+        values = np.array([p[2] for p in parsed], dtype=np.float64)
+        sites = np.array([p[0] for p in parsed], dtype=str)
+        orientations = np.array([p[1] for p in parsed], dtype=np.int32)
+    else:
+        index = manifest.load_manifest(dataset_dir, manifest_path, refresh_manifest)
+        keep = index.with_ext(exts)
+        files = index.path[keep]
+        values = index.visibility[keep]
+        sites = index.site[keep]
+        orientations = index.orientation[keep]
+
+    order = _shuffled_order(len(files))
+    return files[order], values[order], sites[order], orientations[order]
+
+def _shuffled_order(n):
+    #Random.shuffle only depends on the length, so shuffling indices reproduces the old file order
+    order = list(range(n))
+    Random(36).shuffle(order)
+    return np.array(order, dtype=np.int64)
+
+def _class_codes(values, table):
+    codes = np.full(len(values), -1, dtype=np.int64)
+    for value, class_index in table.items():
+        codes[values == value] = class_index
+    return codes
+
+def _limit_mask(values, limits, mask):
+    #keeps the first limits[value] rows (in file order) of each limited value
+    mask = mask.copy()
+    for value, limit in limits.items():
+        idx = np.flatnonzero(mask & (values == value))
+        mask[idx[limit:]] = False
+    return mask
+
+def _one_hot(codes, num_classes):
+    return np.eye(num_classes, dtype=np.float32)[codes]
+
+def _border_box(height, width):
+    #Remove 12.81% top, 3 bottom, 3 left, 3 right
+    crop_top = ceil(0.1281 * height)
+    crop_bot = 3
+    sub_vert = crop_top + crop_bot
+    return (crop_top, 2, height-sub_vert, width-6)
+
+def _crop_borders(data):
+    return f.crop(data, *_border_box(data.size(1), data.size(2)))
 
 class Webcams_reg(Dataset):
-    def __init__(self, dataset_dir, transformer, limits=dict(), site_filter=None):
+    def __init__(self, dataset_dir, transformer, limits=dict(), site_filter=None, manifest_path=None, refresh_manifest=False, uint8=False):
         self.transformer = transformer
+        self.uint8 = uint8
 
-        if type(dataset_dir) is tuple:
-            self.files = dataset_dir[0]
-            self.labels = dataset_dir[1]
+        if isinstance(dataset_dir, (tuple, splits.IndexView)):
+            records.store(self, *splits.unpack(dataset_dir))
             return
         
-        tmp_files = glob(path.normpath(dataset_dir + '/**/*.png'), recursive=True) + \
-            glob(path.normpath(dataset_dir + '/**/*.jpg'), recursive=True)
-        self.files = []
-        self.labels = []
-        
-        tmp_files.sort()
-        Random(36).shuffle(tmp_files)
-        
-        counts = dict.fromkeys(limits, 0)
-        
-        for i in range(len(tmp_files)):
-            img_path = tmp_files[i]
-            site_id = path.basename(img_path).split('_')[0]
-            if site_filter is not None and site_id not in site_filter:
-                continue
-
-            string_value = path.basename(img_path)
-            string_value = string_value.split('_')[2].split('.')[0].split('S')[1].split('m')[0].replace('-', '.')
-            if string_value == '10+':
-                float_value = 10.0
-            else:
-                float_value = float(string_value)
-                if float_value > 10.0:
-                    float_value = 10.0
-            
-            if float_value in limits:
-                if counts[float_value] < limits[float_value]:
-                    self.files.append(img_path)
-                    self.labels.append(torch.Tensor([float_value]).float())
-                    counts[float_value] += 1
-            else:
-                self.files.append(img_path)
-                self.labels.append(torch.Tensor([float_value]).float())
-
-        Random(36).shuffle(self.files)
-        Random(36).shuffle(self.labels)
+        files, values, sites, orientations = _load_records(dataset_dir, ('.png', '.jpg'), manifest_path, refresh_manifest)
+        values = np.minimum(values, 10.0)
+
+        keep = ~np.isnan(values)
+        if site_filter is not None:
+            keep &= np.isin(sites, list(site_filter))
+        keep = _limit_mask(values, limits, keep)
+
+        order = _shuffled_order(int(keep.sum()))
+        records.store(self, files[keep][order], values[keep][order].reshape(-1, 1), sites[keep][order], orientations[keep][order])
 
-        
-                
     def __len__(self):
         return len(self.files)
     
@@ -63,94 +92,36 @@ class Webcams_reg(Dataset):
             idx = idx.tolist()
             
         img_path =  self.files[idx]
-        data = io.read_image(img_path, io.ImageReadMode.RGB)/255
-        
-        #Remove 12.81% top, 3 bottom, 3 left, 3 right
-        crop_top = ceil(0.1281 * data.size(1))
-        crop_bot = 3
-        sub_vert = crop_top + crop_bot
-        dims = (data.size(1)-sub_vert, data.size(2)-6)
-        data = f.crop(data, crop_top, 2, dims[0], dims[1])
+        data = decode.read_image(img_path, self.uint8)
+        data = _crop_borders(data)
         data = self.transformer(data)
-        data = data.float()
+        data = decode.finish(data, self.uint8)
+
+        label = torch.from_numpy(self.labels[idx])
+        return (data, label, idx)
+
+    def __getitems__(self, indices):
+        img_paths = [self.files[idx] for idx in indices]
+        data = decode.fetch_batch(img_paths, self.transformer, self.uint8, _border_box)
+
+        return [(d, torch.from_numpy(self.labels[idx]), idx) for d, idx in zip(data, indices)]
 
-        label = self.labels[idx]  # already a Tensor([x]) from __init__
-        return (data, label, img_path)
-    
 class Webcams_cls(Dataset):
-    def __init__(self, dataset_dir, transformer, limits=dict()):
+    def __init__(self, dataset_dir, transformer, limits=dict(), manifest_path=None, refresh_manifest=False, uint8=False):
         self.transformer = transformer
+        self.uint8 = uint8
 
-        if type(dataset_dir) is tuple:
-            self.files = dataset_dir[0]
-            self.labels = dataset_dir[1]
+        if isinstance(dataset_dir, (tuple, splits.IndexView)):
+            records.store(self, *splits.unpack(dataset_dir))
             return
         
-        tmp_files = glob(path.normpath(dataset_dir + '/**/*.png'), recursive=True)
-            
-        self.files = []
-        self.labels = []
-        
-        tmp_files.sort()
-        Random(36).shuffle(tmp_files)
-        
-        counts = dict.fromkeys(limits, 0)
-        
-        for i in range(len(tmp_files)):
-            img_path = tmp_files[i]
-            string_value = path.basename(img_path)
-            string_value = string_value.split('_')[2].split('.')[0].split('S')[1].split('m')[0].replace('-', '.')
-            if string_value == '10+':
-                float_value = 10.0
-            else:
-                float_value = float(string_value)
-            float_value = min(float_value, 10.0)
-                
-            match float_value:
-                case 1.0:
-                    class_index = 0
-                case 1.25:
-                    class_index = 1
-                case 1.5:
-                    class_index = 2
-                case 1.75:
-                    class_index = 3
-                case 2.0:
-                    class_index = 4
-                case 2.25:
-                    class_index = 5
-                case 2.5:
-                    class_index = 6
-                case 3.0:
-                    class_index = 7
-                case 4.0:
-                    class_index = 8
-                case 5.0:
-                    class_index = 9
-                case 6.0:
-                    class_index = 10
-                case 7.0:
-                    class_index = 11
-                case 8.0:
-                    class_index = 12
-                case 9.0:
-                    class_index = 13
-                case 10.0:
-                    class_index = 14
-            
-            label = torch.zeros((15)).float()
-            label[class_index] = 1.0
-            
-            if float_value in limits:
-                if counts[float_value] < limits[float_value]:
-                    self.files.append(img_path)
-                    self.labels.append(label)
-                    counts[float_value] += 1
-            else:
-                self.files.append(img_path)
-                self.labels.append(label)
-
-                
+        files, values, sites, orientations = _load_records(dataset_dir, ('.png',), manifest_path, refresh_manifest)
+        values = np.minimum(values, 10.0)
+        codes = _class_codes(values, CLS_15)
+
+        keep = _limit_mask(values, limits, codes >= 0)
+        records.store(self, files[keep], _one_hot(codes[keep], 15), sites[keep], orientations[keep])
+
     def __len__(self):
         return len(self.files)
     
@@ -159,98 +130,41 @@ class Webcams_cls(Dataset):
             idx = idx.tolist()
             
         img_path =  self.files[idx]
-        data = io.read_image(img_path, io.ImageReadMode.RGB)/255
-        
-        #Remove 12.81% top, 3 bottom, 3 left, 3 right
-        crop_top = ceil(0.1281 * data.size(1))
-        crop_bot = 3
-        sub_vert = crop_top + crop_bot
-        dims = (data.size(1)-sub_vert, data.size(2)-6)
-        data = f.crop(data, crop_top, 2, dims[0], dims[1])
+        data = decode.read_image(img_path, self.uint8)
+        data = _crop_borders(data)
         data = self.transformer(data)
-        data = data.float()
+        data = decode.finish(data, self.uint8)
 
-        label = torch.Tensor(self.labels[idx])
+        label = torch.from_numpy(self.labels[idx])
         
-        return (data, label, img_path)
+        return (data, label, idx)
 
-class Webcams_cls_10(Dataset):
-    def __init__(self, dataset_dir, transform=lambda x, augment:x, augment=False, limits=dict(), site_filter=None):
-        from glob import glob
-        from random import Random
+    def __getitems__(self, indices):
+        img_paths = [self.files[idx] for idx in indices]
+        data = decode.fetch_batch(img_paths, self.transformer, self.uint8, _border_box)
 
-        if isinstance(dataset_dir, list):
-            tmp_files = dataset_dir
-        else: 
-            tmp_files = glob(path.normpath(dataset_dir + '/**/*.png'), recursive=True)
+        return [(d, torch.from_numpy(self.labels[idx]), idx) for d, idx in zip(data, indices)]
 
-        self.files = []
-        self.labels = []
+class Webcams_cls_10(Dataset):
+    def __init__(self, dataset_dir, transform=lambda x, augment:x, augment=False, limits=dict(), site_filter=None,
+                 manifest_path=None, refresh_manifest=False, uint8=False):
         self.transform = transform
         self.augment = augment
+        self.uint8 = uint8
+
+        files, values, sites, orientations = _load_records(dataset_dir, ('.png',), manifest_path, refresh_manifest)
+        values = np.minimum(values, 10.0)
+        # values like 1.5 and 2.5 and malformed filenames are skipped
+        codes = _class_codes(values, CLS_10)
+        # 1.25 counts as 1.0 and 1.75/2.25 as 2.0 for the limits
+        values = codes + 1.0
 
-        tmp_files.sort()
-        Random(36).shuffle(tmp_files)
-
-        counts = dict.fromkeys(limits, 0)
-
-        for img_path in tmp_files:
-            fname = path.basename(img_path)
-
-            site_id = fname.split('_')[0]
-            if site_filter is not None and site_id not in site_filter:
-                continue
-
-            try:
-                vis_token = fname.split('_')[2].split('.')[0]
-                string_value = vis_token.split('S')[1].split('m')[0].replace('-', '.')
-                if string_value == '10+':
-                    float_value = 10.0
-                else:
-                    float_value = float(string_value)
-                float_value = min(float_value, 10.0)
-                if float_value == 0.0:
-                    continue
-            except:
-                continue  # skip malformed filenames
-
-            match float_value:
-                case 1.0 | 1.25:
-                    class_index = 0
-                    float_value = 1.0
-                case 1.75 | 2.0 | 2.25:
-                    class_index = 1
-                    float_value = 2.0
-                case 3.0:
-                    class_index = 2
-                case 4.0:
-                    class_index = 3
-                case 5.0:
-                    class_index = 4
-                case 6.0:
-                    class_index = 5
-                case 7.0:
-                    class_index = 6
-                case 8.0:
-                    class_index = 7
-                case 9.0:
-                    class_index = 8
-                case 10.0:
-                    class_index = 9
-                case _:
-                    continue  # skip values like 1.5, 2.5
-
-            label = torch.zeros((10)).float()
-            label[class_index] = 1.0
-
-            if float_value in limits:
-                if counts[float_value] < limits[float_value]:
-                    self.files.append(img_path)
-                    self.labels.append(label)
-                    counts[float_value] += 1
-            else:
-                self.files.append(img_path)
-                self.labels.append(label)
+        keep = codes >= 0
+        if site_filter is not None:
+            keep &= np.isin(sites, list(site_filter))
+        keep = _limit_mask(values, limits, keep)
+
+        records.store(self, files[keep], _one_hot(codes[keep], 10), sites[keep], orientations[keep])
 
     def __len__(self):
         return len(self.files)
@@ -259,69 +173,35 @@ class Webcams_cls_10(Dataset):
         if torch.is_tensor(idx):
             idx = idx.tolist()
         img_path = self.files[idx]
-        data = io.read_image(img_path, io.ImageReadMode.RGB)/255
+        data = decode.read_image(img_path, self.uint8)
+        data = _crop_borders(data)
+        data = decode.finish(self.transform(data, self.augment), self.uint8)
+
+        return (data, torch.from_numpy(self.labels[idx]), idx)
 
-        # Remove borders
-        crop_top = ceil(0.1281 * data.size(1))
-        crop_bot = 3
-        sub_vert = crop_top + crop_bot
-        dims = (data.size(1)-sub_vert, data.size(2)-6)
-        data = f.crop(data, crop_top, 2, dims[0], dims[1])
-        data = self.transform(data, self.augment).float()
+    def __getitems__(self, indices):
+        img_paths = [self.files[idx] for idx in indices]
+        data = decode.fetch_batch(img_paths, lambda x: self.transform(x, self.augment), self.uint8, _border_box)
 
-        return (data, self.labels[idx], self.files[idx])
+        return [(d, torch.from_numpy(self.labels[idx]), idx) for d, idx in zip(data, indices)]
 
 class Webcams_cls_5(Dataset):
-    def __init__(self, dataset_dir, transformer, limits=dict()):
+    def __init__(self, dataset_dir, transformer, limits=dict(), manifest_path=None, refresh_manifest=False, uint8=False):
         self.transformer = transformer
+        self.uint8 = uint8
 
-        if type(dataset_dir) is tuple:
-            self.files = dataset_dir[0]
-            self.labels = dataset_dir[1]
+        if isinstance(dataset_dir, (tuple, splits.IndexView)):
+            records.store(self, *splits.unpack(dataset_dir))
             return
         
-        tmp_files = glob(path.normpath(dataset_dir + '/**/*.png'), recursive=True)
-        self.files = []
-        self.labels = []
-        
-        tmp_files.sort()
-        Random(36).shuffle(tmp_files)
-        
-        counts = dict.fromkeys(limits, 0)
-        
-        for i in range(len(tmp_files)):
-            img_path = tmp_files[i]
-            string_value = path.basename(img_path)
-            string_value = string_value.split('_')[2].split('.')[0].split('S')[1].split('m')[0].replace('-', '.')
-            if string_value == '10+':
-                float_value = 10.0
-            else:
-                float_value = float(string_value)
-            float_value = min(float_value, 10.0)
-            
-            if float_value <= 2.5:
-                class_index = 0
-            elif float_value <= 4.0:
-                class_index = 1
-            elif 5.0 <= float_value <= 6.0:
-                class_index = 2
-            elif 7.0 <= float_value <= 8.0:
-                class_index = 3
-            else:
-                class_index = 4
-                
-            label = torch.zeros((5)).float()
-            label[class_index] = 1.0
-            
-            if float_value in limits:
-                if counts[float_value] < limits[float_value]:
-                    self.files.append(img_path)
-                    self.labels.append(label)
-                    counts[float_value] += 1
-            else:
-                self.files.append(img_path)
-                self.labels.append(label)
-                
+        files, values, sites, orientations = _load_records(dataset_dir, ('.png',), manifest_path, refresh_manifest)
+        values = np.minimum(values, 10.0)
+        codes = np.select([values <= 2.5, values <= 4.0, (5.0 <= values) & (values <= 6.0), (7.0 <= values) & (values <= 8.0)],
+                          [0, 1, 2, 3], 4)
+
+        keep = _limit_mask(values, limits, ~np.isnan(values))
+        records.store(self, files[keep], _one_hot(codes[keep], 5), sites[keep], orientations[keep])
+
     def __len__(self):
         return len(self.files)
     
@@ -330,133 +210,73 @@ class Webcams_cls_5(Dataset):
             idx = idx.tolist()
             
         img_path =  self.files[idx]
-        data = io.read_image(img_path, io.ImageReadMode.RGB)/255
-        
-        #Remove 12.81% top, 3 bottom, 3 left, 3 right
-        crop_top = ceil(0.1281 * data.size(1))
-        crop_bot = 3
-        sub_vert = crop_top + crop_bot
-        dims = (data.size(1)-sub_vert, data.size(2)-6)
-        data = f.crop(data, crop_top, 2, dims[0], dims[1])
+        data = decode.read_image(img_path, self.uint8)
+        data = _crop_borders(data)
         data = self.transformer(data)
-        data = data.float()
+        data = decode.finish(data, self.uint8)
 
-        label = torch.tensor(self.labels[idx]).float()
+        label = torch.from_numpy(self.labels[idx])
         
-        return (data, label, img_path)
+        return (data, label, idx)
+
+    def __getitems__(self, indices):
+        img_paths = [self.files[idx] for idx in indices]
+        data = decode.fetch_batch(img_paths, self.transformer, self.uint8, _border_box)
+
+        return [(d, torch.from_numpy(self.labels[idx]), idx) for d, idx in zip(data, indices)]
 
 class Webcams_cls_3(Dataset):
-    def __init__(self, dataset_dir, transformer, limits=dict()):
+    def __init__(self, dataset_dir, transformer, limits=dict(), manifest_path=None, refresh_manifest=False, uint8=False):
         self.transformer = transformer
+        self.uint8 = uint8
 
-        if type(dataset_dir) is tuple:
-            self.files = dataset_dir[0]
-            self.labels = dataset_dir[1]
+        if isinstance(dataset_dir, (tuple, splits.IndexView)):
+            records.store(self, *splits.unpack(dataset_dir))
             return
         
-        tmp_files = glob(path.normpath(dataset_dir + '/**/*.png'), recursive=True)
-        self.files = []
-        self.labels = []
-        
-        tmp_files.sort()
-        Random(36).shuffle(tmp_files)
-        
-        counts = dict.fromkeys(limits, 0)
-        
-        for i in range(len(tmp_files)):
-            img_path = tmp_files[i]
-            string_value = path.basename(img_path)
-            string_value = string_value.split('_')[2].split('.')[0].split('S')[1].split('m')[0].replace('-', '.')
-            if string_value == '10+':
-                float_value = 10.0
-            else:
-                float_value = float(string_value)
-            float_value = min(float_value, 10.0)
-            
-            if float_value <= 3.0:
-                class_index = 0
-            elif float_value <= 7.0:
-                class_index = 1
-            else:
-                class_index = 2
-                
-            label = torch.zeros((3)).float()
-            label[class_index] = 1.0
-            
-            if float_value in limits:
-                if counts[float_value] < limits[float_value]:
-                    self.files.append(img_path)
-                    self.labels.append(label)
-                    counts[float_value] += 1
-            else:
-                self.files.append(img_path)
-                self.labels.append(label)
-                
+        files, values, sites, orientations = _load_records(dataset_dir, ('.png',), manifest_path, refresh_manifest)
+        values = np.minimum(values, 10.0)
+        codes = np.select([values <= 3.0, values <= 7.0], [0, 1], 2)
+
+        keep = _limit_mask(values, limits, ~np.isnan(values))
+        records.store(self, files[keep], _one_hot(codes[keep], 3), sites[keep], orientations[keep])
+
     def __len__(self):
         return len(self.files)
     
     def __getitem__(self, idx):
         if torch.is_tensor(idx):
             idx = idx.tolist()
-            img_path =  self.files[idx]
-            data = io.read_image(img_path, io.ImageReadMode.RGB)/255
-            crop_top = ceil(0.1281 * data.size(1))
-            crop_bot = 3
-            sub_vert = crop_top + crop_bot
-            dims = (data.size(1)-sub_vert, data.size(2)-6)
-            data = f.crop(data, crop_top, 2, dims[0], dims[1])
-            data = self.transformer(data).float()
-            label = self.labels[idx]  # already a float tensor like torch.Tensor([4.0])
-            return (data, label, img_path)
+        img_path =  self.files[idx]
+        data = decode.read_image(img_path, self.uint8)
+        data = _crop_borders(data)
+        data = decode.finish(self.transformer(data), self.uint8)
+        label = torch.from_numpy(self.labels[idx])
+        return (data, label, idx)
+
+    def __getitems__(self, indices):
+        img_paths = [self.files[idx] for idx in indices]
+        data = decode.fetch_batch(img_paths, self.transformer, self.uint8, _border_box)
+
+        return [(d, torch.from_numpy(self.labels[idx]), idx) for d, idx in zip(data, indices)]
 
 
 class Webcams_cls_3lmh(Dataset):
-    def __init__(self, dataset_dir, transformer, limits=dict()):
+    def __init__(self, dataset_dir, transformer, limits=dict(), manifest_path=None, refresh_manifest=False, uint8=False):
         self.transformer = transformer
+        self.uint8 = uint8
 
-        if type(dataset_dir) is tuple:
-            self.files = dataset_dir[0]
-            self.labels = dataset_dir[1]
+        if isinstance(dataset_dir, (tuple, splits.IndexView)):
+            records.store(self, *splits.unpack(dataset_dir))
             return
         
-        tmp_files = glob(path.normpath(dataset_dir + '/**/*.png'), recursive=True)
-        self.files = []
-        self.labels = []
-        
-        tmp_files.sort()
-        Random(36).shuffle(tmp_files)
-        
-        counts = dict.fromkeys(limits, 0)
-        
-        for i in range(len(tmp_files)):
-            img_path = tmp_files[i]
-            string_value = path.basename(img_path)
-            string_value = string_value.split('_')[2].split('.')[0].split('S')[1].split('m')[0].replace('-', '.')
-            if string_value == '10+':
-                float_value = 10.0
-            else:
-                float_value = float(string_value)
-            float_value = min(float_value, 10.0)
-            
-            if float_value < 3.0:
-                class_index = 0
-            elif float_value < 5.0:
-                class_index = 1
-            else:
-                class_index = 2
-                
-            label = torch.zeros((3)).float()
-            label[class_index] = 1.0
-            
-            if float_value in limits:
-                if counts[float_value] < limits[float_value]:
-                    self.files.append(img_path)
-                    self.labels.append(label)
-                    counts[float_value] += 1
-            else:
-                self.files.append(img_path)
-                self.labels.append(label)
-                
+        files, values, sites, orientations = _load_records(dataset_dir, ('.png',), manifest_path, refresh_manifest)
+        values = np.minimum(values, 10.0)
+        codes = np.select([values < 3.0, values < 5.0], [0, 1], 2)
+
+        keep = _limit_mask(values, limits, ~np.isnan(values))
+        records.store(self, files[keep], _one_hot(codes[keep], 3), sites[keep], orientations[keep])
+
     def __len__(self):
         return len(self.files)
     
@@ -465,66 +285,38 @@ class Webcams_cls_3lmh(Dataset):
             idx = idx.tolist()
             
         img_path =  self.files[idx]
-        data = io.read_image(img_path, io.ImageReadMode.RGB)/255
-        
-        #Remove 12.81% top, 3 bottom, 3 left, 3 right
-        crop_top = ceil(0.1281 * data.size(1))
-        crop_bot = 3
-        sub_vert = crop_top + crop_bot
-        dims = (data.size(1)-sub_vert, data.size(2)-6)
-        data = f.crop(data, crop_top, 2, dims[0], dims[1])
+        data = decode.read_image(img_path, self.uint8)
+        data = _crop_borders(data)
         data = self.transformer(data)
-        data = data.float()
+        data = decode.finish(data, self.uint8)
 
-        label = torch.tensor(self.labels[idx]).float()
+        label = torch.from_numpy(self.labels[idx])
         
-        return (data, label, img_path)
+        return (data, label, idx)
+
+    def __getitems__(self, indices):
+        img_paths = [self.files[idx] for idx in indices]
+        data = decode.fetch_batch(img_paths, self.transformer, self.uint8, _border_box)
+
+        return [(d, torch.from_numpy(self.labels[idx]), idx) for d, idx in zip(data, indices)]
 
 class Webcams_cls_1_10(Dataset):
-    def __init__(self, dataset_dir, transformer, limits=dict()):
+    def __init__(self, dataset_dir, transformer, limits=dict(), manifest_path=None, refresh_manifest=False, uint8=False):
         self.transformer = transformer
+        self.uint8 = uint8
 
-        if type(dataset_dir) is tuple:
-            self.files = dataset_dir[0]
-            self.labels = dataset_dir[1]
+        if isinstance(dataset_dir, (tuple, splits.IndexView)):
+            records.store(self, *splits.unpack(dataset_dir))
             return
 
 
-        tmp_files = glob(path.normpath(dataset_dir + '/**/*.png'), recursive=True)
-        self.files = []
-        self.labels = []
-        
-        tmp_files.sort()
-        Random(36).shuffle(tmp_files)
-        
-        counts = dict.fromkeys(limits, 0)
-        
-        for i in range(len(tmp_files)):
-            img_path = tmp_files[i]
-            string_value = path.basename(img_path)
-            string_value = string_value.split('_')[2].split('.')[0].split('S')[1].split('m')[0].replace('-', '.')
-            float_value = float(string_value)
-            float_value = min(float_value, 10.0)
-            
-            if float_value <= 1.25:
-                class_index = 0
-            elif float_value >= 10.0:
-                class_index = 1
-            else:
-                continue
-                
-            label = torch.zeros((2)).float()
-            label[class_index] = 1.0
-            
-            if float_value in limits:
-                if counts[float_value] < limits[float_value]:
-                    self.files.append(img_path)
-                    self.labels.append(label)
-                    counts[float_value] += 1
-            else:
-                self.files.append(img_path)
-                self.labels.append(label)     
-                
+        files, values, sites, orientations = _load_records(dataset_dir, ('.png',), manifest_path, refresh_manifest)
+        values = np.minimum(values, 10.0)
+        codes = np.select([values <= 1.25, values >= 10.0], [0, 1], -1)
+
+        keep = _limit_mask(values, limits, codes >= 0)
+        records.store(self, files[keep], _one_hot(codes[keep], 2), sites[keep], orientations[keep])
+
     def __len__(self):
         return len(self.files)
     
@@ -533,115 +325,53 @@ class Webcams_cls_1_10(Dataset):
             idx = idx.tolist()
             
         img_path =  self.files[idx]
-        data = io.read_image(img_path, io.ImageReadMode.RGB)/255
-        
-        #Remove 12.81% top, 3 bottom, 3 left, 3 right
-        crop_top = ceil(0.1281 * data.size(1))
-        crop_bot = 3
-        sub_vert = crop_top + crop_bot
-        dims = (data.size(1)-sub_vert, data.size(2)-6)
-        data = f.crop(data, crop_top, 2, dims[0], dims[1])
+        data = decode.read_image(img_path, self.uint8)
+        data = _crop_borders(data)
         data = self.transformer(data)
-        data = data.float()
+        data = decode.finish(data, self.uint8)
 
-        label = self.labels[idx]
+        label = torch.from_numpy(self.labels[idx])
         
         return (data, label)
 
+    def __getitems__(self, indices):
+        img_paths = [self.files[idx] for idx in indices]
+        data = decode.fetch_batch(img_paths, self.transformer, self.uint8, _border_box)
+
+        return [(d, torch.from_numpy(self.labels[idx])) for d, idx in zip(data, indices)]
+
 class Webcams_cls_10_full(Dataset):
-    def __init__(self, dataset_dir, transformer, limits=dict()):
+    def __init__(self, dataset_dir, transformer, limits=dict(), manifest_path=None, refresh_manifest=False, uint8=False):
         self.transformer = transformer
+        self.uint8 = uint8
 
-        if type(dataset_dir) is tuple:
-            self.files = dataset_dir[0]
-            self.labels = dataset_dir[1]
+        if isinstance(dataset_dir, (tuple, splits.IndexView)):
+            records.store(self, *splits.unpack(dataset_dir))
             return
         
-        tmp_files = glob(path.normpath(dataset_dir + '/**/*.png'), recursive=True)
-        self.files = []
-        self.labels = []
+        files, values, sites, orientations = _load_records(dataset_dir, ('.png',), manifest_path, refresh_manifest)
+        values = np.minimum(values, 10.0)
+        codes = _class_codes(values, CLS_10_FULL)
+
+        keep = _limit_mask(values, limits, codes >= 0)
+        records.store(self, files[keep], _one_hot(codes[keep], 10), sites[keep], orientations[keep])
 
-        tmp_files.sort()
-        Random(36).shuffle(tmp_files)
-        
-        counts = dict.fromkeys(limits, 0)
-        
-        for i in range(len(tmp_files)):
-            img_path = tmp_files[i]
-            string_value = path.basename(img_path)
-            string_value = string_value.split('_')[2].split('.')[0].split('S')[1].split('m')[0].replace('-', '.')
-            if string_value == '10+':
-                float_value = 10.0
-            else:
-                float_value = float(string_value)
-            float_value = min(float_value, 10.0)
-
-            if float_value == 0.0:
-                continue
-
-            match float_value:
-                case 1.0:
-                    class_index = 0
-                case 1.25:
-                    class_index = 0
-                    # float_value = 1.0
-                case 1.5:
-                    class_index = 0
-                case 1.75:
-                    class_index = 1
-                    # float_value = 2.0
-                case 2.0:
-                    class_index = 1
-                case 2.25:
-                    class_index = 1
-                    # float_value = 2.0
-                case 2.5:
-                    class_index = 1
-                case 3.0:
-                    class_index = 2
-                case 4.0:
-                    class_index = 3
-                case 5.0:
-                    class_index = 4
-                case 6.0:
-                    class_index = 5
-                case 7.0:
-                    class_index = 6
-                case 8.0:
-                    class_index = 7
-                case 9.0:
-                    class_index = 8
-                case 10.0:
-                    class_index = 9
-
-            label = torch.zeros((10)).float()
-            label[class_index] = 1.0
-            
-            if float_value in limits:
-                if counts[float_value] < limits[float_value]:
-                    self.files.append(img_path)
-                    self.labels.append(label)
-                    counts[float_value] += 1
-            else:
-                self.files.append(img_path)
-                self.labels.append(label)
-                
     def __len__(self):
         return len(self.files)
     
     def __getitem__(self, idx):
         img_path = self.files[idx]
-        data = io.read_image(img_path, io.ImageReadMode.RGB)/255
-        
-        #Remove 12.81% top, 3 bottom, 3 left, 3 right
-        crop_top = ceil(0.1281 * data.size(1))
-        crop_bot = 3
-        sub_vert = crop_top + crop_bot
-        dims = (data.size(1)-sub_vert, data.size(2)-6)
-        data = f.crop(data, crop_top, 2, dims[0], dims[1])
+        data = decode.read_image(img_path, self.uint8)
+        data = _crop_borders(data)
         data = self.transformer(data)
-        data = data.float()
+        data = decode.finish(data, self.uint8)
 
-        label = torch.Tensor(self.labels[idx])
+        label = torch.from_numpy(self.labels[idx])
         
-        return (data, label, img_path)
\ No newline at end of file
+        return (data, label, idx)
+
+    def __getitems__(self, indices):
+        img_paths = [self.files[idx] for idx in indices]
+        data = decode.fetch_batch(img_paths, self.transformer, self.uint8, _border_box)
+
+        return [(d, torch.from_numpy(self.labels[idx]), idx) for d, idx in zip(data, indices)]
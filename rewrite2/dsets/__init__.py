@@ -1 +1 @@
-from . import Webcams, SSF, FROSI, FCS, Jacobs, WebcamSSFCombo
\ No newline at end of file
+from . import Webcams, SSF, FROSI, FCS, Jacobs, WebcamSSFCombo, Materialized, decode, stats, splits, records, collate, cache
\ No newline at end of file
@@ -0,0 +1,179 @@
+import os
+import tempfile
+import numpy as np
+import torch
+
+# Val and test batches only depend on the (deterministic) transformer, so the first full pass
+# over a loader keeps every transformed sample and later passes are served from memory without
+# the loader. Samples are kept as uint8, float16 or float32 in a bank sized by a memory budget,
+# and the first pass already hands out the rounded samples so the metrics don't shift between
+# the first and later evaluations. When the bank is full the least recently used rows are moved
+# to a memmap file, and a row read back from the file is moved into the bank again. Rows keep
+# their place in the file once written, so evicting them again later costs nothing. Labels are
+# small and always stay in memory.
+
+class EvalCache:
+    #wraps a loader of (data, labels, ids) batches, ids being the rows of loader.dataset.
+    #dtype 'uint8' only suits data in [0, 1], 'float16' falls back to float32 when the first
+    #batch is outside its range. uint8 data is always kept as uint8
+    def __init__(self, loader, dtype='float16', budget_mb=2048, spill_dir=None, shuffle=True):
+        self.loader = loader
+        self.dataset = loader.dataset
+        self.count = len(loader.dataset)
+        self.dtype_name = dtype
+        self.budget = int(budget_mb * 2**20)
+        self.spill_dir = spill_dir
+        self.shuffle = shuffle
+
+        self.bank = None
+        self.spill = None
+        self.spill_path = None
+        self.complete = False
+        self.passthrough = False
+        self.batch_size = 0
+        self.tick = 0
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        if self.complete:
+            yield from self._cached()
+            return
+
+        for batch in self.loader:
+            if self.passthrough or len(batch) < 3:
+                #no ids to key the rows by
+                self.passthrough = True
+                yield batch
+                continue
+
+            data, labels, ids = batch[0], batch[1], torch.as_tensor(batch[2]).long().cpu()
+            if self.bank is None:
+                self._allocate(data, labels)
+            self.batch_size = max(self.batch_size, len(ids))
+            self.tick += 1
+
+            encoded = self._encode(data.cpu())
+            new = ~self.stored[ids]
+            if new.any():
+                self._store(ids[new], encoded[new], labels.cpu()[new])
+            decoded = self._decode(encoded)
+            if decoded.data_ptr() == data.data_ptr():
+                #nothing was converted, don't hand out the loader's (possibly reused) buffer
+                decoded = decoded.clone()
+            yield (decoded, *batch[1:])
+
+        self.complete = self.bank is not None and bool(self.stored.all())
+
+    def _cached(self):
+        order = torch.randperm(self.count) if self.shuffle else torch.arange(self.count)
+        for ids in order.split(self.batch_size):
+            self.tick += 1
+            yield self._gather(ids), self.labels[ids], ids
+
+    def _allocate(self, data, labels):
+        self.source_dtype = data.dtype
+        if data.dtype == torch.uint8 or self.dtype_name == 'uint8':
+            self.dtype = torch.uint8
+        elif self.dtype_name == 'float16' and data.abs().max().item() < torch.finfo(torch.float16).max / 2:
+            self.dtype = torch.float16
+        else:
+            if self.dtype_name == 'float16':
+                print('Eval cache data is outside the float16 range, caching as float32')
+            self.dtype = torch.float32
+        self.shape = tuple(data.shape[1:])
+
+        row_bytes = int(np.prod(self.shape)) * torch.empty(0, dtype=self.dtype).element_size()
+        capacity = min(self.count, self.budget // max(row_bytes, 1))
+
+        self.bank = torch.empty((capacity, *self.shape), dtype=self.dtype)
+        self.owner = torch.full((capacity,), -1, dtype=torch.int64)
+        self.last_used = torch.zeros(capacity, dtype=torch.int64)
+        self.slot = torch.full((self.count,), -1, dtype=torch.int64)
+        self.on_disk = torch.zeros(self.count, dtype=torch.bool)
+        self.stored = torch.zeros(self.count, dtype=torch.bool)
+        self.labels = torch.empty((self.count, *labels.shape[1:]), dtype=labels.dtype)
+
+    def _encode(self, data):
+        if self.dtype == torch.uint8 and data.dtype != torch.uint8:
+            return torch.round(torch.clamp(data, 0.0, 1.0) * 255).to(torch.uint8)
+        return data.to(self.dtype)
+
+    def _decode(self, data):
+        if self.dtype == torch.uint8 and self.source_dtype != torch.uint8:
+            return data.float() / 255
+        return data.to(self.source_dtype)
+
+    def _store(self, ids, encoded, labels):
+        self.labels[ids] = labels
+        self._place(ids, encoded)
+        self.stored[ids] = True
+
+    def _gather(self, ids):
+        out = torch.empty((len(ids), *self.shape), dtype=self.dtype)
+        slots = self.slot[ids]
+        hit = slots >= 0
+        out[hit] = self.bank[slots[hit]]
+        self.last_used[slots[hit]] = self.tick
+
+        missed = ids[~hit]
+        if len(missed):
+            rows = torch.from_numpy(self.spill[missed.numpy()])
+            out[~hit] = rows
+            self._place(missed, rows, protect=slots[hit])
+        return self._decode(out)
+
+    def _place(self, ids, data, protect=None):
+        #moves rows ids into the bank, evicting the least recently used rows outside protect.
+        #whatever doesn't fit goes to (or stays in) the spill file
+        protected = 0 if protect is None else len(protect)
+        k = max(0, min(len(ids), len(self.bank) - protected))
+        if k < len(ids):
+            rest = ids[k:]
+            dirty = ~self.on_disk[rest]
+            if dirty.any():
+                self._spill(rest[dirty], data[k:][dirty])
+            ids, data = ids[:k], data[:k]
+        if k == 0:
+            return
+
+        key = self.last_used.clone()
+        key[self.owner < 0] = -1
+        if protect is not None:
+            key[protect] = torch.iinfo(torch.int64).max
+        victims = torch.topk(key, k, largest=False).indices
+
+        evicted = self.owner[victims]
+        evicted = evicted[evicted >= 0]
+        dirty = evicted[~self.on_disk[evicted]]
+        if len(dirty):
+            self._spill(dirty, self.bank[self.slot[dirty]])
+        self.slot[evicted] = -1
+
+        self.bank[victims] = data
+        self.owner[victims] = ids
+        self.slot[ids] = victims
+        self.last_used[victims] = self.tick
+
+    def _spill(self, ids, data):
+        if self.spill is None:
+            if self.spill_dir is not None:
+                os.makedirs(self.spill_dir, exist_ok=True)
+            fd, self.spill_path = tempfile.mkstemp(suffix='.npy', prefix='evalcache_', dir=self.spill_dir)
+            os.close(fd)
+            np_dtype = {torch.uint8: np.uint8, torch.float16: np.float16, torch.float32: np.float32}[self.dtype]
+            self.spill = np.lib.format.open_memmap(self.spill_path, 'w+', np_dtype, (self.count, *self.shape))
+        order = torch.argsort(ids)
+        self.spill[ids[order].numpy()] = data[order].numpy()
+        self.on_disk[ids] = True
+
+    def close(self):
+        #removes the spill file, the cache refills from the loader if iterated again
+        if self.spill is not None:
+            del self.spill
+            self.spill = None
+            os.remove(self.spill_path)
+            self.spill_path = None
+        self.bank = None
+        self.complete = False
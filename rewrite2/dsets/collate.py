@@ -0,0 +1,102 @@
+import torch
+from torch.utils.data import Dataset, DataLoader, Sampler, BatchSampler, RandomSampler, SequentialSampler
+
+# Batches assembled in place in a ring of preallocated buffers instead of new tensors every step.
+# The ring is in shared memory made before the workers start, so a worker stacks its samples
+# straight into the batch's slot and only the slot number goes back through the queue. With
+# CUDA the same pages are page-locked once, so there is no pin_memory copy and .cuda() reads
+# from the slot. Data is handed out as a view of the slot and is only valid until the loader
+# has moved on by a few batches, labels and ids are copied.
+
+class BatchRing:
+    #slots x [batch_size, *sample] buffers for data, labels and ids
+    def __init__(self, slots, batch_size, sample, label):
+        self.data = torch.empty((slots, batch_size, *sample.shape), dtype=sample.dtype).share_memory_()
+        self.labels = torch.empty((slots, batch_size, *label.shape), dtype=label.dtype).share_memory_()
+        self.ids = torch.empty((slots, batch_size), dtype=torch.int64).share_memory_()
+        self.pinned = False
+
+    def __len__(self):
+        return self.data.size(0)
+
+    def pin(self):
+        #registers the shared pages as pinned memory in this process, a no-op without CUDA
+        if self.pinned or not torch.cuda.is_available():
+            return
+        cudart = torch.cuda.cudart()
+        for buffer in (self.data, self.labels, self.ids):
+            torch.cuda.check_error(cudart.cudaHostRegister(buffer.data_ptr(), buffer.numel() * buffer.element_size(), 0))
+        self.pinned = True
+
+    def write(self, slot, items, indices):
+        n = len(items)
+        torch.stack([item[0] for item in items], out=self.data[slot, :n])
+        torch.stack([torch.as_tensor(item[1]) for item in items], out=self.labels[slot, :n])
+        #datasets that don't return their row get the sampler's index
+        ids = [item[2] for item in items] if len(items[0]) > 2 else indices
+        self.ids[slot, :n] = torch.as_tensor(ids, dtype=torch.int64)
+        return n
+
+class _SlotSampler(Sampler):
+    #tags every index of a batch with the ring slot the batch goes to
+    def __init__(self, batch_sampler, slots):
+        self.batch_sampler = batch_sampler
+        self.slots = slots
+
+    def __len__(self):
+        return len(self.batch_sampler)
+
+    def __iter__(self):
+        for step, batch in enumerate(self.batch_sampler):
+            slot = step % self.slots
+            yield [(slot, i) for i in batch]
+
+class _RingFill(Dataset):
+    #runs in the workers: fetches a tagged batch from dset and writes it into its slot
+    def __init__(self, dset, ring):
+        self.dset = dset
+        self.ring = ring
+
+    def __len__(self):
+        return len(self.dset)
+
+    def __getitems__(self, tagged):
+        slot = tagged[0][0]
+        indices = [i for _, i in tagged]
+        if hasattr(self.dset, '__getitems__'):
+            items = self.dset.__getitems__(indices)
+        else:
+            items = [self.dset[i] for i in indices]
+        return slot, self.ring.write(slot, items, indices)
+
+def _slot(batch):
+    #the batch is already in the ring, only (slot, count) is collated
+    return batch
+
+class RingLoader:
+    #drop-in for the DataLoader in main.py: iterates (data, labels, ids) and has .dataset
+    def __init__(self, dset, batch_size, shuffle=False, num_workers=0, pin=False, prefetch_factor=2, drop_last=False):
+        self.dataset = dset
+        self.pin = pin
+
+        #the DataLoader dispatches at most prefetch_factor batches per worker ahead of the one
+        #being used, one more slot covers the batch still being copied to the device
+        in_flight = num_workers * prefetch_factor if num_workers > 0 else 0
+        slots = in_flight + 2
+
+        item = dset[0]
+        self.ring = BatchRing(slots, batch_size, item[0], torch.as_tensor(item[1]))
+
+        sampler = RandomSampler(dset) if shuffle else SequentialSampler(dset)
+        batches = _SlotSampler(BatchSampler(sampler, batch_size, drop_last), slots)
+        self.loader = DataLoader(_RingFill(dset, self.ring), batch_sampler=batches, num_workers=num_workers,
+                                 collate_fn=_slot, prefetch_factor=prefetch_factor if num_workers > 0 else None)
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        if self.pin:
+            self.ring.pin()
+        for slot, n in self.loader:
+            yield self.ring.data[slot, :n], self.ring.labels[slot, :n].clone(), self.ring.ids[slot, :n].clone()
@@ -0,0 +1,142 @@
+import os
+import functools
+import numpy as np
+import torch
+import torchvision.io as io
+import torchvision.transforms.functional as f
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+# Image reading shared by the dataset classes. With uint8=True the image stays uint8 through
+# the border crop and resize and goes through the DataLoader like that, a quarter of the bytes
+# of float32. The float conversion is then done once per batch by to_float, after pinning.
+#
+# read_images and transform_batch back the datasets' __getitems__. The PNG/JPEG decoders
+# release the GIL, so a small thread pool gets several cores decoding even with num workers 0.
+#
+# With SCALED_JPEG the JPEGs are decoded straight at 1/2, 1/4 or 1/8 size (libjpeg DCT scaling
+# through PIL's draft mode), at the smallest scale that still covers the target size. Border
+# crop, center crop and resize are then done once on that small image. The crop geometry only
+# depends on the source resolution, so it's computed once per resolution.
+
+DECODE_THREADS = min(8, os.cpu_count() or 1)
+SCALED_JPEG = False
+JPEG_EXTS = ('.jpg', '.jpeg')
+
+_pool = None
+_pool_pid = None
+
+def _get_pool():
+    #one pool per process, a pool inherited through a DataLoader worker fork has no threads
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool = ThreadPoolExecutor(DECODE_THREADS, thread_name_prefix='decode')
+        _pool_pid = os.getpid()
+    return _pool
+
+def read_image(img_path, uint8=False):
+    data = io.read_image(img_path, io.ImageReadMode.RGB)
+
+    if uint8:
+        return data
+    return data/255
+
+def finish(data, uint8=False):
+    #what __getitem__ hands to the collate function
+    if uint8:
+        return data
+    return data.float()
+
+def to_float(data):
+    #whole batch at once, also takes the fp16 batches of a raw Materialized set
+    if data.dtype == torch.uint8:
+        return data.float() / 255
+    return data.float()
+
+@functools.lru_cache(maxsize=256)
+def crop_geometry(height, width, resize_crop, border_box=None):
+    #(top, left, height, width) of the region that border_box and resize_crop keep, in source
+    #pixels, and the largest power of 2 the source can be shrunk by with that region still
+    #at least resize_crop.dim
+    top, left, h, w = (0, 0, height, width) if border_box is None else border_box(height, width)
+
+    crop = resize_crop.crop_size(h, w)
+    #same rounding as center_crop
+    top += int(round((h - crop[0]) / 2.0))
+    left += int(round((w - crop[1]) / 2.0))
+
+    scale = 1
+    while scale < 8 and crop[0] >= resize_crop.dim[0] * scale * 2 and crop[1] >= resize_crop.dim[1] * scale * 2:
+        scale *= 2
+
+    return (top, left, crop[0], crop[1]), scale
+
+def read_image_resized(img_path, resize_crop, uint8=False, border_box=None):
+    #JPEG only, the result is already cropped and resized to resize_crop.dim
+    with Image.open(img_path) as img:
+        width, height = img.size
+        (top, left, h, w), scale = crop_geometry(height, width, resize_crop, border_box)
+        if scale > 1:
+            img.draft('RGB', (width // scale, height // scale))
+        #draft can round the size up, so use the scale it actually got
+        sy, sx = height / img.size[1], width / img.size[0]
+        data = torch.from_numpy(np.array(img.convert('RGB'))).permute(2, 0, 1)
+
+    data = f.crop(data, round(top / sy), round(left / sx), round(h / sy), round(w / sx))
+    if not uint8:
+        data = data/255
+
+    return f.resize(data, resize_crop.dim)
+
+def _is_scalable(img_path, resize_crop):
+    return SCALED_JPEG and hasattr(resize_crop, 'crop_size') and img_path.lower().endswith(JPEG_EXTS)
+
+def _load(img_path, uint8, border_box, resize_crop):
+    #(image, True if it's already resized)
+    if _is_scalable(img_path, resize_crop):
+        return read_image_resized(img_path, resize_crop, uint8, border_box), True
+
+    data = read_image(img_path, uint8)
+    if border_box is not None:
+        data = f.crop(data, *border_box(data.size(1), data.size(2)))
+    return data, False
+
+def read_images(img_paths, uint8=False, border_box=None, resize_crop=None):
+    load = lambda p: _load(p, uint8, border_box, resize_crop)
+    if DECODE_THREADS <= 1 or len(img_paths) <= 1:
+        return [load(p) for p in img_paths]
+    return list(_get_pool().map(load, img_paths))
+
+def transform_batch(images, transformer, resized=None):
+    #runs transformer over a list of [C, H, W] images. For an image_cropping.Pipeline the resize
+    #crop is done once per group of equally sized images and only the rest is per image.
+    #images flagged in resized skip the resize crop
+    resize_crop = getattr(transformer, 'resize_crop', None)
+    if resize_crop is None:
+        return [transformer(image) for image in images]
+
+    if resized is None:
+        resized = [False] * len(images)
+
+    groups = {}
+    for i, image in enumerate(images):
+        if not resized[i]:
+            groups.setdefault(tuple(image.shape), []).append(i)
+
+    out = list(images)
+    for idx in groups.values():
+        for i, image in zip(idx, resize_crop(torch.stack([images[i] for i in idx]))):
+            out[i] = image
+
+    if transformer.after is not None:
+        out = [transformer.after(image) for image in out]
+
+    return out
+
+def fetch_batch(img_paths, transformer, uint8=False, border_box=None):
+    #__getitems__ body shared by the datasets. border_box(height, width) gives the
+    #(top, left, height, width) to keep of each image, if there's a border to remove
+    loaded = read_images(img_paths, uint8, border_box, getattr(transformer, 'resize_crop', None))
+    images = transform_batch([image for image, _ in loaded], transformer, [resized for _, resized in loaded])
+
+    return [finish(image, uint8) for image in images]
@@ -0,0 +1,247 @@
+import os
+import sys
+import time
+from os import path
+import numpy as np
+
+# Columnar index of every image under a dataset folder so the dataset classes don't have to
+# glob and re-parse the whole tree on every launch. Stored next to the images as an .npz
+# (hidden file, so the old glob based code never picks it up).
+
+MANIFEST_NAME = '.manifest.npz'
+IMAGE_EXTS = ('.png', '.jpg')
+VERSION = 1
+
+def parse_name(fname):
+    #SITE19_ORNT260_VIS4mi.png -> ('SITE19', 260, 4.0), anything malformed gets -1 / nan
+    parts = fname.split('_')
+    site = parts[0]
+
+    try:
+        orientation = int(''.join(c for c in parts[1] if c.isdigit()))
+    except (IndexError, ValueError):
+        orientation = -1
+
+    try:
+        string_value = parts[2].split('.')[0].split('S')[1].split('m')[0].replace('-', '.')
+        if string_value == '10+':
+            visibility = 10.0
+        else:
+            visibility = float(string_value)
+    except (IndexError, ValueError):
+        visibility = float('nan')
+
+    return site, orientation, visibility
+
+class Manifest:
+    def __init__(self, root, columns, dirs, dir_mtimes, dir_parents):
+        self.root = root
+        self.path = columns['path']
+        self.site = columns['site']
+        self.orientation = columns['orientation']
+        self.visibility = columns['visibility']
+        self.folder = columns['folder']
+        self.size = columns['size']
+        self.mtime = columns['mtime']
+
+        self.dirs = dirs
+        self.dir_mtimes = dir_mtimes
+        self.dir_parents = dir_parents
+
+    def __len__(self):
+        return len(self.path)
+
+    def columns(self):
+        return {'path': self.path, 'site': self.site, 'orientation': self.orientation,
+                'visibility': self.visibility, 'folder': self.folder, 'size': self.size,
+                'mtime': self.mtime}
+
+    def with_ext(self, exts):
+        #boolean mask of rows whose file extension is in exts
+        mask = np.zeros(len(self), dtype=bool)
+        lowered = np.char.lower(self.path) if os.name == 'nt' else self.path
+        for ext in exts:
+            mask |= np.char.endswith(lowered, ext)
+        return mask
+
+    def save(self, manifest_path):
+        tmp_path = manifest_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, version=VERSION, root=self.root, dirs=self.dirs, dir_mtimes=self.dir_mtimes,
+                     dir_parents=self.dir_parents, **self.columns())
+        os.replace(tmp_path, manifest_path)
+
+    @staticmethod
+    def load(manifest_path):
+        with np.load(manifest_path) as npz:
+            if int(npz['version']) != VERSION:
+                return None
+            columns = {key: npz[key] for key in ('path', 'site', 'orientation', 'visibility', 'folder', 'size', 'mtime')}
+            return Manifest(str(npz['root']), columns, npz['dirs'], npz['dir_mtimes'], npz['dir_parents'])
+
+class SiteIndex:
+    #integer site codes for image paths, sites numbered in name order. Paths that weren't in
+    #the dataset's file list get a new code the first time they are looked up
+    def __init__(self, files=()):
+        #combined datasets keep (index, path, source) tuples
+        files = [f[1] if isinstance(f, tuple) else f for f in files]
+        names, codes = np.unique(np.array([site_name(p) for p in files], dtype=str), return_inverse=True)
+        self.names = names.tolist()
+        self.name_codes = {name: i for i, name in enumerate(self.names)}
+        self.path_codes = dict(zip(files, codes.tolist()))
+
+    def __len__(self):
+        return len(self.names)
+
+    def _add(self, img_path):
+        name = site_name(img_path)
+        if name not in self.name_codes:
+            self.name_codes[name] = len(self.names)
+            self.names.append(name)
+        self.path_codes[img_path] = self.name_codes[name]
+        return self.path_codes[img_path]
+
+    def codes(self, img_paths):
+        return np.array([self.path_codes[p] if p in self.path_codes else self._add(p) for p in img_paths], dtype=np.int64)
+
+def site_name(img_path):
+    return path.basename(img_path).split('_')[0]
+
+def _is_image(name):
+    return path.normcase(name).endswith(IMAGE_EXTS)
+
+def scan(dataset_dir, previous=None):
+    #walks the tree once. directories whose mtime matches the previous manifest keep their
+    #rows and child list, so a rescan only lists new or changed folders and only stats the
+    #files it hasn't seen before
+    root = path.normpath(dataset_dir)
+
+    old_rows = {}
+    old_children = {}
+    old_mtimes = {}
+    if previous is not None and previous.root == root:
+        file_dirs = np.array([path.dirname(p) for p in previous.path.tolist()], dtype=str)
+        order = np.argsort(file_dirs, kind='stable')
+        starts = np.searchsorted(file_dirs[order], previous.dirs)
+        ends = np.searchsorted(file_dirs[order], previous.dirs, side='right')
+        for i, d in enumerate(previous.dirs.tolist()):
+            old_rows[d] = order[starts[i]:ends[i]]
+            old_mtimes[d] = previous.dir_mtimes[i]
+            old_children[d] = []
+        dirs = previous.dirs.tolist()
+        for i, parent in enumerate(previous.dir_parents.tolist()):
+            if parent >= 0:
+                old_children[dirs[parent]].append(dirs[i])
+
+    new_files = []
+    new_sizes = []
+    new_mtimes = []
+    reused = []
+
+    dirs = []
+    dir_mtimes = []
+    dir_parents = []
+
+    stack = [(root, -1)]
+    while stack:
+        d, parent = stack.pop()
+        try:
+            d_mtime = os.stat(d).st_mtime
+        except OSError:
+            continue
+
+        dir_idx = len(dirs)
+        dirs.append(d)
+        dir_mtimes.append(d_mtime)
+        dir_parents.append(parent)
+
+        if d in old_mtimes and old_mtimes[d] == d_mtime:
+            reused.append(old_rows[d])
+            stack += [(child, dir_idx) for child in old_children[d]]
+            continue
+
+        known = {}
+        if d in old_rows:
+            known = dict(zip(previous.path[old_rows[d]].tolist(), old_rows[d].tolist()))
+
+        children = []
+        kept = []
+        with os.scandir(d) as it:
+            for entry in it:
+                #glob skips hidden files and folders, so do the same
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir():
+                    children.append(entry.path)
+                elif entry.path in known:
+                    kept.append(known[entry.path])
+                elif _is_image(entry.name):
+                    st = entry.stat()
+                    new_files.append(entry.path)
+                    new_sizes.append(st.st_size)
+                    new_mtimes.append(st.st_mtime)
+        if kept:
+            reused.append(np.array(kept, dtype=np.int64))
+        stack += [(child, dir_idx) for child in sorted(children, reverse=True)]
+
+    parsed = [parse_name(path.basename(p)) for p in new_files]
+    columns = {
+        'path': np.array(new_files, dtype=str),
+        'site': np.array([p[0] for p in parsed], dtype=str),
+        'orientation': np.array([p[1] for p in parsed], dtype=np.int32),
+        'visibility': np.array([p[2] for p in parsed], dtype=np.float64),
+        'folder': np.array([path.basename(path.dirname(p)) for p in new_files], dtype=str),
+        'size': np.array(new_sizes, dtype=np.int64),
+        'mtime': np.array(new_mtimes, dtype=np.float64)
+    }
+
+    if reused:
+        rows = np.concatenate(reused)
+        old = previous.columns()
+        for key in columns:
+            columns[key] = np.concatenate((old[key][rows], columns[key]))
+
+    order = np.argsort(columns['path'], kind='stable')
+    columns = {key: value[order] for key, value in columns.items()}
+
+    return Manifest(root, columns, np.array(dirs, dtype=str), np.array(dir_mtimes, dtype=np.float64),
+                    np.array(dir_parents, dtype=np.int32))
+
+def _unchanged(manifest, previous, manifest_path):
+    #same files and folders. Writing the manifest changes the mtime of its own folder, which
+    #alone doesn't make it stale (that folder is just listed again on the next load)
+    if previous is None or previous.root != manifest.root:
+        return False
+    if not (np.array_equal(manifest.path, previous.path) and np.array_equal(manifest.dirs, previous.dirs)):
+        return False
+    same = manifest.dir_mtimes == previous.dir_mtimes
+    same |= manifest.dirs == path.normpath(path.dirname(manifest_path))
+    return bool(same.all())
+
+def load_manifest(dataset_dir, manifest_path=None, refresh=False):
+    #every load rescans the folders whose mtime changed since the stored manifest, refresh
+    #rebuilds it from scratch (for files modified in place, which don't change their folder)
+    root = path.normpath(dataset_dir)
+    if manifest_path is None:
+        manifest_path = path.join(root, MANIFEST_NAME)
+
+    previous = None
+    if path.isfile(manifest_path) and not refresh:
+        previous = Manifest.load(manifest_path)
+
+    manifest = scan(root, previous)
+    if _unchanged(manifest, previous, manifest_path):
+        return manifest
+
+    try:
+        manifest.save(manifest_path)
+    except OSError as e:
+        print(f'Could not write manifest to {manifest_path}: {e}')
+
+    return manifest
+
+if __name__ == '__main__':
+    #python dsets/manifest.py <dataset dir> [manifest path]
+    start = time.time()
+    manifest = load_manifest(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None, refresh=True)
+    print(f'{len(manifest)} images in {len(manifest.dirs)} folders, {time.time() - start:.2f}s')
@@ -0,0 +1,138 @@
+import numpy as np
+import torch
+from torch.utils.data import Subset
+from os import path
+from dsets import manifest
+
+# Per-sample storage for the dataset classes as a few contiguous numpy arrays instead of lists
+# of str and Tensor objects. Forked DataLoader workers only read these, and since reading an
+# array element doesn't touch a per-sample refcount the pages stay shared with the parent
+# instead of being copied into every worker.
+
+class PathArray:
+    #paths packed into one utf-8 byte buffer with int64 offsets, indexes like a list of str
+    def __init__(self, paths=(), buffer=None, offsets=None):
+        if buffer is not None:
+            self.buffer = buffer
+            self.offsets = offsets
+            return
+
+        encoded = [str(p).encode('utf-8') for p in paths]
+        self.offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=self.offsets[1:])
+        self.buffer = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.take(np.arange(len(self))[idx])
+        if isinstance(idx, (list, np.ndarray, torch.Tensor)):
+            return self.take(idx)
+        idx = int(idx)
+        if idx < 0:
+            idx += len(self)
+        return self.buffer[self.offsets[idx]:self.offsets[idx + 1]].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def take(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        starts = self.offsets[indices]
+        lengths = self.offsets[indices + 1] - starts
+
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        #byte positions of every selected path, one gather for the whole buffer
+        positions = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return PathArray(buffer=self.buffer[positions], offsets=offsets)
+
+    def tolist(self):
+        return list(self)
+
+def hash_paths(digest, files):
+    #feeds the paths in order to a hashlib digest. A PathArray hashes its packed buffer and
+    #offsets as they are, without decoding a single path
+    if isinstance(files, PathArray):
+        digest.update(np.ascontiguousarray(files.buffer))
+        digest.update(files.offsets.tobytes())
+    else:
+        #combined datasets keep (index, path, source) tuples
+        digest.update('\0'.join(map(str, files)).encode('utf-8'))
+
+def label_array(labels):
+    #float32 [N, K] (or [N, 1] for regression) from a list of tensors/arrays or an array
+    if isinstance(labels, torch.Tensor):
+        labels = labels.numpy()
+    if isinstance(labels, np.ndarray) and labels.dtype != object:
+        array = labels.astype(np.float32, copy=False)
+    elif len(labels) == 0:
+        array = np.zeros((0, 1), dtype=np.float32)
+    else:
+        array = np.stack([np.asarray(label, dtype=np.float32).reshape(-1) for label in labels])
+    if array.ndim == 1:
+        return array.reshape(-1, 1)
+    return array.reshape(array.shape[0], -1)
+
+def store(dset, files, labels, sites=None, orientations=None, site_names=None):
+    #sets dset.files (PathArray), dset.labels (float32), dset.classes (int16 argmax, -1 for
+    #regression) and the site/orientation columns below
+    dset.files = files if isinstance(files, PathArray) else PathArray(files)
+    dset.labels = label_array(labels)
+    if dset.labels.shape[1] > 1:
+        dset.classes = dset.labels.argmax(1).astype(np.int16)
+    else:
+        dset.classes = np.full(len(dset.labels), -1, dtype=np.int16)
+    describe(dset, dset.files, sites, orientations, site_names)
+
+def describe(dset, files, sites=None, orientations=None, site_names=None):
+    #sets dset.site_codes (int32) with dset.site_names and dset.orientations (int16, -1 when the
+    #name has none). sites are names, or codes into site_names when that is given (rows of a
+    #bigger dataset keep its codes). Anything not given is parsed from the file names
+    if site_names is not None and sites is not None and orientations is not None:
+        dset.site_names = np.asarray(site_names, dtype=str)
+        dset.site_codes = np.asarray(sites).astype(np.int32)
+        dset.orientations = np.asarray(orientations).astype(np.int16)
+        return
+
+    if sites is None or orientations is None:
+        parsed = [manifest.parse_name(path.basename(p)) for p in files]
+        if sites is None:
+            sites = np.array([p[0] for p in parsed], dtype=str)
+        if orientations is None:
+            orientations = np.array([p[1] for p in parsed], dtype=np.int64)
+
+    names, codes = np.unique(np.asarray(sites, dtype=str), return_inverse=True)
+    dset.site_names = names
+    dset.site_codes = codes.astype(np.int32)
+    dset.orientations = np.asarray(orientations).astype(np.int16)
+
+# Items carry their int64 row in the dataset instead of the path, so batches move one small
+# tensor through the worker queue. These turn a batch of ids back into per-sample columns on
+# the main process.
+
+def source(dset):
+    #ids are rows of the dataset under any Subset wrappers
+    while isinstance(dset, Subset):
+        dset = dset.dataset
+    return dset
+
+def _ids(ids):
+    if isinstance(ids, torch.Tensor):
+        ids = ids.cpu().numpy()
+    return np.asarray(ids, dtype=np.int64)
+
+def paths(dset, ids):
+    files = source(dset).files
+    if isinstance(files, PathArray):
+        return files.take(_ids(ids)).tolist()
+    #combined datasets keep (index, path, source) tuples
+    return [f[1] if isinstance(f, tuple) else f for f in (files[i] for i in _ids(ids).tolist())]
+
+def sites(dset, ids):
+    return source(dset).site_codes[_ids(ids)]
+
+def orientations(dset, ids):
+    return source(dset).orientations[_ids(ids)]
@@ -0,0 +1,137 @@
+import os
+import hashlib
+from os import path
+import numpy as np
+import torch
+from dsets import manifest, records
+
+# Train/val/test splits as int64 row indices into a dataset, built once per dataset content and
+# stored with a content hash in a small .npz so training, per-site and evaluation runs all use
+# the same rows. A split is taken per stratum (class, site or both): the first fractions[0] of
+# each stratum's rows (in dataset order) go to train, the next fractions[1] to val, the rest to
+# test. Stratifying by class reproduces the old per-class np.split exactly.
+
+VERSION = 1
+STRATA = (None, 'class', 'site', 'site and class')
+
+class IndexView:
+    #rows `indices` of an already built dataset. The dataset classes accept this in place of a
+    #path or a (files, labels) tuple and take the rows' files, labels, site codes and
+    #orientations without rescanning or parsing names, so every split shares the site codes
+    def __init__(self, dset, indices):
+        self.dset = dset
+        self.indices = np.asarray(indices, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def files(self):
+        files = self.dset.files
+        if isinstance(files, (np.ndarray, records.PathArray)):
+            return files.take(self.indices)
+        return [files[i] for i in self.indices.tolist()]
+
+    def labels(self):
+        labels = self.dset.labels
+        if isinstance(labels, torch.Tensor):
+            return labels[torch.from_numpy(self.indices)]
+        if isinstance(labels, np.ndarray):
+            return labels[self.indices]
+        return [labels[i] for i in self.indices.tolist()]
+
+    def sites(self):
+        #(site codes, site names) of the rows, Nones when the dataset has no site columns
+        codes = getattr(self.dset, 'site_codes', None)
+        if codes is None:
+            return None, None
+        return codes[self.indices], self.dset.site_names
+
+    def orientations(self):
+        orientations = getattr(self.dset, 'orientations', None)
+        return None if orientations is None else orientations[self.indices]
+
+def unpack(dataset_dir):
+    #records.store arguments (files, labels, sites, orientations, site names) of a (files,
+    #labels) tuple or an IndexView. Only an IndexView has the site columns
+    if isinstance(dataset_dir, IndexView):
+        sites, site_names = dataset_dir.sites()
+        return dataset_dir.files(), dataset_dir.labels(), sites, dataset_dir.orientations(), site_names
+    return dataset_dir[0], dataset_dir[1], None, None, None
+
+def strata_codes(dset, stratify):
+    #one int64 stratum per row of dset
+    if stratify is None:
+        return np.zeros(len(dset), dtype=np.int64)
+
+    if 'class' in stratify:
+        classes = getattr(dset, 'classes', None)
+        if classes is not None:
+            classes = classes.astype(np.int64)
+        else:
+            classes = torch.stack([torch.as_tensor(label) for label in dset.labels]).argmax(1).numpy().astype(np.int64)
+        if stratify == 'class':
+            return classes
+
+    site_codes = getattr(dset, 'site_codes', None)
+    if site_codes is not None:
+        site_codes = site_codes.astype(np.int64)
+    else:
+        site_codes = manifest.SiteIndex(dset.files).codes(dset.files)
+    if stratify == 'site':
+        return site_codes
+    return site_codes * (int(classes.max()) + 1) + classes
+
+def build(strata, fractions):
+    #stable grouping keeps each stratum's rows in dataset order
+    order = np.argsort(strata, kind='stable')
+    groups, starts, counts = np.unique(strata[order], return_index=True, return_counts=True)
+
+    train_ends = starts + (fractions[0] * counts).astype(np.int64)
+    val_ends = train_ends + (fractions[1] * counts).astype(np.int64)
+    ends = starts + counts
+
+    def take(begin, end):
+        if len(begin) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate([order[b:e] for b, e in zip(begin.tolist(), end.tolist())]).astype(np.int64)
+
+    return take(starts, train_ends), take(train_ends, val_ends), take(val_ends, ends)
+
+def content_hash(files, strata, fractions, stratify):
+    digest = hashlib.sha1()
+    digest.update(f'{VERSION}|{stratify}|{tuple(float(f) for f in fractions)}|{len(files)}'.encode())
+    records.hash_paths(digest, files)
+    digest.update(np.ascontiguousarray(strata, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+def load_or_build(dset, split_path, fractions, stratify=None):
+    #(train, val, test) index arrays for dset. split_path None never stores the split
+    strata = strata_codes(dset, stratify)
+    digest = content_hash(dset.files, strata, fractions, stratify)
+
+    if split_path is not None and path.isfile(split_path):
+        with np.load(split_path) as stored:
+            if str(stored['hash']) == digest:
+                return stored['train'], stored['val'], stored['test']
+
+    train, val, test = build(strata, fractions)
+
+    if split_path is not None:
+        try:
+            os.makedirs(path.dirname(path.abspath(split_path)), exist_ok=True)
+            tmp_path = split_path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, version=VERSION, hash=digest, stratify=str(stratify), fractions=np.array(fractions, dtype=np.float64),
+                         train=train, val=val, test=test)
+            os.replace(tmp_path, split_path)
+        except OSError as e:
+            print(f'Could not write split to {split_path}: {e}')
+
+    return train, val, test
+
+def split_path(split_dir, dset_name, fractions, stratify):
+    #one file per dataset class and split settings, the hash inside covers the file list
+    if split_dir is None:
+        return None
+    settings = f'{fractions}|{stratify}'
+    return path.join(split_dir, f'{dset_name}_{hashlib.sha1(settings.encode()).hexdigest()[:12]}.npz')
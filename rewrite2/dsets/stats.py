@@ -0,0 +1,107 @@
+import os
+import json
+import hashlib
+from os import path
+import numpy as np
+import torch
+from torch.utils.data import Dataset, DataLoader
+from progress.bar import ChargingBar
+from dsets import decode, records
+
+# Per-element mean and standard deviation of a dataset in one pass. The dataset is cut into
+# shards, every DataLoader worker reduces its shards to (count, mean, M2) with Welford's
+# update, and the partial results are merged with Chan's formula, all in float64. Results
+# are cached on disk under a hash of the file list and the preprocessing settings.
+
+class _Shards(Dataset):
+    #item i is the partial stats of the i-th run of indices
+    def __init__(self, dset, indices, batch_size, fn):
+        self.dset = dset
+        self.indices = indices
+        self.batch_size = batch_size
+        self.fn = fn
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, idx):
+        stats = None
+        shard = self.indices[idx]
+        for start in range(0, len(shard), self.batch_size):
+            batch = shard[start:start + self.batch_size].tolist()
+            if hasattr(self.dset, '__getitems__'):
+                items = self.dset.__getitems__(batch)
+            else:
+                items = [self.dset[i] for i in batch]
+
+            data = decode.to_float(torch.stack([item[0] for item in items]))
+            if self.fn is not None:
+                data = self.fn(data)
+            stats = merge(stats, batch_stats(data))
+        return stats
+
+def batch_stats(data):
+    data = data.double()
+    mean = data.mean(0)
+    return (data.size(0), mean, torch.square(data - mean).sum(0))
+
+def merge(a, b):
+    #Chan et al. pairwise update of (count, mean, M2)
+    if a is None:
+        return b
+    if b is None:
+        return a
+    count_a, mean_a, m2_a = a
+    count_b, mean_b, m2_b = b
+    count = count_a + count_b
+    delta = mean_b - mean_a
+    mean = mean_a + delta * (count_b / count)
+    m2 = m2_a + m2_b + torch.square(delta) * (count_a * count_b / count)
+    return (count, mean, m2)
+
+def mean_std(dset, batch_size=8, num_workers=0, fn=None, shards_per_worker=4):
+    #fn runs on every float batch before it is reduced (e.g. make_streams). Zero std becomes 1
+    shards = max(1, num_workers) * shards_per_worker
+    shards = min(shards, max(1, len(dset) // batch_size))
+    indices = np.array_split(np.arange(len(dset)), shards)
+
+    loader = DataLoader(_Shards(dset, indices, batch_size, fn), batch_size=None, num_workers=num_workers)
+
+    bar = ChargingBar('Mean/std', max=len(loader), width=0)
+    stats = None
+    for partial in loader:
+        stats = merge(stats, partial)
+        bar.next()
+    bar.finish()
+
+    count, mean, m2 = stats
+    std = torch.sqrt(m2 / max(count - 1, 1))
+    std[std == 0.0] = 1.0
+    return mean.float(), std.float()
+
+def cache_key(files, settings):
+    #files in order plus anything that changes the tensors the stats are taken over
+    digest = hashlib.sha1()
+    digest.update(json.dumps(settings, sort_keys=True, default=str).encode())
+    records.hash_paths(digest, files)
+    return digest.hexdigest()[:16]
+
+def load_or_compute(dset, cache_dir, settings, batch_size=8, num_workers=0, fn=None):
+    #cache_dir None always computes
+    if cache_dir is None:
+        return mean_std(dset, batch_size, num_workers, fn)
+
+    cache_path = path.join(cache_dir, f'{cache_key(getattr(dset, "files", ()), settings)}.npz')
+    if path.isfile(cache_path):
+        with np.load(cache_path) as cached:
+            return torch.from_numpy(cached['mean']), torch.from_numpy(cached['std'])
+
+    mean, std = mean_std(dset, batch_size, num_workers, fn)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = cache_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, mean=mean.numpy(), std=std.numpy(), count=len(dset))
+    os.replace(tmp_path, cache_path)
+
+    return mean, std
@@ -0,0 +1,100 @@
+import queue
+import threading
+import multiprocessing as mp
+import numpy as np
+
+# Renders TensorBoard figures in a background process so the training loop never waits on
+# matplotlib. The training side only queues raw arrays (a few KB per confusion matrix); the
+# renderer draws them with seaborn and writes them with its own SummaryWriter into the same
+# log dir, where TensorBoard merges them with the scalars. When the queue is full the figure
+# is dropped instead of blocking.
+
+class FigureLogger:
+    def __init__(self, log_dir, every=1, on_improvement=True, budget=None, font_scale=0.4, max_queue=16):
+        #a figure is rendered on every `every`-th epoch (0 for never) and, with on_improvement,
+        #whenever the caller says the epoch improved. budget caps the figures per epoch
+        self.every = every
+        self.on_improvement = on_improvement
+        self.budget = budget
+        self.counts = {}
+        self.dropped = 0
+
+        #fork, since the training scripts have no __main__ guard for spawn to re-import.
+        #Threads where fork isn't available
+        if 'fork' in mp.get_all_start_methods():
+            context = mp.get_context('fork')
+            self.queue = context.Queue(max_queue)
+            self.worker = context.Process(target=_serve, args=(self.queue, log_dir, font_scale), daemon=True)
+        else:
+            self.queue = queue.Queue(max_queue)
+            self.worker = threading.Thread(target=_serve, args=(self.queue, log_dir, font_scale), daemon=True)
+        self.worker.start()
+
+    def wants(self, epoch, improved=False):
+        #whether a figure for this epoch fits the budget, callers can skip building the data
+        if self.budget is not None and self.counts.get(epoch, 0) >= self.budget:
+            return False
+        if self.on_improvement and improved:
+            return True
+        return self.every > 0 and epoch % self.every == 0
+
+    def heatmap(self, tag, values, epoch, index=None, columns=None, improved=False, **style):
+        #values is a 2D array or tensor. style: annot, fmt, vmin, vmax, cmap, dpi, figsize,
+        #xlabel, ylabel, title
+        if not self.wants(epoch, improved):
+            return False
+
+        if hasattr(values, 'detach'):
+            values = values.detach().cpu().numpy()
+        item = (tag, np.asarray(values), epoch, None if index is None else list(index),
+                None if columns is None else list(columns), style)
+
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+        self.counts[epoch] = self.counts.get(epoch, 0) + 1
+        return True
+
+    def close(self, timeout=None):
+        #waits for the queued figures to be written
+        self.queue.put(None)
+        self.worker.join(timeout)
+        if self.dropped > 0:
+            print(f'{self.dropped} figures were dropped because the renderer fell behind')
+
+def _serve(items, log_dir, font_scale):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    import pandas as pd
+    from torch.utils.tensorboard.writer import SummaryWriter
+
+    sns.set_theme(font_scale=font_scale)
+    writer = SummaryWriter(log_dir, filename_suffix='.figures')
+
+    while True:
+        item = items.get()
+        if item is None:
+            break
+        tag, values, epoch, index, columns, style = item
+
+        try:
+            df = pd.DataFrame(values, index=index, columns=columns)
+            fig = plt.figure(dpi=style.get('dpi', 300), figsize=style.get('figsize'))
+            sns.heatmap(df, annot=style.get('annot', False), fmt=style.get('fmt', '.2g'),
+                        vmin=style.get('vmin'), vmax=style.get('vmax'), cmap=style.get('cmap'))
+            plt.xlabel(style.get('xlabel', ''))
+            plt.ylabel(style.get('ylabel', ''))
+            if 'title' in style:
+                plt.title(style['title'])
+            plt.tight_layout()
+            writer.add_figure(tag, fig, global_step=epoch)
+            plt.close(fig)
+        except Exception as e:
+            print(f'Could not render {tag}: {e}')
+
+    writer.close()
@@ -4,22 +4,44 @@ import torchvision.transforms as tf
 import math
 import random
 
-def get_resize_crop_fn(dim):
-    def resize_crop(image):
+class ResizeCrop:
+    #center crop to the aspect ratio of dim, then resize to dim. Works on [C, H, W] and on
+    #[B, C, H, W] batches of images that share a size
+    def __init__(self, dim):
+        self.dim = dim
+
+    def crop_size(self, height, width):
         #height over width
-        target_ratio = dim[0] / dim[1]
-        ratio = image.size(1) / image.size(2)
-        
+        target_ratio = self.dim[0] / self.dim[1]
+        ratio = height / width
+
         #if the the image is too tall, crop the top and bottom
         #otherwise crop sides
         if ratio > target_ratio:
-            crop = (round(target_ratio*image.size(2)), image.size(2))
+            return (round(target_ratio*width), width)
         else:
-            crop = (image.size(1), round(image.size(1)/target_ratio))
+            return (height, round(height/target_ratio))
+
+    def __call__(self, image):
+        crop = self.crop_size(image.size(-2), image.size(-1))
 
         image = tff.center_crop(image, crop)
-        image = tff.resize(image, dim)
+        image = tff.resize(image, self.dim)
+
+        return image
+
+def get_resize_crop_fn(dim):
+    return ResizeCrop(dim)
+
+class Pipeline:
+    #resize_crop followed by a per image function (model transform, augmentation). Keeping the
+    #two apart lets the datasets run the resize on a whole batch at once
+    def __init__(self, resize_crop, after=None):
+        self.resize_crop = resize_crop
+        self.after = after
 
+    def __call__(self, image):
+        image = self.resize_crop(image)
+        if self.after is not None:
+            image = self.after(image)
         return image
-    
-    return resize_crop
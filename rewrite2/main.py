@@ -22,6 +22,9 @@ from torchvision.utils import save_image
 from torch.utils.tensorboard.writer import SummaryWriter
 import torchvision.transforms as tf
 import image_cropping
+import hashlib
+from augment import BatchAugment
+from figure_logger import FigureLogger
 
 #Import the config.py file where settings for training are
 spec = importlib.util.spec_from_file_location("config", os.path.join(os.getcwd(), 'config.py'))
@@ -47,16 +50,39 @@ num_channels = CONFIG['num channels']
 OptimizerClass = CONFIG['optimizer class']
 optimizer_params = CONFIG['optimizer parameters']
 use_cuda = CONFIG['cuda']
+amp_dtype = CONFIG['autocast dtype']
+compile_mode = CONFIG['compile']
+channels_last = CONFIG['channels last']
 loss_fn = CONFIG['loss function']
 epochs = CONFIG['epochs']
+SchedulerClass = CONFIG['scheduler']
+scheduler_params = CONFIG['scheduler params']
+eval_every = CONFIG['eval every']
+test_every = CONFIG['test every']
 class_names = CONFIG['class names']
 output_fn = CONFIG['output function']
 labels_fn = CONFIG['label function']
 existing_model = CONFIG['existing model']
 test_only = CONFIG['test only']
 buckets = CONFIG['buckets']
+materialize_dir = CONFIG['materialize dir']
+materialize_dtype = CONFIG['materialize dtype']
+stats_cache_dir = CONFIG['stats cache dir']
+on_model_preprocessing = CONFIG['on-model preprocessing'] and hasattr(model_module, 'make_streams')
+uint8_transport = CONFIG['uint8 transport']
+dsets.decode.DECODE_THREADS = CONFIG['decode threads']
+dsets.decode.SCALED_JPEG = CONFIG['scaled jpeg decode']
+batch_augment = augment and CONFIG['batch augment']
+
+#checked here so a metric the task doesn't have fails before any data is loaded
+monitor_metric = CONFIG['monitor'] or 'val loss'
+if monitor_metric.startswith('test') and test_every != 1:
+    print(f"Monitoring '{monitor_metric}' tests on every evaluated epoch instead of every {test_every} ('test every')")
+monitor = tv.Monitor(monitor_metric, CONFIG['patience'], CONFIG['min delta'], tv.CLS_METRICS if num_classes > 1 else tv.REG_METRICS)
 
 writer = SummaryWriter()
+#started before the datasets and CUDA so the renderer forks from a small process
+figures = FigureLogger(writer.get_logdir(), CONFIG['figure every'], CONFIG['figures on improvement'], CONFIG['figure budget'])
 
 with open(os.path.join(os.getcwd(), 'config.py')) as config_file:
     config_string = config_file.read()
@@ -67,108 +93,134 @@ print('Preparing dataset...')
 model_custom_transform = model_module.get_tf_function()
 resize_fn = image_cropping.get_resize_crop_fn(dims)
 
-transformer = lambda x: model_custom_transform(resize_fn(x))
+#model modules whose per-image transform returns the image unchanged say so
+identity_transform = getattr(model_module, 'IDENTITY_TRANSFORM', False)
 
-if augment:
+#with on-model preprocessing the dataset stops after the resize and the model builds the streams
+if on_model_preprocessing:
+    model_custom_transform = lambda x: x
+
+#with the batch transform the dataset also stops after the resize and the train/eval loops run
+#the model module's batched transform on every batch
+batch_transform = None
+if CONFIG['batch transform'] and not on_model_preprocessing and hasattr(model_module, 'get_batch_tf_function'):
+    batch_transform = model_module.get_batch_tf_function()
+    model_custom_transform = lambda x: x
+
+if uint8_transport and not (on_model_preprocessing or batch_transform is not None or identity_transform):
+    print('uint8 transport needs on-model preprocessing, the batch transform or a model without a transform, sending floats instead')
+    uint8_transport = False
+
+transformer = image_cropping.Pipeline(resize_fn, model_custom_transform)
+
+if batch_augment and not on_model_preprocessing and batch_transform is None:
+    print('Batch augmentation needs on-model preprocessing or the batch transform, augmenting per image instead')
+    batch_augment = False
+
+train_augmenter = None
+if batch_augment:
+    #the loader ships plain images and the train loop augments each batch before the model
+    train_augmenter = BatchAugment(0.5, 5, seed=CONFIG['augment seed'])
+    train_transformer = transformer
+elif augment:
     transform_list = [tf.RandomHorizontalFlip(0.5),
                       tf.RandomRotation(5)]
     augmenter = tf.Compose(transform_list)
 
-    train_transformer = lambda x: model_custom_transform(augmenter(resize_fn(x)))
+    train_transformer = image_cropping.Pipeline(resize_fn, lambda x: model_custom_transform(augmenter(x)))
 else:
     train_transformer = transformer
 
 dset = DsetClass(dset_path, transformer, **dset_params)
 
-if num_classes > 1:
-    class_lists = ([[] for _ in range(num_classes)], [[] for _ in range(num_classes)])
-
-    for i in range(len(dset.files)):
-        class_idx = dset.labels[i].argmax()
-        class_lists[0][class_idx].append(dset.files[i])
-        class_lists[1][class_idx].append(np.asarray(dset.labels[i], dtype="object"))
-
-    train_files = []
-    val_files = []
-    test_files = []
-
-    train_labels = []
-    val_labels = []
-    test_labels = []
-
-    for i in range(len(class_lists[0])):
-        train_point = int(splits[0] * len(class_lists[0][i]))
-        val_point = int(splits[1] * len(class_lists[0][i]) + train_point)
-        
-        file_sets = np.split(class_lists[0][i], (train_point, val_point))
-        label_sets = np.split(class_lists[1][i], (train_point, val_point))
-
-        train_files += file_sets[0].tolist()
-        val_files += file_sets[1].tolist()
-        test_files += file_sets[2].tolist()
-
-        train_labels += label_sets[0].tolist()
-        val_labels += label_sets[1].tolist()
-        test_labels += label_sets[2].tolist()
-
-elif num_classes == 1:
-    train_point = int(splits[0] * len(dset))
-    val_point = int(splits[1] * len(dset) + train_point)
-        
-    file_sets = np.split(dset.files, (train_point, val_point))
-    label_sets = np.split(dset.labels, (train_point, val_point))
-
-    train_files = file_sets[0].tolist()
-    val_files = file_sets[1].tolist()
-    test_files = file_sets[2].tolist()
-
-    train_labels = label_sets[0].tolist()
-    val_labels = label_sets[1].tolist()
-    test_labels = label_sets[2].tolist()
-
-train_set = DsetClass((train_files, train_labels), train_transformer)
-val_set = DsetClass((val_files, val_labels), transformer)
-test_set = DsetClass((test_files, test_labels), transformer)
-
-pin_device = 'cuda' if use_cuda else 'cpu'
-train_loader = DataLoader(train_set, subbatch_size, True, num_workers=num_workers, pin_memory=True, pin_memory_device=pin_device)
-val_loader = DataLoader(val_set, subbatch_size, True, num_workers=num_workers, pin_memory=True, pin_memory_device=pin_device)
-test_loader = DataLoader(test_set, subbatch_size, True, num_workers=num_workers, pin_memory=True, pin_memory_device=pin_device)
+#row indices of the three splits, stored in split_dir and reused while the dataset doesn't change
+stratify = CONFIG['stratify'] if CONFIG['stratify'] != 'default' else ('class' if num_classes > 1 else None)
+split_path = dsets.splits.split_path(CONFIG['split dir'], DsetClass.__name__, splits, stratify)
+train_idx, val_idx, test_idx = dsets.splits.load_or_build(dset, split_path, splits, stratify)
+
+train_set = DsetClass(dsets.splits.IndexView(dset, train_idx), train_transformer, uint8=uint8_transport)
+val_set = DsetClass(dsets.splits.IndexView(dset, val_idx), transformer, uint8=uint8_transport)
+test_set = DsetClass(dsets.splits.IndexView(dset, test_idx), transformer, uint8=uint8_transport)
+
+if materialize_dir is not None:
+    print('Materializing preprocessed images...')
+    #everything besides the file list that changes the stored tensors
+    materialize_settings = {
+        'dataset class': DsetClass.__name__,
+        'dataset parameters': dset_params,
+        'model module': model_module.__name__,
+        'dimensions': dims,
+        'on-model preprocessing': on_model_preprocessing,
+        'batch transform': batch_transform is not None,
+        'scaled jpeg decode': CONFIG['scaled jpeg decode']
+    }
+    val_set = dsets.Materialized.load_or_materialize(val_set, os.path.join(materialize_dir, 'val'), materialize_dtype,
+                                                     batch_size=subbatch_size, num_workers=num_workers, raw=uint8_transport,
+                                                     settings=materialize_settings)
+    test_set = dsets.Materialized.load_or_materialize(test_set, os.path.join(materialize_dir, 'test'), materialize_dtype,
+                                                      batch_size=subbatch_size, num_workers=num_workers, raw=uint8_transport,
+                                                      settings=materialize_settings)
+    if not augment:
+        train_set = dsets.Materialized.load_or_materialize(train_set, os.path.join(materialize_dir, 'train'), materialize_dtype,
+                                                           batch_size=subbatch_size, num_workers=num_workers, raw=uint8_transport,
+                                                           settings=materialize_settings)
+
+if CONFIG['batch ring']:
+    #batches are collated in place into reused shared (and with CUDA pinned) buffers
+    train_loader = dsets.collate.RingLoader(train_set, subbatch_size, True, num_workers, pin=use_cuda)
+    val_loader = dsets.collate.RingLoader(val_set, subbatch_size, True, num_workers, pin=use_cuda)
+    test_loader = dsets.collate.RingLoader(test_set, subbatch_size, True, num_workers, pin=use_cuda)
+else:
+    pin_device = 'cuda' if use_cuda else 'cpu'
+    train_loader = DataLoader(train_set, subbatch_size, True, num_workers=num_workers, pin_memory=True, pin_memory_device=pin_device)
+    val_loader = DataLoader(val_set, subbatch_size, True, num_workers=num_workers, pin_memory=True, pin_memory_device=pin_device)
+    test_loader = DataLoader(test_set, subbatch_size, True, num_workers=num_workers, pin_memory=True, pin_memory_device=pin_device)
+
+eval_caches = []
+if CONFIG['eval cache']:
+    #val and test don't change between epochs, after the first pass they're served from memory
+    val_loader, test_loader = [dsets.cache.EvalCache(loader, CONFIG['eval cache dtype'], CONFIG['eval cache budget'], CONFIG['eval cache dir'])
+                               for loader in (val_loader, test_loader)]
+    eval_caches = [val_loader, test_loader]
 
 loaders = (train_loader, val_loader, test_loader)
 
-sample = train_set.__getitem__(0)[0]
+sample = dsets.decode.to_float(train_set.__getitem__(0)[0])
+#what the model is actually called with, sample becomes the stream shape with on-model preprocessing
+input_sample = sample
+if on_model_preprocessing:
+    sample = model_module.make_streams(torch.unsqueeze(sample, 0))[0]
+elif batch_transform is not None:
+    sample = batch_transform(torch.unsqueeze(sample, 0))[0]
+    input_sample = sample
 mean = torch.zeros(sample.size(), dtype=torch.float32)
 std = torch.ones(sample.size(), dtype=torch.float32)
 
+model_kwargs = {'preprocess': True} if on_model_preprocessing else {}
+
 if existing_model is None:
     if normalize:
         print('Calculating mean and standard deviation...')
-
-        variance = torch.zeros(sample.size(), dtype=torch.float32)
-
-        loader = DataLoader(train_set, subbatch_size, num_workers=num_workers)
-
-        bar = ChargingBar()
-        bar.max = len(loader)
-        bar.width = 0
-        spinner = Spinner()
-
-        for data, _, _ in loader:
-            mean += torch.div(torch.sum(data, 0), len(train_set))
-            variance += torch.div(torch.sum(torch.square(data-mean), dim=0), len(train_set)-1)
-
-            bar.next()
-            spinner.next()
-
-        std = torch.sqrt(variance).apply_(lambda x: 1.0 if x == 0.0 else x)
-        std[std==0.0] = 1.0
-
-    model = ModelClass(num_classes, num_channels, mean, std).train()
+        #everything that changes the images the stats are taken over, besides the file list
+        stats_settings = {
+            'dataset class': DsetClass.__name__,
+            'model module': model_module.__name__,
+            'dimensions': dims,
+            'augment': augment,
+            'on-model preprocessing': on_model_preprocessing,
+            'batch transform': batch_transform is not None,
+            'scaled jpeg decode': CONFIG['scaled jpeg decode'],
+            'uint8 transport': uint8_transport,
+            'materialize dtype': materialize_dtype if materialize_dir is not None and not augment else None
+        }
+        mean, std = dsets.stats.load_or_compute(train_set, stats_cache_dir, stats_settings, subbatch_size, num_workers,
+                                                model_module.make_streams if on_model_preprocessing else batch_transform)
+
+    model = ModelClass(num_classes, num_channels, mean, std, **model_kwargs).train()
     model(torch.unsqueeze(sample, 0))
 
 else:
-    model = ModelClass(num_classes, num_channels, mean, std)
+    model = ModelClass(num_classes, num_channels, mean, std, **model_kwargs)
     model(torch.unsqueeze(sample, 0))
     model.load_state_dict(torch.load(existing_model, weights_only=True, map_location=torch.device('cpu')))
     model.train()
@@ -178,15 +230,50 @@ if use_cuda:
 else:
     model.cpu()
 
+if channels_last:
+    models.preprocess.set_memory_format(model, torch.channels_last)
+
 optimizer = OptimizerClass(model.parameters(), **optimizer_params)
+scheduler = SchedulerClass(optimizer, **scheduler_params) if SchedulerClass is not None else None
+
+if compile_mode:
+    #inductor's cache is kept per config so a rerun of the same config skips most of the compiling
+    cache_dir = os.path.join(os.getcwd(), 'compile_cache', hashlib.sha1(config_string.encode()).hexdigest()[:16])
+    os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR', cache_dir)
+    os.environ.setdefault('TORCHINDUCTOR_FX_GRAPH_CACHE', '1')
+
+    print('Compiling model...')
+    batch_sizes = [subbatch_size] + [len(s) % subbatch_size for s in (train_set, val_set, test_set) if len(s) % subbatch_size]
+    #the parity check below runs the eval pass in fp32 as well
+    compile_time = tv.compile_model(model, input_sample, batch_sizes, use_cuda, amp_dtype,
+                                    None if compile_mode is True else compile_mode, fp32_eval=amp_dtype is not None)
+    print(f'Compiled in {compile_time:.1f}s')
+    writer.add_scalar('Time/compile', compile_time)
 
 if test_only:
     epochs = 1
     loaders = (None, loaders[1], loaders[2])
 
-if num_classes > 1:
-    tv.train_cls(loaders, model, optimizer, loss_fn, epochs, use_cuda, subbatch_count, class_names, output_fn, labels_fn, writer)
-elif num_classes == 1:
-    tv.train_reg(loaders, model, optimizer, loss_fn, epochs, use_cuda, subbatch_count, output_fn, labels_fn, writer, buckets=buckets, class_names=class_names)
-else:
-    print('Number of classes must be > 0')
+try:
+    if amp_dtype is not None:
+        print(f'Checking {amp_dtype} autocast against fp32...')
+        parity = tv.autocast_parity(loaders[1], model, loss_fn, use_cuda, output_fn, labels_fn, amp_dtype, transform=batch_transform,
+                                    classification=num_classes > 1, tolerance=CONFIG['autocast tolerance'])
+        print(parity)
+        if not parity['passed']:
+            print(f"{amp_dtype} autocast is off from fp32 by more than the tolerance of {CONFIG['autocast tolerance']}")
+        writer.add_text('autocast parity', str(parity))
+
+    if num_classes > 1:
+        tv.train_cls(loaders, model, optimizer, loss_fn, epochs, use_cuda, subbatch_count, class_names, output_fn, labels_fn, writer, batch_transform, augment=train_augmenter, amp_dtype=amp_dtype, figures=figures,
+                     eval_every=eval_every, test_every=test_every, monitor=monitor, scheduler=scheduler)
+    elif num_classes == 1:
+        tv.train_reg(loaders, model, optimizer, loss_fn, epochs, use_cuda, subbatch_count, output_fn, labels_fn, writer, batch_transform, buckets=buckets, class_names=class_names, augment=train_augmenter, amp_dtype=amp_dtype,
+                     eval_every=eval_every, test_every=test_every, monitor=monitor, scheduler=scheduler)
+    else:
+        print('Number of classes must be > 0')
+finally:
+    #removes the eval caches' spill files even when training fails
+    for cache in eval_caches:
+        cache.close()
+figures.close()
@@ -1,9 +1,11 @@
 import torch
 import torch.nn as nn
+from models.colormap import Colormap
+from models.preprocess import Preprocess, split_streams
 import torchvision.transforms as tf
 import matplotlib
 
-PC_CMAP = matplotlib.colors.LinearSegmentedColormap.from_list('', ['#0000ff', '#00ff00', '#ff0000', '#0000ff'])
+PC_CMAP = Colormap(['#0000ff', '#00ff00', '#ff0000', '#0000ff'])
 
 class Xception(nn.Module):
     def __init__(self, num_channels):
@@ -118,9 +120,15 @@ class VGG(nn.Module):
         return self.model(x)
 
 class Model(nn.Module):
-    def __init__(self, num_classes, num_channels, mean, std):
+    #set_memory_format(model, torch.channels_last) switches this for the inputs
+    memory_format = torch.contiguous_format
+
+    def __init__(self, num_classes, num_channels, mean, std, preprocess=False):
         super(Model, self).__init__()
 
+        #preprocess=True takes plain [B, 3, H, W] images and builds the streams in make_streams
+        self.preprocess = Preprocess(make_streams) if preprocess else nn.Identity()
+
         if mean is None or std is None:
             self.normalize = nn.Identity()
         else:
@@ -132,8 +140,9 @@ class Model(nn.Module):
         self.end = nn.Sequential(nn.Linear(256, 512), nn.Dropout(0.1), nn.Linear(512, num_classes))
     
     def forward(self, x):
+        x = self.preprocess(x)
         x = self.normalize(x)
-        x = x.permute((1, 0, 2, 3, 4))
+        x = split_streams(x, self.memory_format)
         
         orig = self.VGG(x[0])
         pc = self.Xception(x[1])
@@ -143,8 +152,16 @@ def get_tf_function():
     def transform(img):
         img = img.repeat(2, 1, 1, 1)
 
-        img[1] = torch.from_numpy(PC_CMAP(img[1][2])).permute((2,0,1))[:3,:,:]
+        img[1] = PC_CMAP(img[1][2])
         
         return img
     
-    return transform
\ No newline at end of file
+    return transform
+
+def make_streams(x):
+    #batched get_tf_function, [B, 3, H, W] -> [B, 2, 3, H, W]
+    return torch.stack((x, PC_CMAP(x[:, 2])), 1)
+
+def get_batch_tf_function():
+    #get_tf_function for a whole [B, C, H, W] batch, [B, S, C, H, W] out like the dataset batches
+    return make_streams
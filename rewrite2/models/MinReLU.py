@@ -3,6 +3,9 @@ import torch.nn as nn
 import torchvision.transforms as tf
 
 class Model(nn.Module):
+    #set_memory_format(model, torch.channels_last) switches this for the inputs
+    memory_format = torch.contiguous_format
+
     def __init__(self, num_classes, num_channels, mean, std):
         super(Model, self).__init__()
 
@@ -22,11 +25,22 @@ class Model(nn.Module):
     
     def forward(self, x):
         x = self.normalize(x)
+        x = x.contiguous(memory_format=self.memory_format)
         
         return self.model(x)
     
+#get_tf_function returns the image unchanged, main.py relies on this for uint8 transport
+IDENTITY_TRANSFORM = True
+
 def get_tf_function():
     def transform(img):
         return img
     
-    return transform
\ No newline at end of file
+    return transform
+
+def get_batch_tf_function():
+    #get_tf_function for a whole [B, C, H, W] batch
+    def transform(imgs):
+        return imgs
+    
+    return transform
@@ -9,20 +9,25 @@ import numpy as np
 import matplotlib.pyplot as plt
 from math import ceil
 
+def instance_norm(channels):
+    #same as nn.InstanceNorm2d(channels) (no affine, no running stats, same state_dict), but
+    #GroupNorm keeps channels_last inputs channels_last where InstanceNorm2d converts them back
+    return nn.GroupNorm(channels, channels, affine=False)
+
 class ResNet(nn.Module):
     def __init__(self):
         super(ResNet, self).__init__()
 
         model = [nn.ReflectionPad2d(1),
                  nn.Conv2d(256, 256, 3, 1, 0),
-                 nn.InstanceNorm2d(256),
+                 instance_norm(256),
                  nn.ReLU(True)]
         
         model += [nn.Dropout(0.5)]
 
         model += [nn.ReflectionPad2d(1),
                   nn.Conv2d(256, 256, 3, 1, 0),
-                  nn.InstanceNorm2d(256)]
+                  instance_norm(256)]
         
         self.model = nn.Sequential(*model)
 
@@ -30,6 +35,9 @@ class ResNet(nn.Module):
         return x + self.model(x)
 
 class Model(nn.Module):
+    #set_memory_format(model, torch.channels_last) switches this for the inputs
+    memory_format = torch.contiguous_format
+
     def __init__(self, num_classes, num_channels, mean, std):
         super(Model, self).__init__()
         
@@ -40,21 +48,21 @@ class Model(nn.Module):
         
         model = [nn.ReflectionPad2d(3),
                  nn.Conv2d(num_channels, 64, 7),
-                 nn.InstanceNorm2d(64),
+                 instance_norm(64),
                  nn.ReLU(True)]
         
         model += [nn.Conv2d(64, 128, 3, 2, 1),
-                  nn.InstanceNorm2d(128),
+                  instance_norm(128),
                   nn.ReLU(True)]
         
         model += [nn.Conv2d(128, 256, 3, 2, 1),
-                  nn.InstanceNorm2d(256),
+                  instance_norm(256),
                   nn.ReLU(True)]
         
         model += [ResNet(), ResNet(), ResNet(), ResNet(), ResNet(), ResNet()]
 
         model += [nn.Conv2d(256, 256, 4, 2, 1),
-                  nn.InstanceNorm2d(256),
+                  instance_norm(256),
                   nn.ReLU(True)]
         
         kernelSize = ( ceil(img_dim[0]/(2**4)), ceil(img_dim[1]/(2**4)))
@@ -63,11 +71,11 @@ class Model(nn.Module):
         model += [nn.MaxPool2d(kernelSize, stride)]
 
         model += [nn.Conv2d(256, 128, 3, 1, 1),
-                  nn.InstanceNorm2d(128),
+                  instance_norm(128),
                   nn.ReLU(True)]
         
         model += [nn.Conv2d(128, 64, 3, 1, 1),
-                  nn.InstanceNorm2d(64),
+                  instance_norm(64),
                   nn.ReLU(True)]
         
         model += [nn.Flatten(), nn.LazyLinear(num_classes)]
@@ -76,12 +84,23 @@ class Model(nn.Module):
     
     def forward(self, x):
         x = (x - self.mean) / self.std
+        x = x.contiguous(memory_format=self.memory_format)
         
         return self.model(x)
 
 
+#get_tf_function returns the image unchanged, main.py relies on this for uint8 transport
+IDENTITY_TRANSFORM = True
+
 def get_tf_function():
     def transform(img):
         return img
     
-    return transform
\ No newline at end of file
+    return transform
+
+def get_batch_tf_function():
+    #get_tf_function for a whole [B, C, H, W] batch
+    def transform(imgs):
+        return imgs
+    
+    return transform
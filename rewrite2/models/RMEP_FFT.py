@@ -8,6 +8,7 @@ import functools
 import numpy as np
 import matplotlib.pyplot as plt
 from math import ceil
+from models.RMEP import instance_norm
 
 class ResNet(nn.Module):
     def __init__(self):
@@ -15,14 +16,14 @@ class ResNet(nn.Module):
 
         model = [nn.ReflectionPad2d(1),
                  nn.Conv2d(256, 256, 3, 1, 0),
-                 nn.InstanceNorm2d(256),
+                 instance_norm(256),
                  nn.ReLU(True)]
         
         model += [nn.Dropout(0.5)]
 
         model += [nn.ReflectionPad2d(1),
                   nn.Conv2d(256, 256, 3, 1, 0),
-                  nn.InstanceNorm2d(256)]
+                  instance_norm(256)]
         
         self.model = nn.Sequential(*model);
 
@@ -30,6 +31,9 @@ class ResNet(nn.Module):
         return x + self.model(x)
 
 class Model(nn.Module):
+    #set_memory_format(model, torch.channels_last) switches this for the inputs
+    memory_format = torch.contiguous_format
+
     def __init__(self, num_classes, num_channels, mean, std):
         super(Model, self).__init__()
         
@@ -42,21 +46,21 @@ class Model(nn.Module):
         
         model = [nn.ReflectionPad2d(3),
                  nn.Conv2d(num_channels, 64, 7),
-                 nn.InstanceNorm2d(64),
+                 instance_norm(64),
                  nn.ReLU(True)]
         
         model += [nn.Conv2d(64, 128, 3, 2, 1),
-                  nn.InstanceNorm2d(128),
+                  instance_norm(128),
                   nn.ReLU(True)]
         
         model += [nn.Conv2d(128, 256, 3, 2, 1),
-                  nn.InstanceNorm2d(256),
+                  instance_norm(256),
                   nn.ReLU(True)]
         
         model += [ResNet(), ResNet(), ResNet(), ResNet(), ResNet(), ResNet()]
 
         model += [nn.Conv2d(256, 256, 4, 2, 1),
-                  nn.InstanceNorm2d(256),
+                  instance_norm(256),
                   nn.ReLU(True)]
         
         kernelSize = ( ceil(img_dim[0]/(2**4)), ceil(img_dim[1]/(2**4)))
@@ -65,11 +69,11 @@ class Model(nn.Module):
         model += [nn.MaxPool2d(kernelSize, stride)]
 
         model += [nn.Conv2d(256, 128, 3, 1, 1),
-                  nn.InstanceNorm2d(128),
+                  instance_norm(128),
                   nn.ReLU(True)]
         
         model += [nn.Conv2d(128, 64, 3, 1, 1),
-                  nn.InstanceNorm2d(64),
+                  instance_norm(64),
                   nn.ReLU(True)]
         
         model += [nn.Flatten(), nn.LazyLinear(num_classes)]
@@ -78,6 +82,7 @@ class Model(nn.Module):
     
     def forward(self, x):
         x = self.normalize(x)
+        x = x.contiguous(memory_format=self.memory_format)
         
         return self.model(x)
 
@@ -97,4 +102,13 @@ def get_tf_function():
 
         return img
     
-    return transform
\ No newline at end of file
+    return transform
+
+def get_batch_tf_function():
+    #get_tf_function for a whole [B, C, H, W] batch
+    def transform(imgs):
+        complex_fft = fft_of(imgs[:, 2])
+
+        return torch.stack((complex_fft.real, complex_fft.imag, torch.zeros_like(complex_fft.real)), 1)
+    
+    return transform
@@ -1,6 +1,9 @@
 import matplotlib.pyplot
 import torch
 import torch.nn as nn
+from models.colormap import Colormap
+from models.filter_bank import highpass_mask, lowpass_mask, bandpass_mask, pass_filter, highpass
+from models.preprocess import Preprocess, split_streams
 import matplotlib
 import math
 import torchvision.transforms as tf
@@ -8,16 +11,21 @@ import functools
 import numpy as np
 import matplotlib.pyplot as plt
 
-PC_CMAP = matplotlib.colors.LinearSegmentedColormap.from_list('', ['#000000', '#3F003F', '#7E007E',
-                                                                   '#4300BD', '#0300FD', '#003F82',
-                                                                   '#007D05', '#7CBE00', '#FBFE00',
-                                                                   '#FF7F00', '#FF0500'])
-matplotlib.colors.LinearSegmentedColormap
+PC_CMAP = Colormap(['#000000', '#3F003F', '#7E007E',
+                    '#4300BD', '#0300FD', '#003F82',
+                    '#007D05', '#7CBE00', '#FBFE00',
+                    '#FF7F00', '#FF0500'])
 
 class Model(nn.Module):
-    def __init__(self, num_classes, num_channels, mean, std):
+    #set_memory_format(model, torch.channels_last) switches this for the inputs
+    memory_format = torch.contiguous_format
+
+    def __init__(self, num_classes, num_channels, mean, std, preprocess=False):
         super(Model, self).__init__()
  
+        #preprocess=True takes plain [B, 3, H, W] images and builds the streams in make_streams
+        self.preprocess = Preprocess(make_streams) if preprocess else nn.Identity()
+
         self.register_buffer('mean', mean)
         self.register_buffer('std', std)
         
@@ -65,8 +73,9 @@ class Model(nn.Module):
         self.linear = nn.Sequential(*linear)
         
     def forward(self, x):
+        x = self.preprocess(x)
         x = (x - self.mean) / self.std
-        x = x.permute((1, 0, 2, 3, 4))
+        x = split_streams(x, self.memory_format)
         
         fft = self.fft_1(x[2])
         pc = self.pc_1(x[1])
@@ -93,59 +102,11 @@ class Model(nn.Module):
         
         return self.linear(cat)
 
-@functools.cache
-def highpass_mask(mask_radius, dim):
-    mask = torch.ones(dim, dtype=torch.float32)
-    mask_radius = np.multiply(dim, mask_radius)
-    center = ((dim[0]-1)/2, (dim[1]-1)/2)
-    center_tl = np.subtract(np.floor(center), mask_radius).astype(int)
-    center_br = np.add(np.ceil(center), mask_radius).astype(int)
-    
-    for h in range(center_tl[0], center_br[0]):
-        for w in range(center_tl[1], center_br[1]):
-            h_dist = abs(h-center[0]) / mask_radius[0]
-            w_dist = abs(w-center[1]) / mask_radius[1]
-            distance = math.sqrt(h_dist**2 + w_dist**2)
-            distance = min(1.0, distance)
-            # if distance < 1.0:
-            #     mask[h][w] = 0.0
-
-            mask[h][w] = distance**6
-    return mask
-
-@functools.cache
-def bandpass_mask(mask_radii, dim):
-    mask = highpass_mask(mask_radii[0], dim) + lowpass_mask(mask_radii[1], dim)
-    mask = (mask - 1.0) * -1.0
-
-    return mask
-
-@functools.cache
-def lowpass_mask(mask_radius, dim):
-    mask = (highpass_mask(mask_radius, dim) - 1.0) * -1.0
-
-    return mask
-
-def pass_filter(img, mask):
-    orig_dim = (img.size(0), img.size(1))
-    fft = torch.fft.fft2(img)
-    fft = torch.fft.fftshift(fft)
-
-    fft = fft*mask
-    
-    fft = torch.fft.ifftshift(fft)    
-    fft = torch.fft.ifft2(fft, orig_dim)
-    fft = fft.type(torch.float32)
-    
-    fft = torch.clamp(fft, 0.0, 1.0)
-    
-    return fft
-
 def get_tf_function():
     def transform(img):
         img = img.repeat(3, 1, 1, 1)
         
-        img[1] = torch.from_numpy(PC_CMAP(img[1][2])).permute((2,0,1))[:3,:,:]
+        img[1] = PC_CMAP(img[1][2])
         
         pass_points = (0.25, 0.125)
 
@@ -155,7 +116,7 @@ def get_tf_function():
         # img[2][1] = pass_filter(img[2][2], bandpass_mask(pass_points, img[2][2].shape))
         # img[2][1] = (img[2][1] - torch.mean(img[2][1])) / torch.std(img[2][1])
         
-        img[2][2] = pass_filter(img[2][2], highpass_mask(pass_points[0], img[2][2].shape))
+        img[2][2] = highpass(img[2][2], pass_points[0])
         img[2][2] = (img[2][2] - torch.mean(img[2][2])) / torch.std(img[2][2])
 
         # img[2][0] = torch.zeros(img[2][2].shape)
@@ -166,8 +127,22 @@ def get_tf_function():
         # img[2][1] = bandpass_mask(pass_points, img[2][2].shape)
         # img[2][2] = highpass_mask(pass_points[0], img[2][2].shape)
 
-        img[2] = torch.from_numpy(PC_CMAP(img[2][2])).permute((2,0,1))[:3,:,:]
+        img[2] = PC_CMAP(img[2][2])
         
         return img
     
-    return transform
\ No newline at end of file
+    return transform
+
+def make_streams(x):
+    #batched get_tf_function, [B, 3, H, W] -> [B, 3, 3, H, W]
+    blue = x[:, 2]
+    pass_points = (0.25, 0.125)
+
+    high = highpass(blue, pass_points[0])
+    high = (high - torch.mean(high, (-2, -1), keepdim=True)) / torch.std(high, (-2, -1), keepdim=True)
+
+    return torch.stack((x, PC_CMAP(blue), PC_CMAP(high)), 1)
+
+def get_batch_tf_function():
+    #get_tf_function for a whole [B, C, H, W] batch, [B, S, C, H, W] out like the dataset batches
+    return make_streams
@@ -1 +1 @@
-from . import VisNet, VisNetReduced, RMEP, RMEP_FFT, Integrated, ResNet50, MinLinear, MinReLU
\ No newline at end of file
+from . import VisNet, VisNetReduced, RMEP, RMEP_FFT, Integrated, ResNet50, MinLinear, MinReLU, preprocess
\ No newline at end of file
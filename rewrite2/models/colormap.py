@@ -0,0 +1,46 @@
+import numpy as np
+import torch
+from matplotlib.colors import to_rgb
+
+# Torch replacement for matplotlib's LinearSegmentedColormap.from_list(...)(x). The lookup table
+# is built once from the same colour stops and applied with a single gather, so it works on
+# whole batches, on the GPU, and without the numpy float64 round trip.
+
+class Colormap:
+    def __init__(self, colors, N=256):
+        self.N = N
+
+        rgb = np.array([to_rgb(c) for c in colors], dtype=np.float64)
+        stops = np.linspace(0.0, 1.0, len(colors))
+        samples = np.linspace(0.0, 1.0, N)
+        lut = np.stack([np.interp(samples, stops, rgb[:, c]) for c in range(3)])
+
+        #extra last entry is the 'bad' colour matplotlib uses for nan
+        self.lut = torch.from_numpy(np.concatenate((lut, np.zeros((3, 1))), 1))
+        #index for every uint8 value v, matching what the float path does for v/255
+        self.uint8_index = torch.clamp((torch.arange(256, dtype=torch.float32) / 255 * N).long(), 0, N - 1)
+
+        self._tables = {}
+
+    def _table(self, dtype, device):
+        key = (dtype, device)
+        if key not in self._tables:
+            if dtype == torch.uint8:
+                table = torch.round(self.lut * 255).to(torch.uint8)
+            else:
+                table = self.lut.to(dtype)
+            self._tables[key] = (table.to(device), self.uint8_index.to(device))
+        return self._tables[key]
+
+    def __call__(self, x):
+        #[..., H, W] -> [..., 3, H, W], same dtype as x. uint8 input is treated as x/255
+        table, uint8_index = self._table(x.dtype, x.device)
+
+        if x.dtype == torch.uint8:
+            idx = uint8_index[x.long()]
+        else:
+            scaled = x.float() * self.N
+            scaled = torch.where(torch.isnan(scaled), self.N, torch.clamp(scaled, 0, self.N - 1))
+            idx = scaled.long()
+
+        return table[:, idx].movedim(0, -3)
@@ -0,0 +1,35 @@
+import torch
+import torch.nn as nn
+
+# Front end for the multi-stream models. The loader only ships the plain [B, 3, H, W] image
+# batch (uint8 or float in [0, 1]) and the phase congruency / FFT streams are derived here,
+# batched, on whatever device the model is on.
+
+class Preprocess(nn.Module):
+    def __init__(self, stream_fn):
+        super(Preprocess, self).__init__()
+
+        self.stream_fn = stream_fn
+
+    def forward(self, x):
+        #5-D input already has its streams, e.g. materialized or transformed in the dataset
+        if x.dim() == 5:
+            return x.float()
+
+        if x.dtype == torch.uint8:
+            x = x.float() / 255
+
+        with torch.no_grad():
+            return self.stream_fn(x)
+
+def split_streams(x, memory_format=torch.contiguous_format):
+    #[B, S, C, H, W] -> S x [B, C, H, W], each stream laid out in memory_format. Replaces the
+    #x.permute((1, 0, 2, 3, 4)) the models did, whose slices are neither NCHW contiguous nor
+    #channels_last, so every first conv of a stream copied them anyway
+    return [stream.contiguous(memory_format=memory_format) for stream in x.unbind(1)]
+
+def set_memory_format(model, memory_format=torch.channels_last):
+    #converts the conv weights and tells the model which layout to put its inputs in
+    model.to(memory_format=memory_format)
+    model.memory_format = memory_format
+    return model
@@ -0,0 +1,96 @@
+import os
+import json
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Per-sample predictions streamed to Parquet while an evaluation runs, one row per sample with
+# the full softmax as a fixed width float32 column. Rows are buffered into row groups and the
+# file only appears under its final name once it is complete. Read back with
+# read_predictions or pandas.read_parquet.
+
+ROW_GROUP_SIZE = 8192
+
+class PredictionWriter:
+    def __init__(self, file_path, num_classes, class_names=None, site_names=None):
+        self.file_path = file_path
+        self.tmp_path = file_path + '.tmp'
+        self.num_classes = num_classes
+        self.site_names = site_names
+
+        self.schema = pa.schema([
+            ('index', pa.int64()),
+            ('site', pa.int32()),
+            ('label', pa.int16()),
+            ('pred', pa.int16()),
+            ('top', pa.float32()),
+            ('probs', pa.list_(pa.float32(), num_classes)),
+            ('path', pa.string())
+        ], metadata={'class_names': json.dumps(list(class_names) if class_names is not None else None)})
+
+        self.writer = pq.ParquetWriter(self.tmp_path, self.schema, compression='zstd')
+        self.buffer = []
+        self.buffered = 0
+        self.rows = 0
+
+    def write(self, indices, sites, labels, probs, paths):
+        #indices, sites and labels are per sample ints, probs a [B, num_classes] softmax. Tensors
+        #are moved to the CPU here, argmax and top probability are computed from probs
+        probs = _numpy(probs).astype(np.float32, copy=False)
+        preds = probs.argmax(1)
+        columns = {
+            'index': _numpy(indices).astype(np.int64, copy=False),
+            'site': _numpy(sites).astype(np.int32, copy=False),
+            'label': _numpy(labels).astype(np.int16, copy=False),
+            'pred': preds.astype(np.int16),
+            'top': probs[np.arange(len(preds)), preds],
+            'probs': probs,
+            'path': list(paths)
+        }
+        self.buffer.append(columns)
+        self.buffered += len(preds)
+        if self.buffered >= ROW_GROUP_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if self.buffered == 0:
+            return
+        columns = {key: [b[key] for b in self.buffer] for key in self.buffer[0]}
+        probs = np.concatenate(columns['probs']).reshape(-1)
+        arrays = [
+            pa.array(np.concatenate(columns['index'])),
+            pa.array(np.concatenate(columns['site'])),
+            pa.array(np.concatenate(columns['label'])),
+            pa.array(np.concatenate(columns['pred'])),
+            pa.array(np.concatenate(columns['top'])),
+            pa.FixedSizeListArray.from_arrays(pa.array(probs), self.num_classes),
+            pa.array([p for batch in columns['path'] for p in batch], pa.string())
+        ]
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+        self.rows += self.buffered
+        self.buffer = []
+        self.buffered = 0
+
+    def close(self):
+        self._flush()
+        if self.site_names is not None:
+            #sites can be added during the run, so their names go in the footer at the end
+            self.writer.add_key_value_metadata({'site_names': json.dumps(list(self.site_names))})
+        self.writer.close()
+        os.replace(self.tmp_path, self.file_path)
+        return self.rows
+
+def read_predictions(file_path, columns=None):
+    #pandas DataFrame of the rows, with a site_name column when the site names were saved
+    df = pq.read_table(file_path, columns=columns).to_pandas()
+    metadata = pq.read_metadata(file_path).metadata or {}
+    if 'site' in df.columns and b'site_names' in metadata:
+        site_names = json.loads(metadata[b'site_names'])
+        df['site_name'] = np.array(site_names, dtype=object)[df['site'].to_numpy()]
+    return df
+
+def _numpy(values):
+    if hasattr(values, 'detach'):
+        return values.detach().cpu().numpy()
+    return np.asarray(values)
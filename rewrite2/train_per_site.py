@@ -11,7 +11,7 @@ from train_val import train_cls
 from train_val import train_reg
 from models import VisNet
 from dsets.Webcams import Webcams_reg
-from glob import glob
+from dsets import records, splits
 from tqdm import tqdm
 
 from memory_profiler import profile
@@ -22,10 +22,6 @@ def train():
 
 #dataset_path = "D:\\Research\\NewGoodOnlyWebcams"
 dataset_path = "D:\\Research\\VEIA"
-#all_pngs = glob(os.path.join(dataset_path, "**", "*.png"), recursive=True)
-all_jpgs = glob(os.path.join(dataset_path, "**", "*.jpg"), recursive=True)
-#all_sites = sorted(set([os.path.basename(f).split('_')[0] for f in all_pngs]))
-all_sites = sorted(set([os.path.basename(f).split('_')[0] for f in all_jpgs]))
 
 all_results = []
 
@@ -39,20 +35,25 @@ transform = lambda x, augment=False: visnet_tf(resize_fn(x))
 
 results = []
 
-for site in tqdm(all_sites, desc="Training all sites"):
+#load the index once and take every site's rows from the stored site-stratified split, so the
+#per-site runs see the same train/val/test rows on every launch
+fractions = (0.8, 0.1, 0.1)
+full_dset = Webcams_reg(dataset_path, transformer=transform)
+split = splits.load_or_build(full_dset, splits.split_path('splits', 'Webcams_reg', fractions, 'site'), fractions, 'site')
+split_sites = [records.sites(full_dset, idx) for idx in split]
+
+for code, site in enumerate(tqdm(full_dset.site_names.tolist(), desc="Training all sites")):
     print(f"\n=== Training model for {site} ===")
 
     writer = SummaryWriter(log_dir=f"runs/per_site/{site}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
-    dset = Webcams_reg(dataset_path, transformer=transform, site_filter=[site])
 
-    if len(dset) < 10:
-        print(f"[!] Skipping {site}: only {len(dset)} samples.")
+    train, val, test = [Webcams_reg(splits.IndexView(full_dset, idx[sites == code]), transformer=transform)
+                        for idx, sites in zip(split, split_sites)]
+    count = len(train) + len(val) + len(test)
+    if count < 10:
+        print(f"[!] Skipping {site}: only {count} samples.")
         continue
 
-    num_train = int(0.8 * len(dset))
-    num_val = int(0.1 * len(dset))
-    train, val, test = torch.utils.data.random_split(dset, [num_train, num_val, len(dset) - num_train - num_val])
-
     loaders = (
         DataLoader(train, batch_size=8, shuffle=True, num_workers=0),
         DataLoader(val, batch_size=8),
@@ -7,17 +7,26 @@ from torch.utils.tensorboard.writer import SummaryWriter
 import torch.nn.functional as F
 import torcheval.metrics.functional as temf
 from torcheval.metrics.functional import multiclass_confusion_matrix
-import matplotlib.pyplot as plt
-import seaborn as sns
 import pandas as pd
 import json
-from collections import defaultdict
-from sklearn.metrics import classification_report, confusion_matrix
 import os
-
-def train_cls(loaders, model, optimizer, loss_fn, epochs, use_cuda, subbatch_count, class_names, output_fn, labels_fn, writer, transform):
-    sns.set_theme(font_scale=0.4)
-    best_loss = float('inf')
+import shutil
+import time
+from dsets import decode, records
+from figure_logger import FigureLogger
+from predictions import PredictionWriter
+
+def train_cls(loaders, model, optimizer, loss_fn, epochs, use_cuda, subbatch_count, class_names, output_fn, labels_fn, writer, transform, augment=None, amp_dtype=None, figures=None,
+              eval_every=1, test_every=1, monitor=None, scheduler=None):
+    #figures is a FigureLogger, by default one rendering every epoch into the writer's log dir.
+    #See _due for eval_every/test_every. monitor (a Monitor, by default on the val loss) picks
+    #the best checkpoint and stops early
+    own_figures = figures is None
+    if own_figures:
+        figures = FigureLogger(writer.get_logdir())
+    if monitor is None:
+        monitor = Monitor('val loss')
+    test_data = None
 
     for epoch in range(epochs):
         print(f"\nEpoch {epoch+1}")
@@ -32,18 +41,18 @@ def train_cls(loaders, model, optimizer, loss_fn, epochs, use_cuda, subbatch_cou
         for step, (data, labels, _) in enumerate(train_loader):
             if use_cuda:
                 data, labels = data.cuda(), labels.cuda()
+            data = decode.to_float(data)
+            if augment is not None:
+                data = augment(data)
             # Wrap single image type into a 3-type input if needed
             #if data.ndim == 4:
                 #data = data.unsqueeze(1)  # [B, 1, C, H, W]
                 #data = data.repeat(1, 3, 1, 1, 1)  # [B, 3, C, H, W]
                 #data = data.permute(1, 0, 2, 3, 4)  # [3, B, C, H, W]
-            if data.ndim == 4:  # [B, C, H, W]
-            #Apply transform manually to each image
-              batch = []
-              for i in range(data.size(0)):
-                  batch.append(transform(data[i]))  # output: [3, C, H, W]
-                  data = torch.stack(batch, dim=1)  # [3, B, C, H, W]
-            output = model(data)
+            data = _batch_transform(data, transform)
+            with _autocast(use_cuda, amp_dtype):
+                output = model(data)
+            output = output.float()
             if output_fn: output = output_fn(output)
             if labels_fn: labels = labels_fn(labels)
 
@@ -69,104 +78,103 @@ def train_cls(loaders, model, optimizer, loss_fn, epochs, use_cuda, subbatch_cou
         writer.add_scalar('Loss/train', train_loss, epoch+1)
         writer.add_scalar('Acc/train', train_acc, epoch+1)
 
-        cm = multiclass_confusion_matrix(all_outputs, torch.argmax(all_labels, 1), all_labels.size(1), normalize='true')
-        _log_confmat(cm, class_names, writer, f'ConfMat/train', epoch+1)
+        train_cm = multiclass_confusion_matrix(all_outputs, torch.argmax(all_labels, 1), all_labels.size(1), normalize='true')
+
+        final = epoch + 1 == epochs
+        if not _due(epoch, eval_every, final):
+            _step_scheduler(scheduler, None)
+            continue
 
         torch.save(model.state_dict(), os.path.normpath(writer.get_logdir() + '/last.pt'))
 
         # ─── VALIDATION ──────────────────────────────────
         print('Validating...')
-        val_data = valtest_cls(loaders[1], model, loss_fn, use_cuda, output_fn, labels_fn, class_names, writer, epoch+1, stage='val')
+        val_data = valtest_cls(loaders[1], model, loss_fn, use_cuda, output_fn, labels_fn, class_names, writer, epoch+1, stage='val', amp_dtype=amp_dtype,
+                               predictions_path=os.path.normpath(writer.get_logdir() + '/predictions-val.parquet'), transform=transform)
         writer.add_scalar('Loss/val', val_data['loss'], epoch+1)
         writer.add_scalar('Acc/val', val_data['acc'], epoch+1)
+        improved = monitor.update('val', val_data)
+        stages = [('val', val_data)]
 
         # ─── TESTING ─────────────────────────────────────
-        print('Testing...')
-        test_data = valtest_cls(loaders[2], model, loss_fn, use_cuda, output_fn, labels_fn, class_names, writer, epoch+1, stage='test')
-        writer.add_scalar('Loss/test', test_data['loss'], epoch+1)
-        writer.add_scalar('Acc/test', test_data['acc'], epoch+1)
-
-        if test_data['loss'] < best_loss:
-            best_loss = test_data['loss']
-            torch.save(model.state_dict(), os.path.normpath(writer.get_logdir() + '/best-loss.pt'))
-
-            with open(os.path.normpath(writer.get_logdir() + '/confs.csv'), 'w') as f:
-                f.write(test_data['confs'])
-
+        if _due(epoch, test_every, final) or monitor.stage == 'test' or monitor.should_stop:
+            print('Testing...')
+            test_data = valtest_cls(loaders[2], model, loss_fn, use_cuda, output_fn, labels_fn, class_names, writer, epoch+1, stage='test', amp_dtype=amp_dtype,
+                                    predictions_path=os.path.normpath(writer.get_logdir() + '/predictions-test.parquet'), transform=transform)
+            writer.add_scalar('Loss/test', test_data['loss'], epoch+1)
+            writer.add_scalar('Acc/test', test_data['acc'], epoch+1)
+            improved = monitor.update('test', test_data) or improved
+            stages.append(('test', test_data))
+
+        _log_confmat(train_cm, class_names, figures, 'ConfMat/train', epoch+1, improved)
+        for stage, data in stages:
+            _log_site_recall(data['site_confmats'], data['site_names'], class_names, figures, f'PerSite/{stage}_Recall', epoch+1, improved)
+
+        if improved:
+            torch.save(model.state_dict(), os.path.normpath(writer.get_logdir() + f'/best-{monitor.key}.pt'))
+            if stages[-1][0] == 'test':
+                shutil.copyfile(test_data['predictions'], os.path.normpath(writer.get_logdir() + '/best-predictions.parquet'))
+
+        _step_scheduler(scheduler, monitor.value)
+        if monitor.should_stop and not final:
+            print(f"Stopping early, no {monitor.stage} {monitor.key} improvement in {monitor.patience} evaluations")
+            break
+
+    if own_figures:
+        figures.close()
     writer.close()
     return test_data
 
 
 @torch.inference_mode()
-def valtest_cls(loader, model, loss_fn, use_cuda, output_fn, labels_fn, class_names, writer, epoch, stage='test'):
+def valtest_cls(loader, model, loss_fn, use_cuda, output_fn, labels_fn, class_names, writer, epoch, stage='test', amp_dtype=None,
+                predictions_path=None, transform=None):
+    #with predictions_path every sample's softmax is streamed to that Parquet file (see predictions.py)
     model.eval()
-    all_outputs, all_labels, all_paths = [], [], []
+    all_outputs, all_labels, all_sites = [], [], []
     running_loss = 0.0
+    site_names = records.source(loader.dataset).site_names.tolist()
+    predictions = None
+    if predictions_path is not None:
+        predictions = PredictionWriter(predictions_path, len(class_names), class_names, site_names)
 
     bar = ChargingBar(f"{stage.capitalize()}", max=len(loader), width=0)
-    for step, (data, labels, paths) in enumerate(loader):
+    for step, (data, labels, ids) in enumerate(loader):
         if use_cuda:
             data, labels = data.cuda(), labels.cuda()
-        output = model(data)
+        data = decode.to_float(data)
+        data = _batch_transform(data, transform)
+        with _autocast(use_cuda, amp_dtype):
+            output = model(data)
+        output = output.float()
         if output_fn: output = output_fn(output)
         if labels_fn: labels = labels_fn(labels)
 
         loss = loss_fn(output, labels)
         running_loss += loss.item() * labels.size(0) / len(loader.dataset)
 
+        batch_sites = records.sites(loader.dataset, ids)
         all_outputs.append(output.detach().cpu())
         all_labels.append(labels.detach().cpu())
-        all_paths += paths
+        all_sites.append(torch.from_numpy(batch_sites).long())
+        if predictions is not None:
+            predictions.write(ids, batch_sites, torch.argmax(labels, 1), F.softmax(output, dim=1), records.paths(loader.dataset, ids))
         bar.next()
     bar.finish()
 
     all_outputs = torch.cat(all_outputs)
     all_labels = torch.cat(all_labels)
-    sm = F.softmax(all_outputs, dim=1)
+    all_sites = torch.cat(all_sites)
+    if predictions is not None:
+        predictions.close()
 
     loss = running_loss
     acc = temf.multiclass_accuracy(all_outputs, torch.argmax(all_labels, 1)).item()
     confmat = multiclass_confusion_matrix(all_outputs, torch.argmax(all_labels, 1), all_labels.size(1), normalize='true')
 
-    confidences_string = 'predicted,truth,output,top,path\n'
-    site_preds, site_labels = defaultdict(list), defaultdict(list)
-
-    for i in range(sm.size(0)):
-        pred = torch.argmax(sm[i]).item()
-        true = torch.argmax(all_labels[i]).item()
-        path = all_paths[i]
-        confidences_string += f"{pred},{true},\"{sm[i]}\",{sm[i][pred].item()},{path}\n"
-        site_id = path.split('_')[0]
-        site_preds[site_id].append(pred)
-        site_labels[site_id].append(true)
-
     # Per-site evaluation
-    site_metrics = []
-    for site_id in site_preds:
-        preds = site_preds[site_id]
-        trues = site_labels[site_id]
-        report = classification_report(trues, preds, output_dict=True, zero_division=0)
-        cm = confusion_matrix(trues, preds, labels=list(range(len(class_names))))
-        site_metrics.append({
-            'site': site_id,
-            'accuracy': report['accuracy'],
-            'macro_f1': report['macro avg']['f1-score'],
-            'macro_precision': report['macro avg']['precision'],
-            'macro_recall': report['macro avg']['recall'],
-            'confusion_matrix': cm.tolist()
-        })
-
-        df_cm = pd.DataFrame(cm, index=class_names, columns=class_names)
-        import matplotlib.pyplot as plt
-        plt.close('all') 
-        fig = plt.figure(dpi=300)
-        sns.heatmap(df_cm, annot=True, fmt=".2f", vmin=0, vmax=1, cmap="Blues")
-        plt.title(f'{stage.upper()} ConfMat - {site_id}')
-        plt.xlabel('Predicted')
-        plt.ylabel('True')
-        plt.tight_layout()
-        writer.add_figure(f'PerSite/{stage}_ConfMat/{site_id}', fig, global_step=epoch)
-        plt.close(fig)
+    site_confmats = per_site_confmats(all_sites, torch.argmax(all_labels, 1), torch.argmax(all_outputs, 1), len(site_names), len(class_names))
+    site_metrics = per_site_metrics(site_confmats, site_names)
 
     # Save results
     df = pd.DataFrame(site_metrics)
@@ -178,19 +186,70 @@ def valtest_cls(loader, model, loss_fn, use_cuda, output_fn, labels_fn, class_na
         'loss': loss,
         'acc': acc,
         'confmat': confmat,
-        'confs': confidences_string,
-        'site_metrics': site_metrics
+        'predictions': predictions_path,
+        'site_metrics': site_metrics,
+        'site_confmats': site_confmats,
+        'site_names': site_names
     }
 
+def per_site_confmats(sites, trues, preds, num_sites, num_classes):
+    #[sites, true, pred] counts from one scatter_add over the flattened (site, true, pred) index
+    flat = (sites * num_classes + trues) * num_classes + preds
+    counts = torch.zeros(num_sites * num_classes * num_classes, dtype=torch.int64, device=flat.device)
+    counts.scatter_add_(0, flat, torch.ones_like(flat))
+    return counts.view(num_sites, num_classes, num_classes)
+
+def per_site_metrics(site_confmats, site_names):
+    #accuracy and macro precision/recall/F1 per site in closed form from the confusion
+    #matrices. Like classification_report(zero_division=0) the macro average only covers
+    #classes that occur in the site's labels or predictions
+    confmats = site_confmats.double()
+    tp = torch.diagonal(confmats, dim1=1, dim2=2)
+    support = confmats.sum(2)
+    predicted = confmats.sum(1)
+    total = support.sum(1)
+
+    precision = torch.where(predicted > 0, tp / predicted.clamp(min=1), 0.0)
+    recall = torch.where(support > 0, tp / support.clamp(min=1), 0.0)
+    f1 = torch.where(support + predicted > 0, 2 * tp / (support + predicted).clamp(min=1), 0.0)
+
+    present = (support > 0) | (predicted > 0)
+    num_present = present.sum(1).clamp(min=1)
+    def macro(values):
+        return (values * present).sum(1) / num_present
+
+    columns = {
+        'accuracy': (tp.sum(1) / total.clamp(min=1)).tolist(),
+        'macro_f1': macro(f1).tolist(),
+        'macro_precision': macro(precision).tolist(),
+        'macro_recall': macro(recall).tolist()
+    }
+    confmat_lists = site_confmats.tolist()
+
+    site_metrics = []
+    for i, site_id in enumerate(site_names):
+        if total[i] == 0:
+            continue
+        site_metrics.append({
+            'site': site_id,
+            **{key: values[i] for key, values in columns.items()},
+            'confusion_matrix': confmat_lists[i]
+        })
+    return site_metrics
+
 from torcheval.metrics.functional import r2_score, mean_squared_error
 
 def train_reg(loaders, model, optimizer, loss_fn, epochs, use_cuda, subbatch_count,
-              output_fn, labels_fn, writer, transform, buckets=None, class_names=None):
-
-    model.train()
+              output_fn, labels_fn, writer, transform, buckets=None, class_names=None, augment=None, amp_dtype=None,
+              eval_every=1, test_every=1, monitor=None, scheduler=None):
+    #eval_every, test_every, monitor and scheduler work like in train_cls. Returns the last test results
+    if monitor is None:
+        monitor = Monitor('val loss')
+    test_data = None
 
     for epoch in range(epochs):
         print(f"\nEpoch {epoch+1}")
+        model.train()
         running_loss = 0.0
         all_preds = []
         all_targets = []
@@ -200,10 +259,14 @@ def train_reg(loaders, model, optimizer, loss_fn, epochs, use_cuda, subbatch_cou
         for step, (data, labels, _) in enumerate(train_loader):
             if use_cuda:
                 data, labels = data.cuda(), labels.cuda()
-            if data.ndim == 4:  # [B, C, H, W]
-                data = torch.stack([transform(data[i]) for i in range(data.size(0))], dim=1)  # [3, B, C, H, W]
-
-            preds = model(data).squeeze()
+            data = decode.to_float(data)
+            if augment is not None:
+                data = augment(data)
+            data = _batch_transform(data, transform)
+
+            with _autocast(use_cuda, amp_dtype):
+                preds = model(data)
+            preds = preds.float().squeeze()
             targets = labels.squeeze()
             loss = loss_fn(preds, targets)
 
@@ -232,19 +295,259 @@ def train_reg(loaders, model, optimizer, loss_fn, epochs, use_cuda, subbatch_cou
         writer.add_scalar('R2/train', epoch_r2, epoch+1)
         writer.add_scalar('MSE/train', epoch_mse, epoch+1)
 
-    return {'r2': epoch_r2, 'mse': epoch_mse}
+        final = epoch + 1 == epochs
+        if not _due(epoch, eval_every, final):
+            _step_scheduler(scheduler, None)
+            continue
 
+        torch.save(model.state_dict(), os.path.normpath(writer.get_logdir() + '/last.pt'))
+
+        stages = [('val', loaders[1])]
+        if _due(epoch, test_every, final) or monitor.stage == 'test':
+            stages.append(('test', loaders[2]))
+
+        improved = False
+        for stage, loader in stages:
+            data = valtest_reg(loader, model, loss_fn, use_cuda, stage, amp_dtype, transform)
+            print(f"{stage.capitalize()} Epoch {epoch+1} | Loss: {data['loss']:.4f} | R²: {data['r2']:.4f} | MSE: {data['mse']:.4f}")
+            writer.add_scalar(f'Loss/{stage}', data['loss'], epoch+1)
+            writer.add_scalar(f'R2/{stage}', data['r2'], epoch+1)
+            writer.add_scalar(f'MSE/{stage}', data['mse'], epoch+1)
+            improved = monitor.update(stage, data) or improved
+            if stage == 'test':
+                test_data = data
+
+        if monitor.should_stop and stages[-1][0] != 'test':
+            test_data = valtest_reg(loaders[2], model, loss_fn, use_cuda, 'test', amp_dtype, transform)
+            writer.add_scalar('Loss/test', test_data['loss'], epoch+1)
+            writer.add_scalar('R2/test', test_data['r2'], epoch+1)
+            writer.add_scalar('MSE/test', test_data['mse'], epoch+1)
+
+        if improved:
+            torch.save(model.state_dict(), os.path.normpath(writer.get_logdir() + f'/best-{monitor.key}.pt'))
+
+        _step_scheduler(scheduler, monitor.value)
+        if monitor.should_stop and not final:
+            print(f"Stopping early, no {monitor.stage} {monitor.key} improvement in {monitor.patience} evaluations")
+            break
 
+    return test_data
 
-def _log_confmat(confmat, class_names, writer, tag, epoch):
-    df_cm = pd.DataFrame(confmat, index=class_names, columns=class_names)
-    import matplotlib.pyplot as plt
-    plt.close('all') 
-    fig = plt.figure(dpi=300)
-    sns.heatmap(df_cm, annot=True, fmt=".2f", vmin=0.0, vmax=1.0, cmap="Blues")
-    plt.xlabel("Predicted")
-    plt.ylabel("True")
-    plt.title(tag)
-    plt.tight_layout()
-    writer.add_figure(tag, fig, global_step=epoch)
-    plt.close(fig)
\ No newline at end of file
+@torch.inference_mode()
+def valtest_reg(loader, model, loss_fn, use_cuda, stage='test', amp_dtype=None, transform=None):
+    model.eval()
+    running_loss = 0.0
+    all_preds, all_targets = [], []
+
+    bar = ChargingBar(f"{stage.capitalize()}", max=len(loader), width=0)
+    for data, labels, _ in loader:
+        if use_cuda:
+            data, labels = data.cuda(), labels.cuda()
+        data = decode.to_float(data)
+        data = _batch_transform(data, transform)
+        with _autocast(use_cuda, amp_dtype):
+            preds = model(data)
+        preds = preds.float().squeeze()
+        targets = labels.squeeze()
+
+        running_loss += loss_fn(preds, targets).item() * targets.numel()
+        all_preds.append(preds.cpu().view(-1))
+        all_targets.append(targets.cpu().view(-1))
+        bar.next()
+    bar.finish()
+
+    preds = torch.cat(all_preds)
+    targets = torch.cat(all_targets)
+
+    return {
+        'loss': running_loss / len(loader.dataset),
+        'r2': r2_score(preds, targets).item(),
+        'mse': mean_squared_error(preds, targets).item(),
+        'mae': (preds - targets).abs().mean().item()
+    }
+
+#the scalar metrics valtest_cls and valtest_reg return, the ones a Monitor can track
+CLS_METRICS = ('loss', 'acc')
+REG_METRICS = ('loss', 'r2', 'mse', 'mae')
+
+class Monitor:
+    #tracks one metric of the val or test evaluations, e.g. 'val loss' or 'test acc'. Losses and
+    #errors are minimized, accuracy and R² maximized. With patience, should_stop is set after
+    #that many evaluations without an improvement of more than min_delta. metrics (CLS_METRICS or
+    #REG_METRICS) checks the metric name up front instead of failing after the first epoch
+    def __init__(self, metric='val loss', patience=None, min_delta=0.0, metrics=None):
+        self.stage, _, self.key = metric.partition(' ')
+        if self.stage not in ('val', 'test'):
+            raise ValueError(f"Monitored metric '{metric}' has to start with 'val' or 'test'")
+        if metrics is not None and self.key not in metrics:
+            raise ValueError(f"Can't monitor '{metric}', the metrics for this task are {', '.join(metrics)}")
+        self.maximize = self.key in ('acc', 'r2')
+        self.patience = patience
+        self.min_delta = min_delta
+
+        self.best = None
+        self.value = None
+        self.bad_evals = 0
+        self.should_stop = False
+
+    def update(self, stage, data):
+        #returns whether this evaluation is the best so far
+        if stage != self.stage:
+            return False
+        self.value = data[self.key]
+
+        if self.best is None or (self.value > self.best + self.min_delta if self.maximize else self.value < self.best - self.min_delta):
+            self.best = self.value
+            self.bad_evals = 0
+            return True
+
+        self.bad_evals += 1
+        if self.patience is not None and self.bad_evals >= self.patience:
+            self.should_stop = True
+        return False
+
+def _due(epoch, every, final):
+    #every N epochs and after the last one. every=0 only after the last epoch
+    return final or (every > 0 and (epoch + 1) % every == 0)
+
+def _step_scheduler(scheduler, value):
+    #once per epoch. ReduceLROnPlateau only steps on epochs with a monitored value
+    if scheduler is None:
+        return
+    if isinstance(scheduler, torch.optim.lr_scheduler.ReduceLROnPlateau):
+        if value is not None:
+            scheduler.step(value)
+    else:
+        scheduler.step()
+
+def _autocast(use_cuda, amp_dtype):
+    #amp_dtype None runs in fp32. Weights and optimizer state stay fp32 either way, only the
+    #forward runs in amp_dtype, and the outputs are cast back to fp32 for the loss and metrics
+    return torch.autocast('cuda' if use_cuda else 'cpu', dtype=amp_dtype, enabled=amp_dtype is not None)
+
+@torch.inference_mode()
+def autocast_parity(loader, model, loss_fn, use_cuda, output_fn, labels_fn, amp_dtype, batches=4, transform=None,
+                    classification=True, tolerance=0.01):
+    #loss and accuracy (classification) or R² and MAE (regression) over the first few batches in
+    #fp32 and in amp_dtype, with dropout off, to check the reduced precision run against the
+    #fp32 one before training with it. 'passed' is whether accuracy and R² moved by at most
+    #tolerance and the MAE by at most tolerance times the fp32 MAE
+    was_training = model.training
+    model.eval()
+
+    losses = {None: 0.0, amp_dtype: 0.0}
+    all_outputs = {None: [], amp_dtype: []}
+    all_labels = []
+    max_diff = 0.0
+    count = 0
+    for step, batch in enumerate(loader):
+        if step == batches:
+            break
+        data, labels = batch[0], batch[1]
+        n = len(labels)
+        if use_cuda:
+            data, labels = data.cuda(), labels.cuda()
+        data = decode.to_float(data)
+        data = _batch_transform(data, transform)
+        if labels_fn: labels = labels_fn(labels)
+        if not classification:
+            labels = labels.squeeze()
+
+        outputs = {}
+        for dtype in losses:
+            with _autocast(use_cuda, dtype):
+                output = model(data)
+            output = output.float()
+            if output_fn: output = output_fn(output)
+            if not classification:
+                output = output.squeeze()
+            outputs[dtype] = output
+            all_outputs[dtype].append(output.detach().cpu().view(n, -1))
+            losses[dtype] += loss_fn(output, labels).item() * n
+
+        max_diff = max(max_diff, (outputs[None] - outputs[amp_dtype]).abs().max().item())
+        all_labels.append(labels.cpu().view(n, -1))
+        count += n
+
+    model.train(was_training)
+
+    result = {'fp32 loss': losses[None] / count, 'amp loss': losses[amp_dtype] / count, 'max output diff': max_diff}
+    labels = torch.cat(all_labels)
+    for dtype, name in ((None, 'fp32'), (amp_dtype, 'amp')):
+        outputs = torch.cat(all_outputs[dtype])
+        if classification:
+            result[f'{name} acc'] = temf.multiclass_accuracy(outputs, torch.argmax(labels, 1)).item()
+        else:
+            preds, targets = outputs.view(-1), labels.view(-1)
+            result[f'{name} r2'] = r2_score(preds, targets).item()
+            result[f'{name} mae'] = (preds - targets).abs().mean().item()
+
+    if classification:
+        result['passed'] = abs(result['amp acc'] - result['fp32 acc']) <= tolerance
+    else:
+        result['passed'] = (abs(result['amp r2'] - result['fp32 r2']) <= tolerance
+                            and abs(result['amp mae'] - result['fp32 mae']) <= tolerance * result['fp32 mae'])
+    return result
+
+def _batch_transform(data, transform):
+    #the model module's batched transform, for loaders that ship resized [B, C, H, W] images
+    if transform is not None and data.ndim == 4:
+        return transform(data)  # [B, S, C, H, W]
+    return data
+
+def compile_model(model, sample, batch_sizes, use_cuda, amp_dtype=None, mode=None, fp32_eval=False):
+    #compiles model in place (state_dict keys don't change) and runs it once for every batch
+    #size the loaders produce, in train and eval mode, so the full and the ragged last batch
+    #are compiled here instead of during the first epoch. fp32_eval also compiles the eval pass
+    #without autocast, the reference autocast_parity runs. Lazy layers have to be initialized
+    #before this. Returns the time spent compiling
+    model.compile(mode=mode, dynamic=False)
+    was_training = model.training
+    #the train mode passes would move BatchNorm running stats towards the repeated sample
+    buffers = {name: buffer.clone() for name, buffer in model.named_buffers()}
+
+    start = time.time()
+    for size in sorted(set(batch_sizes)):
+        data = sample.unsqueeze(0).repeat(size, *([1] * sample.dim()))
+        if use_cuda:
+            data = data.cuda()
+
+        model.train()
+        with _autocast(use_cuda, amp_dtype):
+            output = model(data)
+        output.float().sum().backward()
+
+        model.eval()
+        with torch.inference_mode():
+            #the eval loops' batches are made under inference_mode, which the compiled graph
+            #guards on, so the warm-up input has to be too
+            eval_data = data.clone()
+            with _autocast(use_cuda, amp_dtype):
+                model(eval_data)
+            if fp32_eval and amp_dtype is not None:
+                model(eval_data)
+
+    model.zero_grad(set_to_none=True)
+    with torch.no_grad():
+        for name, buffer in model.named_buffers():
+            buffer.copy_(buffers[name])
+    model.train(was_training)
+
+    return time.time() - start
+
+def _log_site_recall(site_confmats, site_names, class_names, figures, tag, epoch, improved=False):
+    #one sites x classes heatmap of per-class recall instead of a confusion matrix figure per site
+    if not figures.wants(epoch, improved):
+        return
+    support = site_confmats.sum(2)
+    recall = torch.diagonal(site_confmats, dim1=1, dim2=2) / support.clamp(min=1)
+    recall = torch.where(support > 0, recall, float('nan'))
+    keep = support.sum(1) > 0
+    names = [name for name, k in zip(site_names, keep.tolist()) if k]
+
+    figures.heatmap(tag, recall[keep], epoch, names, class_names, improved, vmin=0.0, vmax=1.0, cmap="Blues", dpi=150,
+                    figsize=(max(4, 0.5 * len(class_names)), max(3, 0.2 * len(names))), xlabel="Class", ylabel="Site", title=tag)
+
+def _log_confmat(confmat, class_names, figures, tag, epoch, improved=False):
+    figures.heatmap(tag, confmat, epoch, class_names, class_names, improved, annot=True, fmt=".2f", vmin=0.0, vmax=1.0,
+                    cmap="Blues", dpi=300, xlabel="Predicted", ylabel="True", title=tag)